@@ -57,13 +57,71 @@ based on the data obtained from CloudStack API:
 }
 
 
-usage: cloudstack-routers.py [--list] [--host HOST]
+The routers of projects and accounts are fetched at once, page by page, and
+can be cached, see the [inventory] section in 'cloudstack.ini':
+
+  [inventory]
+  # Seconds the fetched routers are used again, also by --host, 0 disables
+  # the cache
+  cache_max_age = 300
+  cache_path = ~/.ansible/tmp
+  page_size = 500
+  page_workers = 4
+  # Connections kept alive to the API and retries of failed connections
+  pool_size = 10
+  retries = 0
+
+
+The inventory can also be kept by a daemon started with --daemon. It refreshes
+the inventory every daemon_interval seconds (default 60) and answers --list and
+--host of later runs over a UNIX socket in cache_path, routers created since
+the last refresh are unknown to --host until the next. See the [inventory]
+section in 'cloudstack.ini':
+
+  [inventory]
+  cache_path = ~/.ansible/tmp
+  daemon_interval = 60
+
+
+The JSON output is indented by default. --output compact leaves out all
+whitespace, --output stream also writes the inventory piece by piece. --fields
+limits the hostvars written, e.g. --fields zone,ansible_ssh_host, or leaves
+some out, e.g. --fields=-nic. Both can be set by output and fields in the
+[inventory] section.
+
+
+usage: cloudstack-routers.py [--list] [--host HOST] [--daemon] [--refresh-cache]
+                             [--output {indent,compact,stream}] [--fields FIELDS]
 """
 
 from __future__ import print_function
+import errno
+import fcntl
+import hashlib
 import os
+import re
+import signal
+import socket
 import sys
 import argparse
+import tempfile
+import threading
+import time
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import ConfigParser
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    from socketserver import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
 
 try:
     import json
@@ -71,11 +129,233 @@ except:
     import simplejson as json
 
 
-try:
-    from cs import CloudStack, CloudStackException, read_config
-except ImportError:
-    print("Error: CloudStack library must be installed: pip install cs.", file=sys.stderr)
-    sys.exit(1)
+# The API rejects pages larger than its default.page.size, telling the limit
+PAGE_SIZE_LIMIT_RE = re.compile(r'max allowed page size value: (\d+)')
+
+# Routers of projects and of accounts
+ROUTER_SCOPES = [
+    {'projectid': -1, 'listall': True},
+    {'listall': True},
+]
+
+
+def import_cs():
+    """Import the CloudStack library, not needed by runs answered by a daemon."""
+    global CloudStack, CloudStackException, read_config, requests, HTTPAdapter
+    try:
+        from cs import CloudStack, CloudStackException, read_config
+    except ImportError:
+        print("Error: CloudStack library must be installed: pip install cs.", file=sys.stderr)
+        sys.exit(1)
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+
+def cs_session(pool_size=10, retries=0):
+    """Return a HTTP session keeping connections to the API alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Some versions of the cs library close the session after each request
+    session.close = lambda: None
+    return session
+
+
+def cs_client(session, **config):
+    """Return a CloudStack client sending its requests through session."""
+    try:
+        return CloudStack(session=session, **config)
+    except TypeError:
+        pass
+
+    # cs library without session support uses the requests module directly,
+    # it is replaced by a stand-in sending through the session of the client
+    cs = CloudStack(**config)
+    request = cs._request
+
+    def _request(*args, **kwargs):
+        module = sys.modules[CloudStack.__module__]
+        if not isinstance(module.requests, CloudStackRequests):
+            module.requests = CloudStackRequests()
+        local = module.requests.local
+        previous = getattr(local, 'session', None)
+        local.session = session
+        try:
+            return request(*args, **kwargs)
+        finally:
+            local.session = previous
+    cs._request = _request
+    return cs
+
+
+class CloudStackRequests(object):
+    """Stand-in for the requests module in the cs library, sending the
+    requests of a client through the session of that client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+    def Session(self):
+        return getattr(self.local, 'session', None) or requests.Session()
+
+
+    def get(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).get(*args, **kwargs)
+
+
+    def post(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).post(*args, **kwargs)
+
+
+def read_ini():
+    """Return the cloudstack.ini files read by cs."""
+    paths = [
+        os.path.join(os.path.expanduser('~'), '.cloudstack.ini'),
+        os.path.join(os.getcwd(), 'cloudstack.ini'),
+    ]
+    if 'CLOUDSTACK_CONFIG' in os.environ:
+        paths.append(os.path.expanduser(os.environ['CLOUDSTACK_CONFIG']))
+
+    conf = ConfigParser()
+    conf.read(paths)
+    return conf
+
+
+def read_inventory_config():
+    """Return the [inventory] section of the cloudstack.ini files read by cs."""
+    conf = read_ini()
+    if not conf.has_section('inventory'):
+        return {}
+    return dict(conf.items('inventory'))
+
+
+def read_endpoint():
+    """Return the API endpoint configured by the environment or cloudstack.ini,
+    as far as known without the CloudStack library."""
+    if 'CLOUDSTACK_ENDPOINT' in os.environ:
+        return os.environ['CLOUDSTACK_ENDPOINT']
+    conf = read_ini()
+    region = os.environ.get('CLOUDSTACK_REGION', 'cloudstack')
+    if conf.has_option(region, 'endpoint'):
+        return conf.get(region, 'endpoint')
+    return None
+
+
+def query_daemon(socket_file, request):
+    """Return the response of the inventory daemon listening on socket_file,
+    None if there is none."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    chunks = []
+    try:
+        client.connect(socket_file)
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.error:
+        return None
+    finally:
+        client.close()
+    if not chunks:
+        return None
+    return b''.join(chunks).decode('utf-8')
+
+
+class InventoryRequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.inventory.handle_request(request)
+        except Exception as e:
+            print("Warning: Could not handle request: %s" % e, file=sys.stderr)
+            return
+        self.wfile.write(response.encode('utf-8'))
+
+
+class InventoryServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_file, inventory):
+        UnixStreamServer.__init__(self, socket_file, InventoryRequestHandler)
+        self.inventory = inventory
+
+
+def select_fields(host_vars, fields):
+    """Return host_vars limited to fields, without those prefixed by '-'."""
+    if not fields:
+        return host_vars
+    included = [field for field in fields if not field.startswith('-')]
+    excluded = [field[1:] for field in fields if field.startswith('-')]
+    return dict((key, value) for key, value in host_vars.items()
+                if (not included or key in included) and key not in excluded)
+
+
+def dump_json(data, output):
+    """Return data as JSON, indented unless output is compact or stream."""
+    if output in ('compact', 'stream'):
+        return json.dumps(data, separators=(',', ':'))
+    return json.dumps(data, indent=2)
+
+
+def write_inventory(out, hosts, groups, fields=None):
+    """Write an inventory as compact JSON to out piece by piece, the hostvars
+    as hosts yields (name, hostvars) and then groups, which may be filled
+    meanwhile."""
+    out.write('{"_meta":{"hostvars":{')
+    for i, (host_name, host_vars) in enumerate(hosts):
+        if i:
+            out.write(',')
+        out.write('%s:%s' % (json.dumps(host_name), dump_json(select_fields(host_vars, fields), 'compact')))
+    out.write('}}')
+    for group_name, group in groups.items():
+        if group_name != '_meta':
+            out.write(',%s:%s' % (json.dumps(group_name), dump_json(group, 'compact')))
+    out.write('}\n')
+
+
+def run_concurrently(func, items, workers):
+    """Return the results of func for each of items, called by up to workers
+    threads. The first exception raised by func is raised again."""
+    items = list(items)
+    results = {}
+    errors = []
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[i] = func(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = []
+    for i in range(max(min(workers, len(items)), 1)):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return [results[i] for i in range(len(items))]
 
 
 class CloudStackInventory(object):
@@ -84,23 +364,248 @@ class CloudStackInventory(object):
         parser = argparse.ArgumentParser()
         parser.add_argument('--host')
         parser.add_argument('--list', action='store_true')
+        parser.add_argument('--daemon', action='store_true',
+                            help='serve the inventory on a UNIX socket')
+        parser.add_argument('--refresh-cache', action='store_true',
+                            help='fetch the cached routers again')
+        parser.add_argument('--output', choices=['indent', 'compact', 'stream'],
+                            help='JSON output format, default indent')
+        parser.add_argument('--fields',
+                            help='comma separated hostvars to output, or -<name> to leave out')
 
         options = parser.parse_args()
+
+        inventory_config = read_inventory_config()
+        self.cache_max_age = int(inventory_config.get('cache_max_age', 0))
+        self.cache_path = os.path.expanduser(inventory_config.get('cache_path', '~/.ansible/tmp'))
+        self.page_size = int(inventory_config.get('page_size', 500))
+        self.page_workers = int(inventory_config.get('page_workers', 1))
+        # Lowered page sizes by endpoint of the API
+        self.page_size_limits = {}
+        self.pool_size = int(inventory_config.get('pool_size', 10))
+        self.retries = int(inventory_config.get('retries', 0))
+        self.daemon_interval = int(inventory_config.get('daemon_interval', 60))
+        self.output = options.output or inventory_config.get('output', 'indent')
+        fields = options.fields or inventory_config.get('fields', '')
+        self.fields = [field.strip() for field in fields.split(',') if field.strip()]
+        self.refresh = options.refresh_cache
+
+        # A running daemon answers without the CloudStack library
+        response = None
+        request = {'output': self.output, 'fields': self.fields}
+        if options.host and not options.daemon:
+            response = query_daemon(self.get_socket_file(), dict(request, host=options.host))
+        elif options.list and not options.daemon and not options.refresh_cache:
+            response = query_daemon(self.get_socket_file(), dict(request, list=True))
+        if response is not None:
+            print(response)
+            return
+
+        import_cs()
         try:
-            self.cs = CloudStack(**read_config())
+            self.cs = cs_client(cs_session(self.pool_size, self.retries), **read_config())
         except CloudStackException as e:
             print("Error: Could not connect to CloudStack API", file=sys.stderr)
 
-        if options.host:
+        if options.daemon:
+            self.serve()
+
+        elif options.host:
             data = self.get_host(options.host)
-            print(json.dumps(data, indent=2))
+            print(dump_json(select_fields(data, self.fields), self.output))
 
         elif options.list:
-            data = self.get_list()
-            print(json.dumps(data, indent=2))
+            if self.output == 'stream':
+                # Written while the routers are fetched or read
+                data = {
+                    'all': {
+                        'hosts': [],
+                        },
+                    '_meta': {
+                        'hostvars': {},
+                        },
+                    }
+                write_inventory(sys.stdout, self.iter_hosts(data), data, self.fields)
+            else:
+                data = self.get_list()
+                print(self.dump_list(data, self.output, self.fields))
         else:
-            print("usage: --list | --host <hostname>", file=sys.stderr)
+            print("usage: --list | --host <hostname> | --daemon [--refresh-cache] [--output <format>] "
+                  "[--fields <fields>]", file=sys.stderr)
+            sys.exit(1)
+
+
+    def dump_list(self, data, output, fields):
+        if fields:
+            hostvars = data['_meta']['hostvars']
+            data = dict(data, _meta={
+                'hostvars': dict((host_name, select_fields(host_vars, fields)) for host_name, host_vars in hostvars.items()),
+                })
+        return dump_json(data, output)
+
+
+    def serve(self):
+        """Serve the inventory on a UNIX socket until terminated, refreshed
+        every daemon_interval seconds in the background."""
+        socket_file = self.get_socket_file()
+        if query_daemon(socket_file, {'list': True}) is not None:
+            print("Error: Inventory daemon already listening on %s." % socket_file, file=sys.stderr)
             sys.exit(1)
+        if os.path.exists(socket_file):
+            os.unlink(socket_file)
+
+        self.refresh_daemon()
+        thread = threading.Thread(target=self.run_refresh)
+        thread.daemon = True
+        thread.start()
+
+        # Run the finally clause when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        # Only accessible by the user from the start
+        umask = os.umask(0o077)
+        try:
+            server = InventoryServer(socket_file, self)
+        finally:
+            os.umask(umask)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.unlink(socket_file)
+
+
+    def run_refresh(self):
+        while True:
+            time.sleep(self.daemon_interval)
+            try:
+                self.refresh_daemon()
+            except Exception as e:
+                print("Warning: Could not refresh inventory: %s" % e, file=sys.stderr)
+
+
+    def refresh_daemon(self):
+        data = self.get_list()
+        # Swapped at once, requests are served from either version
+        self.daemon_data = (data, self.dump_list(data, self.output, self.fields))
+
+
+    def handle_request(self, request):
+        data, response = self.daemon_data
+        output = request.get('output', self.output)
+        fields = request.get('fields', self.fields)
+        if 'host' in request:
+            # Hosts created since the last refresh are known after the next,
+            # a lookup for each unknown host would slow down the daemon and the API
+            hostvars = data['_meta']['hostvars'].get(request['host'], {})
+            return dump_json(select_fields(hostvars, fields), output)
+        if output != self.output or fields != self.fields:
+            response = self.dump_list(data, output, fields)
+        return response
+
+
+    def get_cache_file(self):
+        return self.get_runtime_file('ansible-cloudstack-routers-%s.json')
+
+
+    def get_socket_file(self):
+        return self.get_runtime_file('ansible-cloudstack-routers-%s.sock')
+
+
+    def get_runtime_file(self, name):
+        """Return the path of a file in cache_path named by the API."""
+        if not os.path.isdir(self.cache_path):
+            try:
+                os.makedirs(self.cache_path)
+            except OSError as e:
+                # Created by a concurrent run meanwhile
+                if e.errno != errno.EEXIST:
+                    raise
+        key = json.dumps([read_endpoint()])
+        return os.path.join(self.cache_path, name % hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+    def get_routers(self):
+        """Return the routers, from the cache if not older than cache_max_age."""
+        if not self.cache_max_age:
+            return self.fetch_routers()
+
+        cache_file = self.get_cache_file()
+        if not self.refresh:
+            routers = self.read_cache(cache_file)
+            if routers is not None:
+                return routers
+
+        # Only one of concurrent runs fetches, the others wait and read
+        lock_file = open(cache_file + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            routers = None
+            if not self.refresh:
+                routers = self.read_cache(cache_file)
+            if routers is None:
+                routers = self.fetch_routers()
+                self.write_cache(cache_file, routers)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        # Fetched once per run
+        self.refresh = False
+        return routers
+
+
+    def iter_routers(self):
+        """Yield the routers while they are fetched, the scopes one after the
+        other, or from the cache."""
+        if self.cache_max_age:
+            for router in self.get_routers():
+                yield router
+            return
+
+        router_ids = set()
+        for args in ROUTER_SCOPES:
+            for router in self.iter_list('listRouters', 'router', **args):
+                if router['id'] not in router_ids:
+                    router_ids.add(router['id'])
+                    yield router
+
+
+    def fetch_routers(self):
+        """Return the routers of projects and of accounts, fetched at once."""
+        results = run_concurrently(
+            lambda args: list(self.iter_list('listRouters', 'router', **args)),
+            ROUTER_SCOPES, len(ROUTER_SCOPES))
+
+        # A router may be listed in both scopes
+        routers = []
+        router_ids = set()
+        for scope_routers in results:
+            for router in scope_routers:
+                if router['id'] not in router_ids:
+                    router_ids.add(router['id'])
+                    routers.append(router)
+        return routers
+
+
+    def read_cache(self, cache_file, max_age=None):
+        if max_age is None:
+            max_age = self.cache_max_age
+        try:
+            if time.time() - os.path.getmtime(cache_file) > max_age:
+                return None
+            with open(cache_file) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def write_cache(self, cache_file, data):
+        # Write atomically, readers do not lock
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_file, cache_file)
 
 
     def add_group(self, data, group_name, router_name):
@@ -113,18 +618,8 @@ class CloudStackInventory(object):
 
 
     def get_host(self, name):
-        routers = []
-
-        routers_projects = self.cs.listRouters(projectid=-1, listall=True)
-        if routers_projects and 'router' in routers_projects:
-            routers = routers + routers_projects['router']
-
-        routers_accounts = self.cs.listRouters(listall=True)
-        if routers_accounts and 'router' in routers_accounts:
-            routers = routers + routers_accounts['router']
-
         data = {}
-        for router in routers:
+        for router in self.get_routers():
             router_name = router['name']
             if name == router_name:
                 data['zone'] = router['zonename']
@@ -161,74 +656,167 @@ class CloudStackInventory(object):
                 },
             }
 
-        routers = []
-
-        routers_projects = self.cs.listRouters(projectid=-1, listall=True)
-        if routers_projects and 'router' in routers_projects:
-            routers = routers + routers_projects['router']
-
-        routers_accounts = self.cs.listRouters(listall=True)
-        if routers_accounts and 'router' in routers_accounts:
-            routers = routers + routers_accounts['router']
-
-        for router in routers:
-            if router['state'] != 'Running':
-                continue
-            router_name = router['name']
-            data['all']['hosts'].append(router_name)
-            # Make a group per domain
-            data = self.add_group(data, router['domain'], router_name)
-
-            data['_meta']['hostvars'][router_name] = {}
-            data['_meta']['hostvars'][router_name]['group'] = router['domain']
-            data['_meta']['hostvars'][router_name]['domain'] = router['domain']
-            if 'networkdomain' in router:
-                data['_meta']['hostvars'][router_name]['networkdomain'] = router['networkdomain']
-
-            data['_meta']['hostvars'][router_name]['zone'] = router['zonename']
-            # Make a group per zone
-            data = self.add_group(data, router['zonename'], router_name)
-
-            if 'project' in router:
-                data['_meta']['hostvars'][router_name]['project'] = router['project']
-
-                # Make a group per project
-                data = self.add_group(data, router['project'], router_name)
-
-            if 'account' in router:
-                data['_meta']['hostvars'][router_name]['account'] = router['account']
-
-                # Make a group per account
-                data = self.add_group(data, router['account'], router_name)
-
-            data['_meta']['hostvars'][router_name]['ansible_ssh_host'] = router['linklocalip']
-            data['_meta']['hostvars'][router_name]['state'] = router['state']
-            if 'redundantstate' in router:
-                data['_meta']['hostvars'][router_name]['redundant_state'] = router['redundantstate']
-
-                if router['redundantstate'] in [ 'MASTER', 'BACKUP' ]:
-                    data = self.add_group(data, 'redundant_routers', router_name)
-
-                if router['redundantstate'] in [ 'MASTER' ]:
-                    data = self.add_group(data, 'redundant_master_routers', router_name)
-
-                if router['redundantstate'] in [ 'BACKUP' ]:
-                    data = self.add_group(data, 'redundant_backup_routers', router_name)
+        for router in self.get_routers():
+            self.add_router(data, router)
+        return data
 
-                if router['redundantstate'] in [ 'UNKNOWN' ]:
-                    data = self.add_group(data, 'non_redundant_routers', router_name)
 
-            data['_meta']['hostvars'][router_name]['service_offering'] = router['serviceofferingname']
-            data['_meta']['hostvars'][router_name]['nic'] = []
-            for nic in router['nic']:
-                data['_meta']['hostvars'][router_name]['nic'].append({
-                    'ip': nic['ipaddress'],
-                    'mac': nic['macaddress'],
-                    'netmask': nic['netmask'],
-                    })
-                if nic['isdefault']:
-                    data['_meta']['hostvars'][router_name]['default_ip'] = nic['ipaddress']
-        return data
+    def iter_hosts(self, data):
+        """Yield the names and hostvars of the routers while they are fetched,
+        data only keeps the groups."""
+        for router in self.iter_routers():
+            router_name = self.add_router(data, router)
+            if router_name is not None:
+                yield router_name, data['_meta']['hostvars'].pop(router_name)
+
+
+    def add_router(self, data, router):
+        """Add a running router to data, return its name or None."""
+        if router['state'] != 'Running':
+            return None
+        router_name = router['name']
+        data['all']['hosts'].append(router_name)
+        # Make a group per domain
+        data = self.add_group(data, router['domain'], router_name)
+
+        data['_meta']['hostvars'][router_name] = {}
+        data['_meta']['hostvars'][router_name]['group'] = router['domain']
+        data['_meta']['hostvars'][router_name]['domain'] = router['domain']
+        if 'networkdomain' in router:
+            data['_meta']['hostvars'][router_name]['networkdomain'] = router['networkdomain']
+
+        data['_meta']['hostvars'][router_name]['zone'] = router['zonename']
+        # Make a group per zone
+        data = self.add_group(data, router['zonename'], router_name)
+
+        if 'project' in router:
+            data['_meta']['hostvars'][router_name]['project'] = router['project']
+
+            # Make a group per project
+            data = self.add_group(data, router['project'], router_name)
+
+        if 'account' in router:
+            data['_meta']['hostvars'][router_name]['account'] = router['account']
+
+            # Make a group per account
+            data = self.add_group(data, router['account'], router_name)
+
+        data['_meta']['hostvars'][router_name]['ansible_ssh_host'] = router['linklocalip']
+        data['_meta']['hostvars'][router_name]['state'] = router['state']
+        if 'redundantstate' in router:
+            data['_meta']['hostvars'][router_name]['redundant_state'] = router['redundantstate']
+
+            if router['redundantstate'] in [ 'MASTER', 'BACKUP' ]:
+                data = self.add_group(data, 'redundant_routers', router_name)
+
+            if router['redundantstate'] in [ 'MASTER' ]:
+                data = self.add_group(data, 'redundant_master_routers', router_name)
+
+            if router['redundantstate'] in [ 'BACKUP' ]:
+                data = self.add_group(data, 'redundant_backup_routers', router_name)
+
+            if router['redundantstate'] in [ 'UNKNOWN' ]:
+                data = self.add_group(data, 'non_redundant_routers', router_name)
+
+        data['_meta']['hostvars'][router_name]['service_offering'] = router['serviceofferingname']
+        data['_meta']['hostvars'][router_name]['nic'] = []
+        for nic in router['nic']:
+            data['_meta']['hostvars'][router_name]['nic'].append({
+                'ip': nic['ipaddress'],
+                'mac': nic['macaddress'],
+                'netmask': nic['netmask'],
+                })
+            if nic['isdefault']:
+                data['_meta']['hostvars'][router_name]['default_ip'] = nic['ipaddress']
+        return router_name
+
+
+    def iter_list(self, command, key, cs=None, **args):
+        """Yield the records of a list API call, fetched page by page."""
+        cs = cs or self.cs
+        records, count = self.fetch_page(cs, command, key, 1, args)
+        for record in records:
+            yield record
+
+        if count is None:
+            # No total known, page on until a page is not full
+            page = 1
+            while len(records) == self.get_page_size(cs):
+                page += 1
+                records, count = self.fetch_page(cs, command, key, page, args)
+                for record in records:
+                    yield record
+            return
+
+        page_size = self.get_page_size(cs)
+        last_page = (count + page_size - 1) // page_size
+        for records in self.fetch_pages(cs, command, key, range(2, last_page + 1), args):
+            for record in records:
+                yield record
+
+
+    def get_page_size(self, cs):
+        return self.page_size_limits.get(getattr(cs, 'endpoint', None), self.page_size)
+
+
+    def fetch_page(self, cs, command, key, page, args):
+        while True:
+            page_size = self.get_page_size(cs)
+            try:
+                res = getattr(cs, command)(**dict(args, page=page, pagesize=page_size))
+                break
+            except CloudStackException as e:
+                # The limit is in the error of newer cs libraries, a first page
+                # tells it before any page of the larger size is used
+                limit = PAGE_SIZE_LIMIT_RE.search(str(getattr(e, 'error', e)))
+                if not limit or int(limit.group(1)) >= page_size or page != 1:
+                    raise
+                self.page_size_limits[getattr(cs, 'endpoint', None)] = int(limit.group(1))
+        if not res or key not in res:
+            return [], None
+        return res[key], res.get('count')
+
+
+    def fetch_pages(self, cs, command, key, pages, args):
+        """Yield the records of pages in order, fetched by page_workers threads."""
+        if self.page_workers <= 1:
+            for page in pages:
+                yield self.fetch_page(cs, command, key, page, args)[0]
+            return
+
+        queue = Queue()
+        for page in pages:
+            queue.put(page)
+        results = {}
+        done = threading.Condition()
+
+        def worker():
+            while True:
+                try:
+                    page = queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    records = self.fetch_page(cs, command, key, page, args)[0]
+                except Exception as e:
+                    records = e
+                with done:
+                    results[page] = records
+                    done.notify_all()
+
+        for i in range(min(self.page_workers, len(pages))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for page in pages:
+            with done:
+                while page not in results:
+                    done.wait()
+                records = results.pop(page)
+            if isinstance(records, Exception):
+                raise records
+            yield records
 
 
 if __name__ == '__main__':
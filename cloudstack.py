@@ -36,6 +36,7 @@ When run against a specific host, this script returns the following attributes
 based on the data obtained from CloudStack API:
 
   "web01": {
+    "id": "1b8a3a24-2d4f-4f8e-a0e3-4d6b6d1c8f71",
     "cpu_number": 2,
     "nic": [
       {
@@ -67,13 +68,103 @@ based on the data obtained from CloudStack API:
   }
 
 
-usage: cloudstack.py [--list] [--host HOST] [--project PROJECT]
+The generated inventory can be cached, see the [inventory] section in
+'cloudstack.ini':
+
+  [inventory]
+  # Seconds a generated inventory is used again, 0 disables the cache
+  cache_max_age = 300
+  cache_path = ~/.ansible/tmp
+  # VMs are fetched page by page, optionally several pages at once
+  page_size = 500
+  page_workers = 4
+  # Projects and regions are fetched at once by up to tenant_workers threads
+  tenant_workers = 8
+  # Connections kept alive to the API and retries of failed connections
+  pool_size = 10
+  retries = 0
+  # An expired cache is updated from the VM, NIC and tag events since, e.g.
+  # VM.CREATE, NIC.CREATE or CREATE_TAGS, only the VMs concerned are fetched
+  # again. Fully regenerated after full_refresh_interval seconds, 0 disables
+  # the updates, or if there were more than max_events events. Changes without
+  # an event of the VM, e.g. a renamed security group, wait for the full refresh.
+  full_refresh_interval = 3600
+  max_events = 1000
+
+
+The hosts are grouped by instance group and into zone_<zone>,
+offering_<service offering>, state_<state>, tag_<key>_<value>,
+hypervisor_<hypervisor>, security_group_<name> and affinity_group_<name>, with
+characters other than letters, digits and underscores replaced by underscores.
+The kinds of groups are set by group_by in the [inventory] section:
+
+  [inventory]
+  group_by = instance_group, zone, tag
+
+
+One run can aggregate several projects and regions. --all-projects lists the
+VMs outside of any project and those of every project, --region REGION (may be
+repeated) and --all-regions use the sections of 'cloudstack.ini' instead of the
+default one. The hosts are additionally grouped into project_<project> and
+region_<region>, and have the hostvars "project" and "region" set.
+
+
+The inventory can also be kept by a daemon started with --daemon, with the
+same options as the runs it is serving. It refreshes the inventory every
+daemon_interval seconds (default 60), using the cache if configured, and
+answers --list and --host of later runs over a UNIX socket in cache_path.
+Hosts created since the last refresh are unknown to --host until the next:
+
+  [inventory]
+  daemon_interval = 60
+
+
+The JSON output is indented by default. --output compact leaves out all
+whitespace, --output stream also writes the inventory piece by piece, while
+the VMs are fetched if neither cache nor several projects or regions are used.
+--fields limits the hostvars written, e.g. --fields zone,default_ip, or leaves
+some out, e.g. --fields=-nic,-tags,-cpu_used. Both can be set in the
+[inventory] section for runs by Ansible:
+
+  [inventory]
+  output = compact
+  fields = -nic,-tags,-cpu_used
+
+
+usage: cloudstack.py [--list] [--host HOST] [--daemon] [--project PROJECT]
+                     [--all-projects] [--region REGION] [--all-regions]
+                     [--refresh-cache] [--output {indent,compact,stream}]
+                     [--fields FIELDS]
 """
 
 from __future__ import print_function
+import errno
+import fcntl
+import hashlib
 import os
+import re
 import sys
 import argparse
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import ConfigParser
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    from socketserver import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
 
 try:
     import json
@@ -81,11 +172,259 @@ except:
     import simplejson as json
 
 
-try:
-    from cs import CloudStack, CloudStackException, read_config
-except ImportError:
-    print("Error: CloudStack library must be installed: pip install cs.", file=sys.stderr)
-    sys.exit(1)
+def import_cs():
+    """Import the CloudStack library, not needed by runs answered by a daemon."""
+    global CloudStack, CloudStackException, read_config, requests, HTTPAdapter
+    try:
+        from cs import CloudStack, CloudStackException, read_config
+    except ImportError:
+        print("Error: CloudStack library must be installed: pip install cs.", file=sys.stderr)
+        sys.exit(1)
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+
+# The API rejects pages larger than its default.page.size, telling the limit
+PAGE_SIZE_LIMIT_RE = re.compile(r'max allowed page size value: (\d+)')
+
+# Events changing the hostvars or groups of VMs: those of the VMs, their NICs and tags
+HOST_EVENT_TYPES = ('VM.', 'NIC.', 'CREATE_TAGS', 'DELETE_TAGS')
+VM_RESOURCE_TYPES = ['VirtualMachine', 'UserVm']
+
+# Kinds of groups of the hosts
+GROUP_BY = [
+    'instance_group', 'zone', 'offering', 'state', 'tag', 'hypervisor', 'security_group', 'affinity_group',
+]
+
+
+def cs_session(pool_size=10, retries=0):
+    """Return a HTTP session keeping connections to the API alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Some versions of the cs library close the session after each request
+    session.close = lambda: None
+    return session
+
+
+def cs_client(session, **config):
+    """Return a CloudStack client sending its requests through session."""
+    try:
+        return CloudStack(session=session, **config)
+    except TypeError:
+        pass
+
+    # cs library without session support uses the requests module directly,
+    # it is replaced by a stand-in sending through the session of the client
+    cs = CloudStack(**config)
+    request = cs._request
+
+    def _request(*args, **kwargs):
+        module = sys.modules[CloudStack.__module__]
+        if not isinstance(module.requests, CloudStackRequests):
+            module.requests = CloudStackRequests()
+        local = module.requests.local
+        previous = getattr(local, 'session', None)
+        local.session = session
+        try:
+            return request(*args, **kwargs)
+        finally:
+            local.session = previous
+    cs._request = _request
+    return cs
+
+
+class CloudStackRequests(object):
+    """Stand-in for the requests module in the cs library, sending the
+    requests of a client through the session of that client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+    def Session(self):
+        return getattr(self.local, 'session', None) or requests.Session()
+
+
+    def get(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).get(*args, **kwargs)
+
+
+    def post(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).post(*args, **kwargs)
+
+
+def read_ini():
+    """Return the cloudstack.ini files read by cs."""
+    paths = [
+        os.path.join(os.path.expanduser('~'), '.cloudstack.ini'),
+        os.path.join(os.getcwd(), 'cloudstack.ini'),
+    ]
+    if 'CLOUDSTACK_CONFIG' in os.environ:
+        paths.append(os.path.expanduser(os.environ['CLOUDSTACK_CONFIG']))
+
+    conf = ConfigParser()
+    conf.read(paths)
+    return conf
+
+
+def read_inventory_config():
+    """Return the [inventory] section of the cloudstack.ini files read by cs."""
+    conf = read_ini()
+    if not conf.has_section('inventory'):
+        return {}
+    return dict(conf.items('inventory'))
+
+
+def read_endpoint():
+    """Return the API endpoint configured by the environment or cloudstack.ini,
+    as far as known without the CloudStack library."""
+    if 'CLOUDSTACK_ENDPOINT' in os.environ:
+        return os.environ['CLOUDSTACK_ENDPOINT']
+    conf = read_ini()
+    region = os.environ.get('CLOUDSTACK_REGION', 'cloudstack')
+    if conf.has_option(region, 'endpoint'):
+        return conf.get(region, 'endpoint')
+    return None
+
+
+def read_regions():
+    """Return the sections of the cloudstack.ini files configuring an API."""
+    conf = read_ini()
+    return [section for section in conf.sections() if conf.has_option(section, 'endpoint')]
+
+
+def query_daemon(socket_file, request):
+    """Return the response of the inventory daemon listening on socket_file,
+    None if there is none."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    chunks = []
+    try:
+        client.connect(socket_file)
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.error:
+        return None
+    finally:
+        client.close()
+    if not chunks:
+        return None
+    return b''.join(chunks).decode('utf-8')
+
+
+class InventoryRequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.inventory.handle_request(request)
+        except Exception as e:
+            print("Warning: Could not handle request: %s" % e, file=sys.stderr)
+            return
+        self.wfile.write(response.encode('utf-8'))
+
+
+class InventoryServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_file, inventory):
+        UnixStreamServer.__init__(self, socket_file, InventoryRequestHandler)
+        self.inventory = inventory
+
+
+def select_fields(host_vars, fields):
+    """Return host_vars limited to fields, without those prefixed by '-'."""
+    if not fields:
+        return host_vars
+    included = [field for field in fields if not field.startswith('-')]
+    excluded = [field[1:] for field in fields if field.startswith('-')]
+    return dict((key, value) for key, value in host_vars.items()
+                if (not included or key in included) and key not in excluded)
+
+
+def dump_json(data, output):
+    """Return data as JSON, indented unless output is compact or stream."""
+    if output in ('compact', 'stream'):
+        return json.dumps(data, separators=(',', ':'))
+    return json.dumps(data, indent=2)
+
+
+def write_inventory(out, hosts, groups, fields=None):
+    """Write an inventory as compact JSON to out piece by piece, the hostvars
+    as hosts yields (name, hostvars) and then groups, which may be filled
+    meanwhile."""
+    out.write('{"_meta":{"hostvars":{')
+    for i, (host_name, host_vars) in enumerate(hosts):
+        if i:
+            out.write(',')
+        out.write('%s:%s' % (json.dumps(host_name), dump_json(select_fields(host_vars, fields), 'compact')))
+    out.write('}}')
+    for group_name, group in groups.items():
+        if group_name != '_meta':
+            out.write(',%s:%s' % (json.dumps(group_name), dump_json(group, 'compact')))
+    out.write('}\n')
+
+
+def to_safe(name):
+    """Return name usable as Ansible group name."""
+    return re.sub(r'[^A-Za-z0-9_]', '_', name)
+
+
+def utc_offset(timestamp):
+    """Return the UTC offset in seconds of an API timestamp,
+    e.g. 2014-07-02T07:53:50+0200, None if it has none."""
+    match = re.search(r'([+-])(\d\d):?(\d\d)$', timestamp or '')
+    if not match:
+        return None
+    offset = int(match.group(2)) * 3600 + int(match.group(3)) * 60
+    if match.group(1) == '-':
+        return -offset
+    return offset
+
+
+def run_concurrently(func, items, workers):
+    """Return the results of func for each of items, called by up to workers
+    threads. The first exception raised by func is raised again."""
+    items = list(items)
+    results = {}
+    errors = []
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[i] = func(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = []
+    for i in range(max(min(workers, len(items)), 1)):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return [results[i] for i in range(len(items))]
 
 
 class CloudStackInventory(object):
@@ -95,79 +434,550 @@ class CloudStackInventory(object):
         parser.add_argument('--host')
         parser.add_argument('--list', action='store_true')
         parser.add_argument('--project')
+        parser.add_argument('--all-projects', action='store_true',
+                            help='include the VMs of all projects')
+        parser.add_argument('--region', action='append', dest='regions',
+                            help='section of cloudstack.ini to use, may be repeated')
+        parser.add_argument('--all-regions', action='store_true',
+                            help='use all sections of cloudstack.ini')
+        parser.add_argument('--refresh-cache', action='store_true',
+                            help='regenerate the cached inventory')
+        parser.add_argument('--daemon', action='store_true',
+                            help='serve the inventory on a UNIX socket')
+        parser.add_argument('--output', choices=['indent', 'compact', 'stream'],
+                            help='JSON output format, default indent')
+        parser.add_argument('--fields',
+                            help='comma separated hostvars to output, or -<name> to leave out')
 
         options = parser.parse_args()
-        try:
-            self.cs = CloudStack(**read_config())
-        except CloudStackException as e:
-            print("Error: Could not connect to CloudStack API", file=sys.stderr)
+        self.regions = options.regions
+        if options.all_regions:
+            self.regions = read_regions()
 
-        project_id = ''
-        if options.project:
-            project_id = self.get_project_id(options.project)
+        inventory_config = read_inventory_config()
+        self.cache_max_age = int(inventory_config.get('cache_max_age', 0))
+        self.cache_path = os.path.expanduser(inventory_config.get('cache_path', '~/.ansible/tmp'))
+        self.page_size = int(inventory_config.get('page_size', 500))
+        self.page_workers = int(inventory_config.get('page_workers', 1))
+        # Lowered page sizes by endpoint of the API
+        self.page_size_limits = {}
+        self.tenant_workers = int(inventory_config.get('tenant_workers', 8))
+        self.pool_size = int(inventory_config.get('pool_size', 10))
+        self.retries = int(inventory_config.get('retries', 0))
+        self.full_refresh_interval = int(inventory_config.get('full_refresh_interval', 0))
+        self.max_events = int(inventory_config.get('max_events', 1000))
+        self.group_by = [kind.strip() for kind in inventory_config.get('group_by', ','.join(GROUP_BY)).split(',')]
+        self.daemon_interval = int(inventory_config.get('daemon_interval', 60))
+        self.output = options.output or inventory_config.get('output', 'indent')
+        fields = options.fields or inventory_config.get('fields', '')
+        self.fields = [field.strip() for field in fields.split(',') if field.strip()]
+        self.project = options.project
+        self.all_projects = options.all_projects
+
+        # A running daemon answers without the CloudStack library
+        response = None
+        request = {'output': self.output, 'fields': self.fields}
+        if options.host and not options.daemon:
+            response = query_daemon(self.get_socket_file(), dict(request, host=options.host))
+        elif options.list and not options.daemon and not options.refresh_cache:
+            response = query_daemon(self.get_socket_file(), dict(request, list=True))
+        if response is not None:
+            print(response)
+            return
+
+        import_cs()
+        self.cs = None
+        if not self.regions:
+            try:
+                self.cs = cs_client(cs_session(self.pool_size, self.retries), **read_config())
+            except CloudStackException as e:
+                print("Error: Could not connect to CloudStack API", file=sys.stderr)
+
+        if options.daemon:
+            self.serve()
 
-        if options.host:
+        elif options.host:
             data = self.get_host(options.host)
-            print(json.dumps(data, indent=2))
+            print(dump_json(select_fields(data, self.fields), self.output))
 
         elif options.list:
-            data = self.get_list()
-            print(json.dumps(data, indent=2))
+            if self.output == 'stream' and not self.cache_max_age and not self.regions and not self.all_projects:
+                # Written while the VMs are fetched
+                data = {
+                    'all': {
+                        'hosts': [],
+                        },
+                    '_meta': {
+                        'hostvars': {},
+                        },
+                    }
+                hosts = self.iter_hosts(data, self.get_project_id(self.project) if self.project else '')
+                write_inventory(sys.stdout, hosts, data, self.fields)
+            elif self.output == 'stream':
+                data = self.get_cached_list(refresh=options.refresh_cache)
+                write_inventory(sys.stdout, data['_meta']['hostvars'].items(), data, self.fields)
+            else:
+                data = self.get_cached_list(refresh=options.refresh_cache)
+                print(self.dump_list(data, self.output, self.fields))
         else:
-            print("usage: --list | --host <hostname> [--project <project>]", file=sys.stderr)
+            print("usage: --list | --host <hostname> | --daemon [--project <project>] [--all-projects] "
+                  "[--region <region>] [--all-regions] [--refresh-cache] [--output <format>] "
+                  "[--fields <fields>]", file=sys.stderr)
             sys.exit(1)
 
 
+    def dump_list(self, data, output, fields):
+        if fields:
+            hostvars = data['_meta']['hostvars']
+            data = dict(data, _meta={
+                'hostvars': dict((host_name, select_fields(host_vars, fields)) for host_name, host_vars in hostvars.items()),
+                })
+        return dump_json(data, output)
+
+
+    def serve(self):
+        """Serve the inventory on a UNIX socket until terminated, refreshed
+        every daemon_interval seconds in the background."""
+        socket_file = self.get_socket_file()
+        if query_daemon(socket_file, {'list': True}) is not None:
+            print("Error: Inventory daemon already listening on %s." % socket_file, file=sys.stderr)
+            sys.exit(1)
+        if os.path.exists(socket_file):
+            os.unlink(socket_file)
+
+        self.refresh_daemon()
+        thread = threading.Thread(target=self.run_refresh)
+        thread.daemon = True
+        thread.start()
+
+        # Run the finally clause when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        # Only accessible by the user from the start
+        umask = os.umask(0o077)
+        try:
+            server = InventoryServer(socket_file, self)
+        finally:
+            os.umask(umask)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.unlink(socket_file)
+
+
+    def run_refresh(self):
+        while True:
+            time.sleep(self.daemon_interval)
+            try:
+                self.refresh_daemon()
+            except Exception as e:
+                print("Warning: Could not refresh inventory: %s" % e, file=sys.stderr)
+
+
+    def refresh_daemon(self):
+        data = self.get_cached_list()
+        # Swapped at once, requests are served from either version
+        self.daemon_data = (data, self.dump_list(data, self.output, self.fields))
+
+
+    def handle_request(self, request):
+        data, response = self.daemon_data
+        output = request.get('output', self.output)
+        fields = request.get('fields', self.fields)
+        if 'host' in request:
+            # Hosts created since the last refresh are known after the next,
+            # a lookup for each unknown host would slow down the daemon and the API
+            hostvars = data['_meta']['hostvars'].get(request['host'], {})
+            return dump_json(select_fields(hostvars, fields), output)
+        if output != self.output or fields != self.fields:
+            response = self.dump_list(data, output, fields)
+        return response
+
+
+    def get_cached_list(self, refresh=False):
+        """Return the inventory from the cache if not older than cache_max_age."""
+        if not self.cache_max_age:
+            return self.get_inventory()
+
+        cache_file = self.get_cache_file()
+        if not refresh:
+            data = self.read_cache(cache_file)
+            if data is not None:
+                return data
+
+        # Only one of concurrent runs regenerates, the others wait and read
+        lock_file = open(cache_file + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = None
+            if not refresh:
+                data = self.read_cache(cache_file)
+            if data is None and not refresh and self.full_refresh_interval:
+                data = self.update_cache(cache_file)
+            if data is None:
+                started = time.time()
+                data = self.get_inventory()
+                self.write_cache(cache_file, data)
+                self.write_cache(cache_file + '.sync', {'full': started, 'synced': started})
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        return data
+
+
+    def get_cache_file(self):
+        return self.get_runtime_file('ansible-cloudstack-%s.json')
+
+
+    def get_socket_file(self):
+        return self.get_runtime_file('ansible-cloudstack-%s.sock')
+
+
+    def get_runtime_file(self, name):
+        """Return the path of a file in cache_path named by the API and
+        projects selected."""
+        if not os.path.isdir(self.cache_path):
+            try:
+                os.makedirs(self.cache_path)
+            except OSError as e:
+                # Created by a concurrent run meanwhile
+                if e.errno != errno.EEXIST:
+                    raise
+        key = json.dumps([self.regions or read_endpoint(), self.project or '', self.all_projects])
+        return os.path.join(self.cache_path, name % hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+    def update_cache(self, cache_file):
+        """Return the expired cache updated from the VM events since, None if
+        it has to be regenerated."""
+        sync = self.read_cache(cache_file + '.sync', self.full_refresh_interval)
+        if sync is None or time.time() - sync['full'] > self.full_refresh_interval:
+            return None
+        data = self.read_cache(cache_file, self.full_refresh_interval)
+        if data is None:
+            return None
+
+        started = time.time()
+        if not self.update_inventory(data, sync['synced']):
+            return None
+        self.write_cache(cache_file, data)
+        self.write_cache(cache_file + '.sync', dict(sync, synced=started))
+        return data
+
+
+    def read_cache(self, cache_file, max_age=None):
+        if max_age is None:
+            max_age = self.cache_max_age
+        try:
+            if time.time() - os.path.getmtime(cache_file) > max_age:
+                return None
+            with open(cache_file) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def write_cache(self, cache_file, data):
+        # Write atomically, readers do not lock
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_file, cache_file)
+
+
     def get_project_id(self, project):
-        projects = self.cs.listProjects()
+        project_id = self.find_project_id(self.cs, project)
+        if project_id:
+            return project_id
+        print("Error: Project %s not found." % project, file=sys.stderr)
+        sys.exit(1)
+
+
+    def find_project_id(self, cs, project):
+        projects = cs.listProjects()
         if projects:
             for p in projects['project']:
                 if p['name'] == project or p['id'] == project:
                     return p['id']
-        print("Error: Project %s not found." % project, file=sys.stderr)
-        sys.exit(1)
+        return None
+
+
+    def get_inventory(self):
+        """Return the inventory of the selected projects and regions."""
+        if not self.regions and not self.all_projects:
+            return self.get_list(self.get_project_id(self.project) if self.project else '')
+
+        # First look up the projects of each region, then fetch all tenants at once
+        tenants = []
+        for region_tenants in run_concurrently(self.get_tenants, self.regions or [None], self.tenant_workers):
+            tenants.extend(region_tenants)
+        if self.project and not tenants:
+            print("Error: Project %s not found." % self.project, file=sys.stderr)
+            sys.exit(1)
+
+        results = run_concurrently(
+            lambda tenant: self.get_list(tenant[2], cs=tenant[1]),
+            tenants, self.tenant_workers)
+
+        data = {
+            'all': {
+                'hosts': [],
+                },
+            '_meta': {
+                'hostvars': {},
+                },
+            }
+        for (region, cs, project_id, project_name), tenant_data in zip(tenants, results):
+            self.merge_inventory(data, tenant_data, region, project_name)
+        return data
+
+
+    def update_inventory(self, data, since):
+        """Fetch the VMs of the events since the given time again and patch
+        them into data. Return False if the events do not tell which VMs."""
+        hostvars = data['_meta']['hostvars']
+        if any('id' not in host_vars for host_vars in hostvars.values()):
+            return False
+        host_names = dict((host_vars['id'], host_name) for host_name, host_vars in hostvars.items())
+
+        tenants = []
+        for region_tenants in run_concurrently(self.get_tenants, self.regions or [None], self.tenant_workers):
+            tenants.extend(region_tenants)
+        changes = run_concurrently(
+            lambda tenant: self.get_changed_hosts(data, tenant, since),
+            tenants, self.tenant_workers)
+        if None in changes:
+            return False
+
+        for (region, cs, project_id, project_name), (ids, hosts) in zip(tenants, changes):
+            for vm_id in ids:
+                if vm_id in host_names:
+                    self.remove_host(data, host_names.pop(vm_id))
+            tenant_data = {
+                'all': {
+                    'hosts': [],
+                    },
+                '_meta': {
+                    'hostvars': {},
+                    },
+                }
+            for host in hosts:
+                self.add_host(tenant_data, host)
+            self.merge_inventory(data, tenant_data, region, project_name)
+        return True
+
 
+    def get_changed_hosts(self, data, tenant, since):
+        """Return the ids of the VMs of a tenant with events since the given
+        time and the VMs still existing, None if there were too many events or
+        they do not tell the VMs."""
+        region, cs, project_id, project_name = tenant
 
-    def get_host(self, name, project_id=''):
-        hosts = self.cs.listVirtualMachines(projectid=project_id)
-        if not hosts:
+        # Dates are passed in the time zone of the API, as seen in timestamps.
+        # Go back some minutes for clock skew, VMs fetched twice do no harm.
+        offset = None
+        for host_vars in data['_meta']['hostvars'].values():
+            if host_vars.get('region') == region:
+                offset = utc_offset(host_vars.get('created'))
+                break
+        if offset is None:
+            # No host of the region tells it, the most recent event does
+            res = cs.listEvents(projectid=project_id, page=1, pagesize=1)
+            if not res or not res.get('event'):
+                # No events at all, none since
+                return [], []
+            offset = utc_offset(res['event'][0].get('created'))
+        if offset is None:
+            # Guessed wrong, e.g. for an API west of UTC, events would be missed
+            return None
+        startdate = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(since - 300 + offset))
+
+        # Paged by page_size, lowered to the default.page.size of the API
+        args = dict(projectid=project_id, startdate=startdate)
+        events, count = self.fetch_page(cs, 'listEvents', 'event', 1, args)
+        page_size = self.get_page_size(cs)
+        if count is None:
+            if len(events) == page_size:
+                # No total known, more events than fit a page are too many
+                return None
+            count = len(events)
+        if count > self.max_events:
+            return None
+        if count > len(events):
+            last_page = (count + page_size - 1) // page_size
+            for records in self.fetch_pages(cs, 'listEvents', 'event', range(2, last_page + 1), args):
+                events.extend(records)
+
+        ids = set()
+        for event in events:
+            if not event['type'].startswith(HOST_EVENT_TYPES):
+                continue
+            if not event.get('resourceid'):
+                # Older APIs do not tell the VM of an event
+                return None
+            if event.get('resourcetype', 'VirtualMachine') not in VM_RESOURCE_TYPES:
+                if event['type'].startswith('NIC.'):
+                    # A NIC, not telling its VM
+                    return None
+                # Tags of other resources, e.g. volumes
+                continue
+            ids.add(event['resourceid'])
+
+        hosts = []
+        ids = sorted(ids)
+        for i in range(0, len(ids), 100):
+            hosts.extend(self.iter_list('listVirtualMachines', 'virtualmachine', cs=cs,
+                                        projectid=project_id, ids=','.join(ids[i:i + 100])))
+        return ids, hosts
+
+
+    def get_tenants(self, region):
+        """Return (region, client, project id, project name) of each tenant in region."""
+        cs = self.cs
+        if region:
+            cs = cs_client(cs_session(self.pool_size, self.retries), **read_config(region))
+
+        if self.all_projects:
+            tenants = [(region, cs, '', None)]
+            for project in self.iter_list('listProjects', 'project', cs=cs, listall=True):
+                tenants.append((region, cs, project['id'], project['name']))
+            return tenants
+
+        if self.project:
+            project_id = self.find_project_id(cs, self.project)
+            if not project_id:
+                # Projects need not exist in every region
+                return []
+            return [(region, cs, project_id, self.project)]
+        return [(region, cs, '', None)]
+
+
+    def merge_inventory(self, data, tenant_data, region, project):
+        tenant_groups = []
+        if region:
+            tenant_groups.append('region_%s' % to_safe(region))
+        if project:
+            tenant_groups.append('project_%s' % to_safe(project))
+        multi_tenant = self.regions or self.all_projects
+
+        hostvars = data['_meta']['hostvars']
+        skipped = []
+        for host_name, host_vars in tenant_data['_meta']['hostvars'].items():
+            if host_name in hostvars:
+                skipped.append(host_name)
+                continue
+            if multi_tenant:
+                host_vars['region'] = region
+                host_vars['project'] = project
+            hostvars[host_name] = host_vars
+            data['all']['hosts'].append(host_name)
+            for group_name in tenant_groups:
+                data.setdefault(group_name, {'hosts': []})['hosts'].append(host_name)
+        if skipped:
+            print("Warning: %d hosts of %s already found in another tenant, skipped: %s" % (
+                len(skipped), ', '.join(tenant_groups), ', '.join(sorted(skipped)[:10])), file=sys.stderr)
+
+        for group_name, group in tenant_data.items():
+            if group_name in ('all', '_meta'):
+                continue
+            hosts = data.setdefault(group_name, {'hosts': []})['hosts']
+            for host_name in group['hosts']:
+                if host_name not in skipped:
+                    hosts.append(host_name)
+
+
+    def get_host(self, name):
+        # Served from the cached inventory if possible
+        if self.cache_max_age:
+            data = self.read_cache(self.get_cache_file())
+            if data is not None and name in data['_meta']['hostvars']:
+                return data['_meta']['hostvars'][name]
+
+        if self.regions or self.all_projects:
+            return self.find_tenant_host(name)
+
+        project_id = ''
+        if self.project:
+            project_id = self.get_project_id(self.project)
+
+        host = self.find_host(self.cs, project_id, name)
+        if host is None:
             return {}
+        return self.get_hostvars(host)
+
+
+    def find_tenant_host(self, name):
+        """Return the hostvars of a host looked up in all tenants at once,
+        of the first tenant as in the inventory if found in several."""
+        tenants = []
+        for region_tenants in run_concurrently(self.get_tenants, self.regions or [None], self.tenant_workers):
+            tenants.extend(region_tenants)
+
+        found = threading.Event()
+
+        def find(tenant):
+            # Tenants not looked up yet are skipped once found
+            if found.is_set():
+                return None
+            host = self.find_host(tenant[1], tenant[2], name)
+            if host is not None:
+                found.set()
+            return host
+
+        for (region, cs, project_id, project_name), host in zip(tenants, run_concurrently(find, tenants, self.tenant_workers)):
+            if host is not None:
+                host_vars = self.get_hostvars(host)
+                host_vars['region'] = region
+                host_vars['project'] = project_name
+                return host_vars
+        return {}
+
+
+    def find_host(self, cs, project_id, name):
+        """Return the VM of a host name, None if not found."""
+        # Let the API filter, keyword matches the display name among others,
+        # all pages as it may match many more hosts
+        for host in self.iter_list('listVirtualMachines', 'virtualmachine', cs=cs, projectid=project_id, keyword=name):
+            if name == host['displayname']:
+                return host
+        return None
+
 
+    def get_hostvars(self, host):
         data = {}
-        for host in hosts['virtualmachine']:
-            host_name = host['displayname']
-            if name == host_name:
-                data['zone'] = host['zonename']
-                if 'group' in host:
-                    data['group'] = host['group']
-                data['state'] = host['state']
-                data['service_offering'] = host['serviceofferingname']
-                data['affinity_group'] = host['affinitygroup']
-                data['security_group'] = host['securitygroup']
-                data['cpu_number'] = host['cpunumber']
-                data['cpu_speed'] = host['cpuspeed']
-                if 'cpuused' in host:
-                    data['cpu_used'] = host['cpuused']
-                data['memory'] = host['memory']
-                data['tags'] = host['tags']
-                data['hypervisor'] = host['hypervisor']
-                data['created'] = host['created']
-                data['nic'] = []
-                for nic in host['nic']:
-                    data['nic'].append({
-                        'ip': nic['ipaddress'],
-                        'mac': nic['macaddress'],
-                        'netmask': nic['netmask'],
-                        'gateway': nic['gateway'],
-                        'type': nic['type'],
-                    })
-                    if nic['isdefault']:
-                        data['default_ip'] = nic['ipaddress']
-                break;
+        data['id'] = host['id']
+        data['zone'] = host['zonename']
+        if 'group' in host:
+            data['group'] = host['group']
+        data['state'] = host['state']
+        data['service_offering'] = host['serviceofferingname']
+        data['affinity_group'] = host['affinitygroup']
+        data['security_group'] = host['securitygroup']
+        data['cpu_number'] = host['cpunumber']
+        data['cpu_speed'] = host['cpuspeed']
+        if 'cpuused' in host:
+            data['cpu_used'] = host['cpuused']
+        data['memory'] = host['memory']
+        data['tags'] = host['tags']
+        data['hypervisor'] = host['hypervisor']
+        data['created'] = host['created']
+        data['nic'] = []
+        for nic in host['nic']:
+            data['nic'].append({
+                'ip': nic['ipaddress'],
+                'mac': nic['macaddress'],
+                'netmask': nic['netmask'],
+                'gateway': nic['gateway'],
+                'type': nic['type'],
+                })
+            if nic['isdefault']:
+                data['default_ip'] = nic['ipaddress']
         return data
 
 
-    def get_list(self, project_id=''):
+    def get_list(self, project_id='', cs=None):
         data = {
             'all': {
                 'hosts': [],
@@ -177,56 +987,148 @@ class CloudStackInventory(object):
                 },
             }
 
-        groups = self.cs.listInstanceGroups(projectid=project_id)
-        if groups:
-            for group in groups['instancegroup']:
-                group_name = group['name']
-                if group_name and not group_name in data:
-                    data[group_name] = {
-                            'hosts': []
-                        }
-
-        hosts = self.cs.listVirtualMachines(projectid=project_id)
-        if hosts:
-            for host in hosts['virtualmachine']:
-                host_name = host['displayname']
-                data['all']['hosts'].append(host_name)
-                data['_meta']['hostvars'][host_name] = {}
-                data['_meta']['hostvars'][host_name]['zone'] = host['zonename']
-                if 'group' in host:
-                    data['_meta']['hostvars'][host_name]['group'] = host['group']
-                data['_meta']['hostvars'][host_name]['state'] = host['state']
-                data['_meta']['hostvars'][host_name]['service_offering'] = host['serviceofferingname']
-                data['_meta']['hostvars'][host_name]['affinity_group'] = host['affinitygroup']
-                data['_meta']['hostvars'][host_name]['security_group'] = host['securitygroup']
-                data['_meta']['hostvars'][host_name]['cpu_number'] = host['cpunumber']
-                data['_meta']['hostvars'][host_name]['cpu_speed'] = host['cpuspeed']
-                if 'cpuused' in host:
-                    data['_meta']['hostvars'][host_name]['cpu_used'] = host['cpuused']
-                data['_meta']['hostvars'][host_name]['memory'] = host['memory']
-                data['_meta']['hostvars'][host_name]['tags'] = host['tags']
-                data['_meta']['hostvars'][host_name]['hypervisor'] = host['hypervisor']
-                data['_meta']['hostvars'][host_name]['created'] = host['created']
-                data['_meta']['hostvars'][host_name]['nic'] = []
-                for nic in host['nic']:
-                    data['_meta']['hostvars'][host_name]['nic'].append({
-                        'ip': nic['ipaddress'],
-                        'mac': nic['macaddress'],
-                        'netmask': nic['netmask'],
-                        'gateway': nic['gateway'],
-                        'type': nic['type'],
-                        })
-                    if nic['isdefault']:
-                        data['_meta']['hostvars'][host_name]['default_ip'] = nic['ipaddress']
-
-                group_name = ''
-                if 'group' in host:
-                    group_name = host['group']
-
-                if group_name and group_name in data:
-                    data[group_name]['hosts'].append(host_name)
+        for host in self.iter_list('listVirtualMachines', 'virtualmachine', cs=cs, projectid=project_id):
+            self.add_host(data, host)
         return data
 
 
+    def iter_hosts(self, data, project_id=''):
+        """Yield the names and hostvars of the VMs while they are fetched,
+        data only keeps the groups."""
+        for host in self.iter_list('listVirtualMachines', 'virtualmachine', projectid=project_id):
+            self.add_host(data, host)
+            host_name = host['displayname']
+            yield host_name, data['_meta']['hostvars'].pop(host_name)
+
+
+    def add_host(self, data, host):
+        host_name = host['displayname']
+        data['all']['hosts'].append(host_name)
+        data['_meta']['hostvars'][host_name] = self.get_hostvars(host)
+
+        for group_name in self.get_groups(host):
+            data.setdefault(group_name, {'hosts': []})['hosts'].append(host_name)
+
+
+    def get_groups(self, host):
+        """Return the names of the groups of a host, by the kinds in group_by."""
+        groups = []
+        if 'instance_group' in self.group_by and host.get('group'):
+            groups.append(host['group'])
+        if 'zone' in self.group_by:
+            groups.append(to_safe('zone_%s' % host['zonename']))
+        if 'offering' in self.group_by:
+            groups.append(to_safe('offering_%s' % host['serviceofferingname']))
+        if 'state' in self.group_by:
+            groups.append(to_safe('state_%s' % host['state']))
+        if 'hypervisor' in self.group_by and host.get('hypervisor'):
+            groups.append(to_safe('hypervisor_%s' % host['hypervisor']))
+        if 'tag' in self.group_by:
+            for tag in host.get('tags', []):
+                groups.append(to_safe('tag_%s_%s' % (tag['key'], tag['value'])))
+        if 'security_group' in self.group_by:
+            for security_group in host.get('securitygroup', []):
+                groups.append(to_safe('security_group_%s' % security_group['name']))
+        if 'affinity_group' in self.group_by:
+            for affinity_group in host.get('affinitygroup', []):
+                groups.append(to_safe('affinity_group_%s' % affinity_group['name']))
+        return groups
+
+
+    def remove_host(self, data, host_name):
+        del data['_meta']['hostvars'][host_name]
+        for group_name, group in data.items():
+            if group_name != '_meta' and host_name in group['hosts']:
+                group['hosts'].remove(host_name)
+
+
+    def iter_list(self, command, key, cs=None, **args):
+        """Yield the records of a list API call, fetched page by page."""
+        cs = cs or self.cs
+        records, count = self.fetch_page(cs, command, key, 1, args)
+        for record in records:
+            yield record
+
+        if count is None:
+            # No total known, page on until a page is not full
+            page = 1
+            while len(records) == self.get_page_size(cs):
+                page += 1
+                records, count = self.fetch_page(cs, command, key, page, args)
+                for record in records:
+                    yield record
+            return
+
+        page_size = self.get_page_size(cs)
+        last_page = (count + page_size - 1) // page_size
+        for records in self.fetch_pages(cs, command, key, range(2, last_page + 1), args):
+            for record in records:
+                yield record
+
+
+    def get_page_size(self, cs):
+        return self.page_size_limits.get(getattr(cs, 'endpoint', None), self.page_size)
+
+
+    def fetch_page(self, cs, command, key, page, args):
+        while True:
+            page_size = self.get_page_size(cs)
+            try:
+                res = getattr(cs, command)(**dict(args, page=page, pagesize=page_size))
+                break
+            except CloudStackException as e:
+                # The limit is in the error of newer cs libraries, a first page
+                # tells it before any page of the larger size is used
+                limit = PAGE_SIZE_LIMIT_RE.search(str(getattr(e, 'error', e)))
+                if not limit or int(limit.group(1)) >= page_size or page != 1:
+                    raise
+                self.page_size_limits[getattr(cs, 'endpoint', None)] = int(limit.group(1))
+        if not res or key not in res:
+            return [], None
+        return res[key], res.get('count')
+
+
+    def fetch_pages(self, cs, command, key, pages, args):
+        """Yield the records of pages in order, fetched by page_workers threads."""
+        if self.page_workers <= 1:
+            for page in pages:
+                yield self.fetch_page(cs, command, key, page, args)[0]
+            return
+
+        queue = Queue()
+        for page in pages:
+            queue.put(page)
+        results = {}
+        done = threading.Condition()
+
+        def worker():
+            while True:
+                try:
+                    page = queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    records = self.fetch_page(cs, command, key, page, args)[0]
+                except Exception as e:
+                    records = e
+                with done:
+                    results[page] = records
+                    done.notify_all()
+
+        for i in range(min(self.page_workers, len(pages))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for page in pages:
+            with done:
+                while page not in results:
+                    done.wait()
+                records = results.pop(page)
+            if isinstance(records, Exception):
+                raise records
+            yield records
+
+
 if __name__ == '__main__':
     CloudStackInventory()
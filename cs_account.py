@@ -179,6 +179,88 @@ except ImportError:
     has_lib_cs = False
 
 # import cloudstack common
+import calendar
+import copy
+import errno
+import fcntl
+import glob
+import hashlib
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    # requests comes with the cs library, see has_lib_cs
+    requests = None
+
+# Polling of async jobs starts fast and backs off exponentially up to
+# api_poll_interval_max seconds.
+CS_POLL_INTERVAL_INITIAL = 0.1
+CS_POLL_INTERVAL_FACTOR = 2
+CS_POLL_INTERVAL_MAX = 5
+
+# Several jobs are polled by listing the jobs created since the first of them,
+# less some seconds for the clock of the API, see AnsibleCloudStack.poll_jobs
+CS_ASYNC_JOBS_SLACK = 60
+
+# Page size used to walk list API calls, unless set by api_page_size. Lowered
+# to the limit of the API if it rejects the size, see AnsibleCloudStack.iter_list
+CS_LIST_PAGE_SIZE = 500
+CS_PAGE_SIZE_LIMIT_RE = re.compile(r'max allowed page size value: (\d+)')
+
+# Values looking like this are looked up by id in the API
+CS_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+# Expected duration in seconds of slow async jobs, keyed by the command class
+# name returned in the 'cmd' of the job. Used as hint to not poll too often
+# before the job is expected to be done.
+CS_ASYNC_JOB_DURATION_HINTS = {
+    'DeployVMCmd':              20,
+    'StartVMCmd':               10,
+    'StopVMCmd':                10,
+    'RebootVMCmd':              10,
+    'RestoreVMCmd':             20,
+    'DestroyVMCmd':             5,
+    'ExpungeVMCmd':             5,
+    'ScaleVMCmd':               10,
+    'CreateTemplateCmd':        60,
+    'CopyTemplateCmd':          60,
+    'CreateSnapshotCmd':        30,
+    'CreateVMSnapshotCmd':      20,
+    'RevertToVMSnapshotCmd':    20,
+    'AttachVolumeCmd':          5,
+    'DetachVolumeCmd':          5,
+    'ResizeVolumeCmd':          10,
+    'CreateNetworkCmd':         5,
+    'RestartNetworkCmd':        30,
+}
+
+
+# Seconds the results of nearly static list API calls are cached on disk,
+# if api_cache is enabled.
+CS_CACHE_TTL = {
+    'listZones':            3600,
+    'listDomains':          300,
+    'listOsTypes':          86400,
+    'listHypervisors':      86400,
+    'listCapabilities':     3600,
+    'listServiceOfferings': 900,
+    'listDiskOfferings':    900,
+}
+
+
 def cs_argument_spec():
     return dict(
         api_key = dict(default=None),
@@ -186,12 +268,245 @@ def cs_argument_spec():
         api_url = dict(default=None),
         api_http_method = dict(choices=['get', 'post'], default='get'),
         api_timeout = dict(type='int', default=10),
+        api_poll_timeout = dict(type='int', default=None),
+        api_poll_interval_max = dict(type='float', default=CS_POLL_INTERVAL_MAX),
+        api_cache = dict(choices=BOOLEANS, default=False),
+        api_cache_dir = dict(default='~/.ansible/cloudstack_cache'),
+        api_page_size = dict(type='int', default=CS_LIST_PAGE_SIZE),
+        api_pool_size = dict(type='int', default=10),
+        api_retries = dict(type='int', default=0),
+        api_stats = dict(choices=BOOLEANS, default=False),
+        api_trace_file = dict(default=None),
         api_region = dict(default='cloudstack'),
     )
 
 def cs_required_together():
     return [['api_key', 'api_secret', 'api_url']]
 
+def cs_session(pool_size=10, retries=0):
+    """Return a HTTP session keeping connections to the API alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Some versions of the cs library close the session after each request
+    session.close = lambda: None
+    return session
+
+
+def cs_client(session, **config):
+    """Return a CloudStack client sending its requests through session."""
+    try:
+        return CloudStack(session=session, **config)
+    except TypeError:
+        pass
+
+    # cs library without session support uses the requests module directly,
+    # it is replaced by a stand-in sending through the session of the client
+    cs = CloudStack(**config)
+    request = cs._request
+
+    def _request(*args, **kwargs):
+        module = sys.modules[CloudStack.__module__]
+        if not isinstance(module.requests, CloudStackRequests):
+            module.requests = CloudStackRequests()
+        local = module.requests.local
+        previous = getattr(local, 'session', None)
+        local.session = session
+        try:
+            return request(*args, **kwargs)
+        finally:
+            local.session = previous
+    cs._request = _request
+    return cs
+
+
+class CloudStackRequests(object):
+    """Stand-in for the requests module in the cs library, sending the
+    requests of a client through the session of that client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+    def Session(self):
+        return getattr(self.local, 'session', None) or requests.Session()
+
+
+    def get(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).get(*args, **kwargs)
+
+
+    def post(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).post(*args, **kwargs)
+
+
+class CloudStackPrefetchError(Exception):
+    pass
+
+
+class CloudStackModule(object):
+    """Proxy of the AnsibleModule raising the failures of lookups run by
+    threads of AnsibleCloudStack.prefetch, which must not exit the module."""
+
+    def __init__(self, module):
+        self.module = module
+        self.prefetching = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+    def fail_json(self, **kwargs):
+        if getattr(self.prefetching, 'active', False):
+            raise CloudStackPrefetchError(kwargs.get('msg'))
+        self.module.fail_json(**kwargs)
+
+
+class CloudStackStats(object):
+    """Proxy of the CloudStack client recording the API calls made, the HTTP
+    responses of a call are recorded by a wrapper of the send of the session,
+    as the cs library sends prepared requests without the session hooks."""
+
+    def __init__(self, cs, session, trace_file=None):
+        self.cs = cs
+        self.trace_file = trace_file
+        self.commands = {}
+        self.poll_sleep = 0.0
+        self.lock = threading.Lock()
+        # Calls may run concurrently, see AnsibleCloudStack.prefetch
+        self.current = threading.local()
+        send = session.send
+
+        def recording_send(request, **kwargs):
+            response = send(request, **kwargs)
+            self._record_response(response)
+            return response
+        session.send = recording_send
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.cs, name)
+        if not callable(attr):
+            return attr
+
+        def handler(**args):
+            record = {
+                'command':  name,
+                'args':     hashlib.sha1(repr(sorted(args.items())).encode('utf-8')).hexdigest()[:12],
+                'requests': 0,
+                'bytes':    0,
+                'retries':  0,
+            }
+            self.current.record = record
+            start = time.time()
+            try:
+                return attr(**args)
+            finally:
+                record['duration'] = time.time() - start
+                self.current.record = None
+                self._add(record)
+        return handler
+
+
+    def _record_response(self, response):
+        record = getattr(self.current, 'record', None)
+        if record is not None:
+            # Every request after the first one is a retry of the cs library
+            if record['requests']:
+                record['retries'] += 1
+            record['requests'] += 1
+            record['bytes'] += len(response.content)
+
+            # Retries of the connection pool
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None and retries.history:
+                record['retries'] += len(retries.history)
+
+
+    def _add(self, record):
+        with self.lock:
+            stats = self.commands.setdefault(record['command'], {
+                'calls':    0,
+                'duration': 0.0,
+                'bytes':    0,
+                'retries':  0,
+            })
+            stats['calls'] += 1
+            stats['duration'] += record['duration']
+            stats['bytes'] += record['bytes']
+            stats['retries'] += record['retries']
+
+            if self.trace_file:
+                record['time'] = time.time()
+                record['pid'] = os.getpid()
+                record['module'] = os.path.basename(sys.argv[0])
+                with open(os.path.expanduser(self.trace_file), 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+    def add_poll_sleep(self, seconds):
+        with self.lock:
+            self.poll_sleep += seconds
+
+
+    def get_summary(self):
+        summary = {
+            'calls':        0,
+            'duration':     0.0,
+            'bytes':        0,
+            'retries':      0,
+            'poll_sleep':   round(self.poll_sleep, 3),
+            'commands':     {},
+        }
+        for command, stats in self.commands.iteritems():
+            for key in ['calls', 'duration', 'bytes', 'retries']:
+                summary[key] += stats[key]
+            summary['commands'][command] = dict(stats, duration=round(stats['duration'], 3))
+        summary['duration'] = round(summary['duration'], 3)
+        return summary
+
+
+class CloudStackMemo(object):
+    """Proxy of the CloudStack client returning results of identical list
+    calls from memory. The memo is cleared by any other command, as changes
+    on a resource also show up in the lists of related ones (e.g. tags, nics).
+    """
+
+    # Read-only, always asked live as their results change without a command
+    # of ours, but not clearing the memo either (nor do get* commands)
+    uncached_commands = [ 'listAsyncJobs', 'queryAsyncJobResult' ]
+
+    def __init__(self, cs):
+        self.cs = cs
+        self.memo = {}
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.cs, name)
+        if not callable(attr):
+            return attr
+
+        def handler(**args):
+            if name in self.uncached_commands or name.startswith('get'):
+                return attr(**args)
+            if not name.startswith('list'):
+                self.memo = {}
+                return attr(**args)
+
+            key = (name, repr(sorted(args.items())))
+            if key not in self.memo:
+                self.memo[key] = attr(**args)
+            # Callers modify results in place
+            return copy.deepcopy(self.memo[key])
+        return handler
+
+
 class AnsibleCloudStack(object):
 
     def __init__(self, module):
@@ -223,7 +538,7 @@ class AnsibleCloudStack(object):
         # these values will be casted to int
         self.returns_to_int = {}
 
-        self.module = module
+        self.module = CloudStackModule(module)
         self._connect()
 
         self.domain = None
@@ -245,8 +560,14 @@ class AnsibleCloudStack(object):
         api_http_method = self.module.params.get('api_http_method')
         api_timeout = self.module.params.get('api_timeout')
 
+        session = cs_session(
+            pool_size=self.module.params.get('api_pool_size') or 1,
+            retries=self.module.params.get('api_retries') or 0,
+            )
+
         if api_key and api_secret and api_url:
-            self.cs = CloudStack(
+            cs = cs_client(
+                session,
                 endpoint=api_url,
                 key=api_key,
                 secret=api_secret,
@@ -255,7 +576,14 @@ class AnsibleCloudStack(object):
                 )
         else:
             api_region = self.module.params.get('api_region', 'cloudstack')
-            self.cs = CloudStack(**read_config(api_region))
+            cs = cs_client(session, **read_config(api_region))
+
+        self.stats = None
+        api_trace_file = self.module.params.get('api_trace_file')
+        if self.module.params.get('api_stats') or api_trace_file:
+            self.stats = CloudStackStats(cs, session, trace_file=api_trace_file)
+            cs = self.stats
+        self.cs = CloudStackMemo(cs)
 
 
     def get_or_fallback(self, key=None, fallback_key=None):
@@ -315,12 +643,10 @@ class AnsibleCloudStack(object):
         args = {}
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
-        projects = self.cs.listProjects(**args)
-        if projects:
-            for p in projects['project']:
-                if project.lower() in [ p['name'].lower(), p['id'] ]:
-                    self.project = p
-                    return self._get_by_key(key, self.project)
+        for p in self.iter_list('listProjects', 'project', **args):
+            if project.lower() in [ p['name'].lower(), p['id'] ]:
+                self.project = p
+                return self._get_by_key(key, self.project)
         self.module.fail_json(msg="project '%s' not found" % project)
 
 
@@ -337,13 +663,10 @@ class AnsibleCloudStack(object):
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
         args['projectid'] = self.get_project(key='id')
-        ip_addresses = self.cs.listPublicIpAddresses(**args)
-
-        if not ip_addresses:
-            self.module.fail_json(msg="IP address '%s' not found" % args['ipaddress'])
-
-        self.ip_address = ip_addresses['publicipaddress'][0]
-        return self._get_by_key(key, self.ip_address)
+        for ip in self.iter_list('listPublicIpAddresses', 'publicipaddress', **args):
+            self.ip_address = ip
+            return self._get_by_key(key, self.ip_address)
+        self.module.fail_json(msg="IP address '%s' not found" % args['ipaddress'])
 
 
     def get_vm(self, key=None):
@@ -354,17 +677,16 @@ class AnsibleCloudStack(object):
         if not vm:
             self.module.fail_json(msg="Virtual machine param 'vm' is required")
 
+        self.prefetch(self.get_project, self.get_zone)
+
         args = {}
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
         args['projectid'] = self.get_project(key='id')
         args['zoneid'] = self.get_zone(key='id')
-        vms = self.cs.listVirtualMachines(**args)
-        if vms:
-            for v in vms['virtualmachine']:
-                if vm in [ v['name'], v['displayname'], v['id'] ]:
-                    self.vm = v
-                    return self._get_by_key(key, self.vm)
+        self.vm = self.find_resource('listVirtualMachines', 'virtualmachine', vm, ['name', 'displayname', 'id'], name_filter='keyword', **args)
+        if self.vm:
+            return self._get_by_key(key, self.vm)
         self.module.fail_json(msg="Virtual machine '%s' not found" % vm)
 
 
@@ -373,18 +695,11 @@ class AnsibleCloudStack(object):
             return self._get_by_key(key, self.zone)
 
         zone = self.module.params.get('zone')
-        zones = self.cs.listZones()
-
-        # use the first zone if no zone param given
-        if not zone:
-            self.zone = zones['zone'][0]
-            return self._get_by_key(key, self.zone)
-
-        if zones:
-            for z in zones['zone']:
-                if zone in [ z['name'], z['id'] ]:
-                    self.zone = z
-                    return self._get_by_key(key, self.zone)
+        for z in self.iter_list_cached('listZones', 'zone'):
+            # use the first zone if no zone param given
+            if not zone or zone in [ z['name'], z['id'] ]:
+                self.zone = z
+                return self._get_by_key(key, self.zone)
         self.module.fail_json(msg="zone '%s' not found" % zone)
 
 
@@ -396,12 +711,10 @@ class AnsibleCloudStack(object):
         if not os_type:
             return None
 
-        os_types = self.cs.listOsTypes()
-        if os_types:
-            for o in os_types['ostype']:
-                if os_type in [ o['description'], o['id'] ]:
-                    self.os_type = o
-                    return self._get_by_key(key, self.os_type)
+        for o in self.iter_list_cached('listOsTypes', 'ostype'):
+            if os_type in [ o['description'], o['id'] ]:
+                self.os_type = o
+                return self._get_by_key(key, self.os_type)
         self.module.fail_json(msg="OS type '%s' not found" % os_type)
 
 
@@ -410,7 +723,7 @@ class AnsibleCloudStack(object):
             return self.hypervisor
 
         hypervisor = self.module.params.get('hypervisor')
-        hypervisors = self.cs.listHypervisors()
+        hypervisors = self.get_cached('listHypervisors', self.cs.listHypervisors)
 
         # use the first hypervisor if no hypervisor param given
         if not hypervisor:
@@ -440,9 +753,8 @@ class AnsibleCloudStack(object):
         args['name'] = account
         args['domainid'] = self.get_domain(key='id')
         args['listall'] = True
-        accounts = self.cs.listAccounts(**args)
-        if accounts:
-            self.account = accounts['account'][0]
+        for a in self.iter_list('listAccounts', 'account', **args):
+            self.account = a
             return self._get_by_key(key, self.account)
         self.module.fail_json(msg="Account '%s' not found" % account)
 
@@ -457,15 +769,35 @@ class AnsibleCloudStack(object):
 
         args = {}
         args['listall'] = True
-        domains = self.cs.listDomains(**args)
-        if domains:
-            for d in domains['domain']:
-                if d['path'].lower() in [ domain.lower(), "root/" + domain.lower(), "root" + domain.lower() ]:
-                    self.domain = d
-                    return self._get_by_key(key, self.domain)
+        for d in self.iter_list_cached('listDomains', 'domain', **args):
+            if d['path'].lower() in [ domain.lower(), "root/" + domain.lower(), "root" + domain.lower() ]:
+                self.domain = d
+                return self._get_by_key(key, self.domain)
         self.module.fail_json(msg="Domain '%s' not found" % domain)
 
 
+    def prefetch(self, *lookups):
+        """Call independent lookups concurrently to have their results cached.
+
+        Lookups resolve what they depend on by their own, e.g. get_project
+        resolves the domain and account first. Errors are ignored here, the
+        lookup raises them again when called afterwards.
+        """
+        def run(lookup):
+            # Failures raise CloudStackPrefetchError in this thread only
+            self.module.prefetching.active = True
+            try:
+                lookup()
+            except Exception:
+                pass
+
+        threads = [ threading.Thread(target=run, args=(lookup,)) for lookup in lookups ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
     def get_tags(self, resource=None):
         if not self.tags:
             args = {}
@@ -473,8 +805,7 @@ class AnsibleCloudStack(object):
             args['account'] = self.get_account(key='name')
             args['domainid'] = self.get_domain(key='id')
             args['resourceid'] = resource['id']
-            response = self.cs.listTags(**args)
-            self.tags = response.get('tag', [])
+            self.tags = list(self.iter_list('listTags', 'tag', **args))
 
         existing_tags = []
         if self.tags:
@@ -483,7 +814,8 @@ class AnsibleCloudStack(object):
         return existing_tags
 
 
-    def _process_tags(self, resource, resource_type, tags, operation="create"):
+    def _process_tags(self, resource, resource_type, tags, operation="create", poll_async=True):
+        response = None
         if tags:
             self.result['changed'] = True
             if not self.module.check_mode:
@@ -495,7 +827,9 @@ class AnsibleCloudStack(object):
                     response = self.cs.createTags(**args)
                 else:
                     response = self.cs.deleteTags(**args)
-                self.poll_job(response)
+                if poll_async:
+                    response = self.poll_job(response)
+        return response
 
 
     def _tags_that_should_exist_or_be_updated(self, resource, tags):
@@ -515,17 +849,173 @@ class AnsibleCloudStack(object):
         if 'tags' in resource:
             tags = self.module.params.get('tags')
             if tags is not None:
-                self._process_tags(resource, resource_type, self._tags_that_should_not_exist(resource, tags), operation="delete")
-                self._process_tags(resource, resource_type, self._tags_that_should_exist_or_be_updated(resource, tags))
+                tags_to_delete = self._tags_that_should_not_exist(resource, tags)
+                tags_to_create = self._tags_that_should_exist_or_be_updated(resource, tags)
+
+                jobs = [self._process_tags(resource, resource_type, tags_to_delete, operation="delete", poll_async=False)]
+
+                # Updated tags must be deleted before they can be created again
+                if set(t['key'] for t in tags_to_delete) & set(t['key'] for t in tags_to_create):
+                    self.poll_jobs(jobs)
+                    jobs = []
+
+                jobs.append(self._process_tags(resource, resource_type, tags_to_create, poll_async=False))
+                self.poll_jobs(jobs)
                 self.tags = None
                 resource['tags'] = self.get_tags(resource)
         return resource
 
 
+    def iter_list(self, command, key, **args):
+        """Yield the records of a list API call, fetched lazily page by page."""
+        args['page'] = 1
+        args['pagesize'] = args.get('pagesize') or self.module.params.get('api_page_size') or CS_LIST_PAGE_SIZE
+        list_command = getattr(self.cs, command)
+        while True:
+            try:
+                res = list_command(**args)
+            except CloudStackException as e:
+                # The API limits the page size by its default.page.size, the
+                # response is in the error of newer cs libraries
+                limit = CS_PAGE_SIZE_LIMIT_RE.search(str(getattr(e, 'error', e)))
+                if not limit or int(limit.group(1)) >= args['pagesize'] or args['page'] != 1:
+                    raise
+                args['pagesize'] = int(limit.group(1))
+                continue
+            if not res or key not in res:
+                return
+            for item in res[key]:
+                yield item
+
+            # Last page reached
+            if len(res[key]) < args['pagesize'] or args['page'] * args['pagesize'] >= res.get('count', 0):
+                return
+            args['page'] += 1
+
+
+    def iter_list_cached(self, command, key, **args):
+        """Like iter_list, but served from the disk cache if api_cache is enabled."""
+        if not self._is_cache_enabled(command):
+            return self.iter_list(command, key, **args)
+        return iter(self.get_cached(command, lambda: list(self.iter_list(command, key, **args)), **args))
+
+
+    def get_cached(self, command, fetch, **args):
+        """Return the result of fetch(), cached on disk for the TTL of command."""
+        if not self._is_cache_enabled(command):
+            return fetch()
+
+        path = self._get_cache_path(command, args)
+        data = self._read_cache(path, CS_CACHE_TTL[command])
+        if data is not None:
+            return data
+
+        # Only one of the concurrent forks fetches, the others wait and read
+        lock_file = open(path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = self._read_cache(path, CS_CACHE_TTL[command])
+            if data is None:
+                data = fetch()
+                self._write_cache(path, data)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        return data
+
+
+    def invalidate_cache(self, command):
+        """Remove the cached results of command for this API endpoint of all accounts."""
+        if not self._is_cache_enabled(command):
+            return
+        for path in glob.glob(self._get_cache_path(command, None)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def _is_cache_enabled(self, command):
+        return command in CS_CACHE_TTL and self.module.params.get('api_cache')
+
+
+    def _get_cache_path(self, command, args):
+        cache_dir = os.path.expanduser(self.module.params.get('api_cache_dir'))
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir, 0o700)
+            except OSError as e:
+                # Created by a concurrent task meanwhile
+                if e.errno != errno.EEXIST:
+                    raise
+
+        endpoint_hash = hashlib.sha1(self.cs.endpoint.encode('utf-8')).hexdigest()
+        if args is None:
+            args_hash = '*.json'
+        else:
+            # Results depend on the account of the API key
+            key = json.dumps([self.cs.key, sorted(args.items())])
+            args_hash = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+        return os.path.join(cache_dir, '.'.join([endpoint_hash, command, args_hash]))
+
+
+    def _read_cache(self, path, ttl):
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def _write_cache(self, path, data):
+        # Write atomically, readers do not lock
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
+
+
+    def find_resource(self, command, key, value, match_keys, name_filter='name', fallback_scan=False, **args):
+        """Return the first record of a list API call having value in one of match_keys.
+
+        The API is asked to filter by id if value looks like a UUID, then by
+        name_filter. The full list is only scanned if there is no name_filter,
+        the API rejects it or fallback_scan is set.
+        """
+        if not value:
+            return None
+
+        filters = []
+        if CS_UUID_RE.match(value):
+            filters.append({'id': value})
+        if name_filter:
+            filters.append({name_filter: value})
+        if fallback_scan or not name_filter:
+            filters.append({})
+
+        # filters may grow by a scan while iterating
+        for f in filters:
+            filter_args = args.copy()
+            filter_args.update(f)
+            try:
+                for r in self.iter_list(command, key, **filter_args):
+                    if value in [ r.get(k) for k in match_keys ]:
+                        return r
+            except CloudStackException:
+                # API returns an error for ids of not existing resources
+                if not f:
+                    raise
+                if 'id' not in f and {} not in filters:
+                    filters.append({})
+        return None
+
+
     def get_capabilities(self, key=None):
         if self.capabilities:
             return self._get_by_key(key, self.capabilities)
-        capabilities = self.cs.listCapabilities()
+        capabilities = self.get_cached('listCapabilities', self.cs.listCapabilities)
         self.capabilities = capabilities['capability']
         return self._get_by_key(key, self.capabilities)
 
@@ -536,17 +1026,113 @@ class AnsibleCloudStack(object):
 
 
     def poll_job(self, job=None, key=None):
-        if 'jobid' in job:
-            while True:
-                res = self.cs.queryAsyncJobResult(jobid=job['jobid'])
+        return self.poll_jobs([job], key=key)[0]
+
+
+    def poll_jobs(self, jobs, key=None, fail_on_error=True):
+        """Wait for all async jobs and return their results in the order of jobs.
+
+        Unless fail_on_error, the result of a failed job is its job result
+        having the errortext.
+        """
+        results = list(jobs)
+        pending = {}
+        for i, job in enumerate(jobs):
+            if job and 'jobid' in job:
+                pending[job['jobid']] = i
+
+        poll_timeout = self.module.params.get('api_poll_timeout')
+        start = time.time()
+        interval = CS_POLL_INTERVAL_INITIAL
+        startdate = None
+        while pending:
+            self._poll_sleep(self._get_poll_jitter(interval))
+            cmds = []
+            jobs, startdate = self._query_async_jobs(sorted(pending, key=pending.get), startdate)
+            for jobid, res in jobs.iteritems():
                 if res['jobstatus'] != 0 and 'jobresult' in res:
+                    i = pending.pop(jobid)
                     if 'errortext' in res['jobresult']:
-                        self.module.fail_json(msg="Failed: '%s'" % res['jobresult']['errortext'])
-                    if key and key in res['jobresult']:
-                        job = res['jobresult'][key]
-                    break
-                time.sleep(2)
-        return job
+                        if fail_on_error:
+                            self.module.fail_json(msg="Failed: '%s'" % res['jobresult']['errortext'])
+                        results[i] = res['jobresult']
+                    elif key and key in res['jobresult']:
+                        results[i] = res['jobresult'][key]
+                else:
+                    cmds.append(res.get('cmd'))
+
+            if not pending:
+                break
+
+            elapsed = time.time() - start
+            if poll_timeout and elapsed >= poll_timeout:
+                self.module.fail_json(msg="Timeout after %ss while waiting for job '%s'" % (poll_timeout, "', '".join(pending.keys())))
+            interval = self._get_poll_interval(interval, elapsed, cmds)
+
+            # Never sleep beyond the deadline
+            if poll_timeout:
+                interval = min(interval, poll_timeout - elapsed)
+        return results
+
+
+    def _poll_sleep(self, seconds):
+        time.sleep(seconds)
+        if self.stats:
+            self.stats.add_poll_sleep(seconds)
+
+
+    def _query_async_jobs(self, jobids, startdate=None):
+        """Return the jobs by jobid and the startdate listing them.
+
+        jobids are in the order the jobs were submitted. Unless startdate is
+        known, the first job is queried to tell when the jobs were created.
+        """
+        jobs = {}
+        if len(jobids) == 1 or not startdate:
+            jobs[jobids[0]] = self.cs.queryAsyncJobResult(jobid=jobids[0])
+            startdate = startdate or self._get_async_jobs_startdate(jobs[jobids[0]])
+
+        # Resolve the other jobs by listing only the recent jobs, page by page
+        if len(jobids) > len(jobs) and startdate:
+            for job in self.iter_list('listAsyncJobs', 'asyncjobs', startdate=startdate):
+                if job['jobid'] in jobids:
+                    jobs[job['jobid']] = job
+                    if len(jobs) == len(jobids):
+                        break
+
+        # Jobs not listed, e.g. of another account, are queried one by one
+        for jobid in jobids:
+            if jobid not in jobs:
+                jobs[jobid] = self.cs.queryAsyncJobResult(jobid=jobid)
+        return jobs, startdate
+
+
+    def _get_async_jobs_startdate(self, job):
+        # created is like 2016-02-10T10:25:47+0100, in the time zone of the API
+        created = (job or {}).get('created') or ''
+        try:
+            timestamp = calendar.timegm(time.strptime(created[:19], '%Y-%m-%dT%H:%M:%S'))
+        except ValueError:
+            return None
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp - CS_ASYNC_JOBS_SLACK)) + created[19:]
+
+
+    def _get_poll_interval(self, interval, elapsed, cmds=None):
+        interval_max = self.module.params.get('api_poll_interval_max') or CS_POLL_INTERVAL_MAX
+        interval = interval * CS_POLL_INTERVAL_FACTOR
+
+        # Wait about half of the remaining expected duration for known slow jobs
+        hints = [CS_ASYNC_JOB_DURATION_HINTS.get(cmd.split('.')[-1]) for cmd in cmds or [] if cmd]
+        if hints and None not in hints:
+            hint = min(hints)
+            if elapsed < hint:
+                interval = max(interval, (hint - elapsed) / 2.0)
+        return min(interval, interval_max)
+
+
+    def _get_poll_jitter(self, interval):
+        # Spread the polls of concurrent tasks, keep at least half the interval
+        return interval / 2.0 + random.uniform(0, interval / 2.0)
 
 
     def get_result(self, resource):
@@ -570,6 +1156,9 @@ class AnsibleCloudStack(object):
                     result_tag['key']   = tag['key']
                     result_tag['value'] = tag['value']
                     self.result['tags'].append(result_tag)
+
+        if self.stats and self.module.params.get('api_stats'):
+            self.result['api_stats'] = self.stats.get_summary()
         return self.result
 
 
@@ -598,13 +1187,11 @@ class AnsibleCloudStackAccount(AnsibleCloudStack):
             args                = {}
             args['listall']     = True
             args['domainid']    = self.get_domain('id')
-            accounts = self.cs.listAccounts(**args)
-            if accounts:
-                account_name = self.module.params.get('name')
-                for a in accounts['account']:
-                    if account_name in [ a['name'] ]:
-                        self.account = a
-                        break
+            account_name = self.module.params.get('name')
+            for a in self.iter_list('listAccounts', 'account', **args):
+                if account_name in [ a['name'] ]:
+                    self.account = a
+                    break
 
         return self.account
 
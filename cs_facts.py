@@ -41,6 +41,53 @@ options:
       - cloudstack_local_ipv4
       - cloudstack_instance_id
       - cloudstack_user_data
+  timeout:
+    description:
+      - Timeout in seconds of each request to the metadata API.
+    required: false
+    default: 10
+  cache_ttl:
+    description:
+      - Seconds the facts from the metadata API are cached on the instance, C(0) disables the cache.
+      - Cached facts are used after fetching the instance id, which must not have changed.
+      - Does not apply to C(cloudstack_user_data), see C(user_data_cache_ttl).
+    required: false
+    default: 0
+  user_data_cache_ttl:
+    description:
+      - Seconds the user data is cached on the instance, C(0) disables the cache.
+      - Cached user data is used after fetching the instance id, which must not have changed.
+    required: false
+    default: 0
+  user_data_max_size:
+    description:
+      - Maximum size in bytes of the user data, fetched and after decompression, C(0) disables the limit.
+      - The module fails on larger user data.
+    required: false
+    default: 1048576
+  user_data_key:
+    description:
+      - Dot separated path of the part of the user data returned, e.g. C(ansible.vars).
+      - C(cloudstack_user_data) is null if the path does not exist.
+    required: false
+    default: null
+  cache_dir:
+    description:
+      - Directory of the cache, also remembering the IP of the metadata API across calls.
+      - The remembered IP is looked up again if it is not reachable.
+    required: false
+    default: /var/cache/ansible/cs_facts
+  interface:
+    description:
+      - Interface the instance got its DHCP lease on, skips looking up the interface of the default route.
+    required: false
+    default: null
+  gather_host_facts:
+    description:
+      - Whether the interface of the default route is looked up by gathering the facts of the host.
+      - By default it is read from C(/proc/net/route), or the lease file is looked up without an interface.
+    required: false
+    default: false
 requirements: [ 'yaml' ]
 '''
 
@@ -52,6 +99,18 @@ EXAMPLES = '''
 # Gather specific fact on instances
 - name: Gather cloudstack facts
   cs_facts: filter=cloudstack_instance_id
+
+# Gather facts cached for a day, only the instance id is fetched on repeats
+- name: Gather cloudstack facts
+  cs_facts: cache_ttl=86400 user_data_cache_ttl=3600
+
+# Gather facts using the lease of a given interface
+- name: Gather cloudstack facts
+  cs_facts: interface=eth1
+
+# Gather only a part of large user data
+- name: Gather cloudstack facts
+  cs_facts: filter=cloudstack_user_data user_data_key=ansible.vars
 '''
 
 RETURN = '''
@@ -92,28 +151,73 @@ cloudstack_service_offering:
   type: string
   sample: Micro 512mb 1cpu
 cloudstack_user_data:
-  description: data of the instance provided by users.
+  description: data of the instance provided by users, parsed from JSON or YAML, also if gzipped or in a MIME multipart message.
   returned: success
   type: dict
   sample: { "bla": "foo" }
 '''
 
+import email
+import glob
 import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 try:
     import yaml
+    # The C loader is much faster on large user data
+    CS_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     has_lib_yaml = True
 except ImportError:
     has_lib_yaml = False
 
-CS_METADATA_BASE_URL = "http://%s/latest/meta-data"
-CS_USERDATA_BASE_URL = "http://%s/latest/user-data"
+CS_METADATA_PATH = "/latest/meta-data/%s"
+CS_USERDATA_PATH = "/latest/user-data"
+
+# Parts of multipart user data parsed, cloud-init shell scripts and includes are no data
+CS_USERDATA_TYPES = [
+    'text/cloud-config',
+    'text/yaml',
+    'text/x-yaml',
+    'application/x-yaml',
+    'application/json',
+    'text/json',
+    'application/gzip',
+    'application/x-gzip',
+]
+CS_USERDATA_MAX_DEPTH = 4
+
+# Metadata paths fetched at once, each thread keeps its connection alive
+CS_METADATA_WORKERS = 8
+
+# Fetched on timeouts and connection errors, unlike None of paths absent in the API
+CS_FETCH_FAILED = object()
 
 class CloudStackFacts(object):
 
     def __init__(self):
-        self.facts = ansible_facts(module)
         self.api_ip = None
+        self.instance_id = None
+        self.local = threading.local()
         self.fact_paths = {
             'cloudstack_service_offering':  'service-offering',
             'cloudstack_availability_zone': 'availability-zone',
@@ -128,41 +232,324 @@ class CloudStackFacts(object):
         result = {}
         filter = module.params.get('filter')
         if not filter:
-            for key,path in self.fact_paths.iteritems():
-                result[key] = self._fetch(CS_METADATA_BASE_URL + "/" + path)
-            result['cloudstack_user_data'] = self._get_user_data_json()
+            result = self._get_cached_meta_data()
+            user_data = self._get_cached_user_data()
+
+            # Fetch at once what is not cached, also facts missing in the cache
+            missing = [key for key in self.fact_paths if result is None or key not in result]
+            paths = {}
+            for key in missing:
+                if key != 'cloudstack_instance_id' or not self.instance_id:
+                    paths[key] = CS_METADATA_PATH % self.fact_paths[key]
+            if user_data is None:
+                paths['cloudstack_user_data'] = CS_USERDATA_PATH
+            fetched = self._fetch_all(paths)
+
+            if missing:
+                result = result or {}
+                for key in missing:
+                    result[key] = fetched.get(key)
+                if self.instance_id:
+                    result['cloudstack_instance_id'] = self.instance_id
+                failed = [key for key in missing if result[key] is CS_FETCH_FAILED]
+                for key in failed:
+                    result[key] = None
+                # Facts failed to fetch are not kept for the whole cache_ttl, facts absent in the API are
+                if not failed:
+                    self._write_meta_data_cache(result)
+            if user_data is not None:
+                result['cloudstack_user_data'] = self._get_user_data_json(user_data)
+            else:
+                user_data = fetched['cloudstack_user_data']
+                # Parsed first, user data over the size limit is not cached
+                result['cloudstack_user_data'] = self._get_user_data_json(self._or_none(user_data))
+                self._write_user_data_cache(user_data)
         else:
             if filter == 'cloudstack_user_data':
-                result['cloudstack_user_data'] = self._get_user_data_json()
+                user_data = self._get_cached_user_data()
+                if user_data is not None:
+                    result['cloudstack_user_data'] = self._get_user_data_json(user_data)
+                else:
+                    user_data = self._request(CS_USERDATA_PATH, module.params.get('user_data_max_size'))
+                    # Parsed first, user data over the size limit is not cached
+                    result['cloudstack_user_data'] = self._get_user_data_json(self._or_none(user_data))
+                    self._write_user_data_cache(user_data)
             elif filter in self.fact_paths:
-                result[filter] = self._fetch(CS_METADATA_BASE_URL + "/" + self.fact_paths[filter])
+                facts = self._get_cached_meta_data()
+                if facts is not None and filter in facts:
+                    result[filter] = facts[filter]
+                elif filter == 'cloudstack_instance_id' and self.instance_id:
+                    result[filter] = self.instance_id
+                else:
+                    result[filter] = self._fetch(CS_METADATA_PATH % self.fact_paths[filter])
         return result
 
 
-    def _get_user_data_json(self):
+    def _get_instance_id(self):
+        """Return the instance id, fetched once to validate the cache."""
+        if not self.instance_id:
+            self.instance_id = self._fetch(CS_METADATA_PATH % 'instance-id')
+        return self.instance_id
+
+
+    def _get_cached_meta_data(self):
+        cache_ttl = module.params.get('cache_ttl')
+        if not cache_ttl or not self._get_instance_id():
+            return None
+        data = self._read_cache('meta-data-%s.json' % self._to_safe(self.instance_id), cache_ttl)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+
+    def _write_meta_data_cache(self, facts):
+        if not module.params.get('cache_ttl') or not self.instance_id:
+            return
+        if facts['cloudstack_instance_id'] != self.instance_id:
+            return
+        self._write_cache('meta-data-%s.json' % self._to_safe(self.instance_id), json.dumps(facts))
+
+
+    def _get_cached_user_data(self):
+        cache_ttl = module.params.get('user_data_cache_ttl')
+        if not cache_ttl or not self._get_instance_id():
+            return None
+        return self._read_cache('user-data-%s' % self._to_safe(self.instance_id), cache_ttl)
+
+
+    def _write_user_data_cache(self, user_data):
+        if not module.params.get('user_data_cache_ttl') or not self.instance_id or user_data is CS_FETCH_FAILED:
+            return
+        # Absent user data is cached empty, parsed to None
+        self._write_cache('user-data-%s' % self._to_safe(self.instance_id), user_data or '')
+
+
+    def _to_safe(self, name):
+        return re.sub(r'[^A-Za-z0-9-]', '_', name)
+
+
+    def _read_cache(self, name, cache_ttl=None):
+        cache_file = os.path.join(module.params.get('cache_dir'), name)
         try:
-            # this data come form users, we try what we can to parse it...
-            return yaml.load(self._fetch(CS_USERDATA_BASE_URL))
-        except:
+            if cache_ttl and time.time() - os.path.getmtime(cache_file) > cache_ttl:
+                return None
+            f = open(cache_file, 'rb')
+            try:
+                return f.read()
+            finally:
+                f.close()
+        except (IOError, OSError):
             return None
 
 
-    def _fetch(self, path):
+    def _write_cache(self, name, data):
+        cache_dir = module.params.get('cache_dir')
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, 0o700)
+            # Written atomically, concurrent runs read either version
+            fd, tmp_file = tempfile.mkstemp(dir=cache_dir)
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmp_file, os.path.join(cache_dir, name))
+        except (IOError, OSError):
+            # The cache is optional, e.g. cache_dir may not be writable
+            pass
+
+
+    def _get_user_data_json(self, user_data):
+        """Return the parsed user data, or its part at user_data_key."""
+        if user_data is None:
+            return None
+        data = self._decode_user_data(user_data)
+        key = module.params.get('user_data_key')
+        if key:
+            for name in key.split('.'):
+                if isinstance(data, dict):
+                    data = data.get(name)
+                elif isinstance(data, list) and name.isdigit() and int(name) < len(data):
+                    data = data[int(name)]
+                else:
+                    return None
+        return data
+
+
+    def _decode_user_data(self, user_data, depth=0):
+        """Return data parsed by the type detected, None if not parsable."""
+        self._check_user_data_size(user_data)
+        # Gzip and multipart nest, but not endlessly in user data of any use
+        if depth > CS_USERDATA_MAX_DEPTH:
+            return None
+        # this data come form users, we try what we can to parse it...
+        if user_data[:2] == '\x1f\x8b':
+            try:
+                return self._decode_user_data(self._gunzip(user_data), depth + 1)
+            except zlib.error:
+                return None
+        if re.match(r'(content-type|mime-version):', user_data[:64], re.IGNORECASE):
+            message = email.message_from_string(user_data)
+            if message.is_multipart():
+                return self._decode_multipart(message, depth + 1)
+        if user_data.lstrip()[:1] in ('{', '['):
+            try:
+                return json.loads(user_data)
+            except ValueError:
+                pass
+        try:
+            return yaml.load(user_data, Loader=CS_YAML_LOADER)
+        except yaml.YAMLError:
+            return None
+
+
+    def _decode_multipart(self, message, depth):
+        """Return the data of the first parsable part."""
+        for part in message.walk():
+            if part.is_multipart() or part.get_content_type() not in CS_USERDATA_TYPES:
+                continue
+            payload = part.get_payload(decode=True)
+            if payload:
+                data = self._decode_user_data(payload, depth)
+                if data is not None:
+                    return data
+        return None
+
+
+    def _gunzip(self, user_data):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        max_size = module.params.get('user_data_max_size')
+        if not max_size:
+            return decompressor.decompress(user_data)
+        # Stops past the limit, a small gzip may decompress to a huge size
+        return decompressor.decompress(user_data, max_size + 1)
+
+
+    def _check_user_data_size(self, user_data):
+        max_size = module.params.get('user_data_max_size')
+        if max_size and len(user_data) > max_size:
+            module.fail_json(msg="User data is larger than user_data_max_size of %d bytes." % max_size)
+
+
+    def _fetch_all(self, paths):
+        """Return the data of each of paths, fetched at once."""
+        if not paths:
+            return {}
+        # Looked up before, threads must not fail the module
+        if not self._get_api_ip():
+            return dict((key, CS_FETCH_FAILED) for key in paths)
+
+        queue = Queue()
+        for key, path in paths.iteritems():
+            queue.put((key, path))
+        result = dict((key, None) for key in paths)
+
+        def worker():
+            while True:
+                try:
+                    key, path = queue.get_nowait()
+                except Empty:
+                    break
+                if path == CS_USERDATA_PATH:
+                    result[key] = self._request(path, module.params.get('user_data_max_size'))
+                else:
+                    result[key] = self._request(path)
+            self._close_connection()
+
+        threads = []
+        for i in range(min(CS_METADATA_WORKERS, len(paths))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return result
+
+
+    def _fetch(self, path, max_size=None):
+        return self._or_none(self._request(path, max_size))
+
+
+    def _or_none(self, data):
+        if data is CS_FETCH_FAILED:
+            return None
+        return data
+
+
+    def _request(self, path, max_size=None):
+        """Return the data of path, None if absent, CS_FETCH_FAILED if not fetched."""
         api_ip = self._get_api_ip()
         if not api_ip:
+            return CS_FETCH_FAILED
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = httplib.HTTPConnection(api_ip, timeout=module.params.get('timeout'))
+                self.local.connection = connection
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                if max_size:
+                    # Read one byte more to tell a larger response
+                    data = response.read(max_size + 1)
+                    if len(data) > max_size:
+                        # Not read to its end, the connection can not be reused
+                        self._close_connection()
+                else:
+                    data = response.read()
+            except socket.timeout:
+                self._close_connection()
+                return CS_FETCH_FAILED
+            except (httplib.HTTPException, socket.error):
+                # The server may have closed the kept alive connection, try a new one
+                self._close_connection()
+                continue
+            if response.status != 200:
+                return None
+            return data
+        return CS_FETCH_FAILED
+
+
+    def _close_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+    def _get_default_interface(self):
+        """Return the interface of the default route."""
+        if module.params.get('interface'):
+            return module.params.get('interface')
+        if module.params.get('gather_host_facts'):
+            facts = ansible_facts(module)
+            return facts['default_ipv4']['interface']
+        try:
+            f = open('/proc/net/route')
+        except IOError:
             return None
-        api_url = path % api_ip
-        (response, info) = fetch_url(module, api_url, force=True)
-        if response:
-            data = response.read()
-        else:
-            data = None
-        return data
+        try:
+            for line in f.readlines()[1:]:
+                # Iface Destination Gateway Flags ..., default route to 00000000 being up
+                fields = line.split()
+                if len(fields) > 3 and fields[1] == '00000000' and int(fields[3], 16) & 1:
+                    return fields[0]
+        finally:
+            f.close()
+        return None
 
 
     def _get_dhcp_lease_file(self):
         """Return the path of the lease file."""
-        default_iface = self.facts['default_ipv4']['interface']
+        default_iface = self._get_default_interface()
+        if not default_iface:
+            # No routing table, e.g. on BSDs, look up the lease of any interface
+            default_iface = '*'
         dhcp_lease_file_locations = [
             '/var/lib/dhcp/dhclient.%s.leases' % default_iface, # debian / ubuntu
             '/var/lib/dhclient/dhclient-%s.leases' % default_iface, # centos 6
@@ -170,13 +557,21 @@ class CloudStackFacts(object):
             '/var/db/dhclient.leases.%s' % default_iface, # openbsd
         ]
         for file_path in dhcp_lease_file_locations:
-            if os.path.exists(file_path):
-                return file_path
+            file_paths = glob.glob(file_path)
+            if file_paths:
+                # The most recent lease
+                return max(file_paths, key=os.path.getmtime)
+        if default_iface == '*':
+            module.fail_json(msg="Could not find dhclient leases file, set interface or gather_host_facts=yes.")
         module.fail_json(msg="Could not find dhclient leases file.")
 
 
     def _get_api_ip(self):
         """Return the IP of the DHCP server."""
+        if not self.api_ip:
+            api_ip = self._read_cache('api-ip')
+            if api_ip and self._connect(api_ip):
+                self.api_ip = api_ip
         if not self.api_ip:
             dhcp_lease_file = self._get_dhcp_lease_file()
             for line in open(dhcp_lease_file):
@@ -187,9 +582,23 @@ class CloudStackFacts(object):
                     break
             if not self.api_ip:
                 module.fail_json(msg="No dhcp-server-identifier found in leases file.")
+            self._write_cache('api-ip', self.api_ip)
         return self.api_ip
 
 
+    def _connect(self, api_ip):
+        """Return whether a remembered IP is still reachable, keeping the connection."""
+        self._close_connection()
+        connection = httplib.HTTPConnection(api_ip, timeout=module.params.get('timeout'))
+        try:
+            connection.connect()
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            return False
+        self.local.connection = connection
+        return True
+
+
 def main():
     global module
     module = AnsibleModule(
@@ -204,6 +613,14 @@ def main():
                 'cloudstack_instance_id',
                 'cloudstack_user_data',
             ]),
+            timeout = dict(type='int', default=10),
+            cache_ttl = dict(type='int', default=0),
+            user_data_cache_ttl = dict(type='int', default=0),
+            cache_dir = dict(default='/var/cache/ansible/cs_facts'),
+            interface = dict(default=None),
+            gather_host_facts = dict(type='bool', default=False),
+            user_data_max_size = dict(type='int', default=1048576),
+            user_data_key = dict(default=None),
         ),
         supports_check_mode=False
     )
@@ -216,7 +633,6 @@ def main():
     module.exit_json(**cs_facts_result)
 
 from ansible.module_utils.basic import *
-from ansible.module_utils.urls import *
 from ansible.module_utils.facts import *
 if __name__ == '__main__':
     main()
@@ -30,10 +30,38 @@ options:
   name:
     description:
       - Host name of the instance. C(name) can only contain ASCII letters.
-    required: true
+      - With C(count), pattern of the host names numbered from C(count_start), e.g. C(web-%02d). Without a C(%), C(-%d) is appended.
+      - Required if C(names) is not set.
+    required: false
+    default: null
+  names:
+    description:
+      - Host names of instances deployed in bulk, see C(count).
+      - Mutually exclusive with C(name) and C(count).
+    required: false
+    default: null
+  count:
+    description:
+      - Number of instances named by the pattern in C(name) deployed in bulk, at least 1.
+      - The zone, template, offerings and networks are resolved once, the missing instances are deployed concurrently and their jobs awaited together.
+      - Existing instances are updated like a single one, e.g. in service offering or group, started or stopped as C(state) requires, their jobs awaited together, and tagged by C(tags).
+      - Only for C(state=present), C(deployed), C(started) and C(stopped), not with C(ip_address), C(ip6_address) or C(ip_to_networks).
+    required: false
+    default: null
+  count_start:
+    description:
+      - First number of the host names of C(count), also the number of the first of C(names) in C(display_name).
+    required: false
+    default: 1
+  deploy_concurrency:
+    description:
+      - Number of instances of C(count) or C(names) deployed at a time, at least 1.
+    required: false
+    default: 10
   display_name:
     description:
       - Custom display name of the instances.
+      - With C(count) or C(names), a pattern like C(name), otherwise the host name is used.
     required: false
     default: null
   group:
@@ -247,6 +275,16 @@ EXAMPLES = '''
       - {'network': NetworkA, 'ip': '10.1.1.1'}
       - {'network': NetworkB, 'ip': '192.168.1.1'}
 
+# Deploy web-01 up to web-20 at once, existing ones are left as they are
+- local_action:
+    module: cs_instance
+    name: web-%02d
+    count: 20
+    template: Linux Debian 7 64-bit
+    service_offering: Tiny
+    tags:
+      - { key: role, value: web }
+
 # Ensure a instance has stopped
 - local_action: cs_instance name=web-vm-1 state=stopped
 
@@ -374,10 +412,20 @@ instance_name:
   returned: success
   type: string
   sample: i-44-3992-VM
+instances:
+  description: Instances of C(count) or C(names), each having the returns of a single instance, C(changed) and on failure C(failed) and C(msg).
+  returned: success and failure, if count or names is set
+  type: list
+  sample: '[ { "name": "web-01", "id": "04589590-ac63-4ffc-93f5-b698b8ac38b6", "state": "Running", "changed": true } ]'
 '''
 
 import base64
 
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
 try:
     from cs import CloudStack, CloudStackException, read_config
     has_lib_cs = True
@@ -385,6 +433,88 @@ except ImportError:
     has_lib_cs = False
 
 # import cloudstack common
+import calendar
+import copy
+import errno
+import fcntl
+import glob
+import hashlib
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    # requests comes with the cs library, see has_lib_cs
+    requests = None
+
+# Polling of async jobs starts fast and backs off exponentially up to
+# api_poll_interval_max seconds.
+CS_POLL_INTERVAL_INITIAL = 0.1
+CS_POLL_INTERVAL_FACTOR = 2
+CS_POLL_INTERVAL_MAX = 5
+
+# Several jobs are polled by listing the jobs created since the first of them,
+# less some seconds for the clock of the API, see AnsibleCloudStack.poll_jobs
+CS_ASYNC_JOBS_SLACK = 60
+
+# Page size used to walk list API calls, unless set by api_page_size. Lowered
+# to the limit of the API if it rejects the size, see AnsibleCloudStack.iter_list
+CS_LIST_PAGE_SIZE = 500
+CS_PAGE_SIZE_LIMIT_RE = re.compile(r'max allowed page size value: (\d+)')
+
+# Values looking like this are looked up by id in the API
+CS_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+# Expected duration in seconds of slow async jobs, keyed by the command class
+# name returned in the 'cmd' of the job. Used as hint to not poll too often
+# before the job is expected to be done.
+CS_ASYNC_JOB_DURATION_HINTS = {
+    'DeployVMCmd':              20,
+    'StartVMCmd':               10,
+    'StopVMCmd':                10,
+    'RebootVMCmd':              10,
+    'RestoreVMCmd':             20,
+    'DestroyVMCmd':             5,
+    'ExpungeVMCmd':             5,
+    'ScaleVMCmd':               10,
+    'CreateTemplateCmd':        60,
+    'CopyTemplateCmd':          60,
+    'CreateSnapshotCmd':        30,
+    'CreateVMSnapshotCmd':      20,
+    'RevertToVMSnapshotCmd':    20,
+    'AttachVolumeCmd':          5,
+    'DetachVolumeCmd':          5,
+    'ResizeVolumeCmd':          10,
+    'CreateNetworkCmd':         5,
+    'RestartNetworkCmd':        30,
+}
+
+
+# Seconds the results of nearly static list API calls are cached on disk,
+# if api_cache is enabled.
+CS_CACHE_TTL = {
+    'listZones':            3600,
+    'listDomains':          300,
+    'listOsTypes':          86400,
+    'listHypervisors':      86400,
+    'listCapabilities':     3600,
+    'listServiceOfferings': 900,
+    'listDiskOfferings':    900,
+}
+
+
 def cs_argument_spec():
     return dict(
         api_key = dict(default=None),
@@ -392,12 +522,245 @@ def cs_argument_spec():
         api_url = dict(default=None),
         api_http_method = dict(choices=['get', 'post'], default='get'),
         api_timeout = dict(type='int', default=10),
+        api_poll_timeout = dict(type='int', default=None),
+        api_poll_interval_max = dict(type='float', default=CS_POLL_INTERVAL_MAX),
+        api_cache = dict(choices=BOOLEANS, default=False),
+        api_cache_dir = dict(default='~/.ansible/cloudstack_cache'),
+        api_page_size = dict(type='int', default=CS_LIST_PAGE_SIZE),
+        api_pool_size = dict(type='int', default=10),
+        api_retries = dict(type='int', default=0),
+        api_stats = dict(choices=BOOLEANS, default=False),
+        api_trace_file = dict(default=None),
         api_region = dict(default='cloudstack'),
     )
 
 def cs_required_together():
     return [['api_key', 'api_secret', 'api_url']]
 
+def cs_session(pool_size=10, retries=0):
+    """Return a HTTP session keeping connections to the API alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Some versions of the cs library close the session after each request
+    session.close = lambda: None
+    return session
+
+
+def cs_client(session, **config):
+    """Return a CloudStack client sending its requests through session."""
+    try:
+        return CloudStack(session=session, **config)
+    except TypeError:
+        pass
+
+    # cs library without session support uses the requests module directly,
+    # it is replaced by a stand-in sending through the session of the client
+    cs = CloudStack(**config)
+    request = cs._request
+
+    def _request(*args, **kwargs):
+        module = sys.modules[CloudStack.__module__]
+        if not isinstance(module.requests, CloudStackRequests):
+            module.requests = CloudStackRequests()
+        local = module.requests.local
+        previous = getattr(local, 'session', None)
+        local.session = session
+        try:
+            return request(*args, **kwargs)
+        finally:
+            local.session = previous
+    cs._request = _request
+    return cs
+
+
+class CloudStackRequests(object):
+    """Stand-in for the requests module in the cs library, sending the
+    requests of a client through the session of that client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+    def Session(self):
+        return getattr(self.local, 'session', None) or requests.Session()
+
+
+    def get(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).get(*args, **kwargs)
+
+
+    def post(self, *args, **kwargs):
+        return (getattr(self.local, 'session', None) or requests).post(*args, **kwargs)
+
+
+class CloudStackPrefetchError(Exception):
+    pass
+
+
+class CloudStackModule(object):
+    """Proxy of the AnsibleModule raising the failures of lookups run by
+    threads of AnsibleCloudStack.prefetch, which must not exit the module."""
+
+    def __init__(self, module):
+        self.module = module
+        self.prefetching = threading.local()
+
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+    def fail_json(self, **kwargs):
+        if getattr(self.prefetching, 'active', False):
+            raise CloudStackPrefetchError(kwargs.get('msg'))
+        self.module.fail_json(**kwargs)
+
+
+class CloudStackStats(object):
+    """Proxy of the CloudStack client recording the API calls made, the HTTP
+    responses of a call are recorded by a wrapper of the send of the session,
+    as the cs library sends prepared requests without the session hooks."""
+
+    def __init__(self, cs, session, trace_file=None):
+        self.cs = cs
+        self.trace_file = trace_file
+        self.commands = {}
+        self.poll_sleep = 0.0
+        self.lock = threading.Lock()
+        # Calls may run concurrently, see AnsibleCloudStack.prefetch
+        self.current = threading.local()
+        send = session.send
+
+        def recording_send(request, **kwargs):
+            response = send(request, **kwargs)
+            self._record_response(response)
+            return response
+        session.send = recording_send
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.cs, name)
+        if not callable(attr):
+            return attr
+
+        def handler(**args):
+            record = {
+                'command':  name,
+                'args':     hashlib.sha1(repr(sorted(args.items())).encode('utf-8')).hexdigest()[:12],
+                'requests': 0,
+                'bytes':    0,
+                'retries':  0,
+            }
+            self.current.record = record
+            start = time.time()
+            try:
+                return attr(**args)
+            finally:
+                record['duration'] = time.time() - start
+                self.current.record = None
+                self._add(record)
+        return handler
+
+
+    def _record_response(self, response):
+        record = getattr(self.current, 'record', None)
+        if record is not None:
+            # Every request after the first one is a retry of the cs library
+            if record['requests']:
+                record['retries'] += 1
+            record['requests'] += 1
+            record['bytes'] += len(response.content)
+
+            # Retries of the connection pool
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None and retries.history:
+                record['retries'] += len(retries.history)
+
+
+    def _add(self, record):
+        with self.lock:
+            stats = self.commands.setdefault(record['command'], {
+                'calls':    0,
+                'duration': 0.0,
+                'bytes':    0,
+                'retries':  0,
+            })
+            stats['calls'] += 1
+            stats['duration'] += record['duration']
+            stats['bytes'] += record['bytes']
+            stats['retries'] += record['retries']
+
+            if self.trace_file:
+                record['time'] = time.time()
+                record['pid'] = os.getpid()
+                record['module'] = os.path.basename(sys.argv[0])
+                with open(os.path.expanduser(self.trace_file), 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+    def add_poll_sleep(self, seconds):
+        with self.lock:
+            self.poll_sleep += seconds
+
+
+    def get_summary(self):
+        summary = {
+            'calls':        0,
+            'duration':     0.0,
+            'bytes':        0,
+            'retries':      0,
+            'poll_sleep':   round(self.poll_sleep, 3),
+            'commands':     {},
+        }
+        for command, stats in self.commands.iteritems():
+            for key in ['calls', 'duration', 'bytes', 'retries']:
+                summary[key] += stats[key]
+            summary['commands'][command] = dict(stats, duration=round(stats['duration'], 3))
+        summary['duration'] = round(summary['duration'], 3)
+        return summary
+
+
+class CloudStackMemo(object):
+    """Proxy of the CloudStack client returning results of identical list
+    calls from memory. The memo is cleared by any other command, as changes
+    on a resource also show up in the lists of related ones (e.g. tags, nics).
+    """
+
+    # Read-only, always asked live as their results change without a command
+    # of ours, but not clearing the memo either (nor do get* commands)
+    uncached_commands = [ 'listAsyncJobs', 'queryAsyncJobResult' ]
+
+    def __init__(self, cs):
+        self.cs = cs
+        self.memo = {}
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.cs, name)
+        if not callable(attr):
+            return attr
+
+        def handler(**args):
+            if name in self.uncached_commands or name.startswith('get'):
+                return attr(**args)
+            if not name.startswith('list'):
+                self.memo = {}
+                return attr(**args)
+
+            key = (name, repr(sorted(args.items())))
+            if key not in self.memo:
+                self.memo[key] = attr(**args)
+            # Callers modify results in place
+            return copy.deepcopy(self.memo[key])
+        return handler
+
+
 class AnsibleCloudStack(object):
 
     def __init__(self, module):
@@ -429,7 +792,7 @@ class AnsibleCloudStack(object):
         # these values will be casted to int
         self.returns_to_int = {}
 
-        self.module = module
+        self.module = CloudStackModule(module)
         self._connect()
 
         self.domain = None
@@ -451,8 +814,14 @@ class AnsibleCloudStack(object):
         api_http_method = self.module.params.get('api_http_method')
         api_timeout = self.module.params.get('api_timeout')
 
+        session = cs_session(
+            pool_size=self.module.params.get('api_pool_size') or 1,
+            retries=self.module.params.get('api_retries') or 0,
+            )
+
         if api_key and api_secret and api_url:
-            self.cs = CloudStack(
+            cs = cs_client(
+                session,
                 endpoint=api_url,
                 key=api_key,
                 secret=api_secret,
@@ -461,7 +830,14 @@ class AnsibleCloudStack(object):
                 )
         else:
             api_region = self.module.params.get('api_region', 'cloudstack')
-            self.cs = CloudStack(**read_config(api_region))
+            cs = cs_client(session, **read_config(api_region))
+
+        self.stats = None
+        api_trace_file = self.module.params.get('api_trace_file')
+        if self.module.params.get('api_stats') or api_trace_file:
+            self.stats = CloudStackStats(cs, session, trace_file=api_trace_file)
+            cs = self.stats
+        self.cs = CloudStackMemo(cs)
 
 
     def get_or_fallback(self, key=None, fallback_key=None):
@@ -521,12 +897,10 @@ class AnsibleCloudStack(object):
         args = {}
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
-        projects = self.cs.listProjects(**args)
-        if projects:
-            for p in projects['project']:
-                if project.lower() in [ p['name'].lower(), p['id'] ]:
-                    self.project = p
-                    return self._get_by_key(key, self.project)
+        for p in self.iter_list('listProjects', 'project', **args):
+            if project.lower() in [ p['name'].lower(), p['id'] ]:
+                self.project = p
+                return self._get_by_key(key, self.project)
         self.module.fail_json(msg="project '%s' not found" % project)
 
 
@@ -543,13 +917,10 @@ class AnsibleCloudStack(object):
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
         args['projectid'] = self.get_project(key='id')
-        ip_addresses = self.cs.listPublicIpAddresses(**args)
-
-        if not ip_addresses:
-            self.module.fail_json(msg="IP address '%s' not found" % args['ipaddress'])
-
-        self.ip_address = ip_addresses['publicipaddress'][0]
-        return self._get_by_key(key, self.ip_address)
+        for ip in self.iter_list('listPublicIpAddresses', 'publicipaddress', **args):
+            self.ip_address = ip
+            return self._get_by_key(key, self.ip_address)
+        self.module.fail_json(msg="IP address '%s' not found" % args['ipaddress'])
 
 
     def get_vm(self, key=None):
@@ -560,17 +931,16 @@ class AnsibleCloudStack(object):
         if not vm:
             self.module.fail_json(msg="Virtual machine param 'vm' is required")
 
+        self.prefetch(self.get_project, self.get_zone)
+
         args = {}
         args['account'] = self.get_account(key='name')
         args['domainid'] = self.get_domain(key='id')
         args['projectid'] = self.get_project(key='id')
         args['zoneid'] = self.get_zone(key='id')
-        vms = self.cs.listVirtualMachines(**args)
-        if vms:
-            for v in vms['virtualmachine']:
-                if vm in [ v['name'], v['displayname'], v['id'] ]:
-                    self.vm = v
-                    return self._get_by_key(key, self.vm)
+        self.vm = self.find_resource('listVirtualMachines', 'virtualmachine', vm, ['name', 'displayname', 'id'], name_filter='keyword', **args)
+        if self.vm:
+            return self._get_by_key(key, self.vm)
         self.module.fail_json(msg="Virtual machine '%s' not found" % vm)
 
 
@@ -579,18 +949,11 @@ class AnsibleCloudStack(object):
             return self._get_by_key(key, self.zone)
 
         zone = self.module.params.get('zone')
-        zones = self.cs.listZones()
-
-        # use the first zone if no zone param given
-        if not zone:
-            self.zone = zones['zone'][0]
-            return self._get_by_key(key, self.zone)
-
-        if zones:
-            for z in zones['zone']:
-                if zone in [ z['name'], z['id'] ]:
-                    self.zone = z
-                    return self._get_by_key(key, self.zone)
+        for z in self.iter_list_cached('listZones', 'zone'):
+            # use the first zone if no zone param given
+            if not zone or zone in [ z['name'], z['id'] ]:
+                self.zone = z
+                return self._get_by_key(key, self.zone)
         self.module.fail_json(msg="zone '%s' not found" % zone)
 
 
@@ -602,12 +965,10 @@ class AnsibleCloudStack(object):
         if not os_type:
             return None
 
-        os_types = self.cs.listOsTypes()
-        if os_types:
-            for o in os_types['ostype']:
-                if os_type in [ o['description'], o['id'] ]:
-                    self.os_type = o
-                    return self._get_by_key(key, self.os_type)
+        for o in self.iter_list_cached('listOsTypes', 'ostype'):
+            if os_type in [ o['description'], o['id'] ]:
+                self.os_type = o
+                return self._get_by_key(key, self.os_type)
         self.module.fail_json(msg="OS type '%s' not found" % os_type)
 
 
@@ -616,7 +977,7 @@ class AnsibleCloudStack(object):
             return self.hypervisor
 
         hypervisor = self.module.params.get('hypervisor')
-        hypervisors = self.cs.listHypervisors()
+        hypervisors = self.get_cached('listHypervisors', self.cs.listHypervisors)
 
         # use the first hypervisor if no hypervisor param given
         if not hypervisor:
@@ -646,9 +1007,8 @@ class AnsibleCloudStack(object):
         args['name'] = account
         args['domainid'] = self.get_domain(key='id')
         args['listall'] = True
-        accounts = self.cs.listAccounts(**args)
-        if accounts:
-            self.account = accounts['account'][0]
+        for a in self.iter_list('listAccounts', 'account', **args):
+            self.account = a
             return self._get_by_key(key, self.account)
         self.module.fail_json(msg="Account '%s' not found" % account)
 
@@ -663,15 +1023,35 @@ class AnsibleCloudStack(object):
 
         args = {}
         args['listall'] = True
-        domains = self.cs.listDomains(**args)
-        if domains:
-            for d in domains['domain']:
-                if d['path'].lower() in [ domain.lower(), "root/" + domain.lower(), "root" + domain.lower() ]:
-                    self.domain = d
-                    return self._get_by_key(key, self.domain)
+        for d in self.iter_list_cached('listDomains', 'domain', **args):
+            if d['path'].lower() in [ domain.lower(), "root/" + domain.lower(), "root" + domain.lower() ]:
+                self.domain = d
+                return self._get_by_key(key, self.domain)
         self.module.fail_json(msg="Domain '%s' not found" % domain)
 
 
+    def prefetch(self, *lookups):
+        """Call independent lookups concurrently to have their results cached.
+
+        Lookups resolve what they depend on by their own, e.g. get_project
+        resolves the domain and account first. Errors are ignored here, the
+        lookup raises them again when called afterwards.
+        """
+        def run(lookup):
+            # Failures raise CloudStackPrefetchError in this thread only
+            self.module.prefetching.active = True
+            try:
+                lookup()
+            except Exception:
+                pass
+
+        threads = [ threading.Thread(target=run, args=(lookup,)) for lookup in lookups ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
     def get_tags(self, resource=None):
         if not self.tags:
             args = {}
@@ -679,8 +1059,7 @@ class AnsibleCloudStack(object):
             args['account'] = self.get_account(key='name')
             args['domainid'] = self.get_domain(key='id')
             args['resourceid'] = resource['id']
-            response = self.cs.listTags(**args)
-            self.tags = response.get('tag', [])
+            self.tags = list(self.iter_list('listTags', 'tag', **args))
 
         existing_tags = []
         if self.tags:
@@ -689,7 +1068,8 @@ class AnsibleCloudStack(object):
         return existing_tags
 
 
-    def _process_tags(self, resource, resource_type, tags, operation="create"):
+    def _process_tags(self, resource, resource_type, tags, operation="create", poll_async=True):
+        response = None
         if tags:
             self.result['changed'] = True
             if not self.module.check_mode:
@@ -701,7 +1081,9 @@ class AnsibleCloudStack(object):
                     response = self.cs.createTags(**args)
                 else:
                     response = self.cs.deleteTags(**args)
-                self.poll_job(response)
+                if poll_async:
+                    response = self.poll_job(response)
+        return response
 
 
     def _tags_that_should_exist_or_be_updated(self, resource, tags):
@@ -721,17 +1103,173 @@ class AnsibleCloudStack(object):
         if 'tags' in resource:
             tags = self.module.params.get('tags')
             if tags is not None:
-                self._process_tags(resource, resource_type, self._tags_that_should_not_exist(resource, tags), operation="delete")
-                self._process_tags(resource, resource_type, self._tags_that_should_exist_or_be_updated(resource, tags))
+                tags_to_delete = self._tags_that_should_not_exist(resource, tags)
+                tags_to_create = self._tags_that_should_exist_or_be_updated(resource, tags)
+
+                jobs = [self._process_tags(resource, resource_type, tags_to_delete, operation="delete", poll_async=False)]
+
+                # Updated tags must be deleted before they can be created again
+                if set(t['key'] for t in tags_to_delete) & set(t['key'] for t in tags_to_create):
+                    self.poll_jobs(jobs)
+                    jobs = []
+
+                jobs.append(self._process_tags(resource, resource_type, tags_to_create, poll_async=False))
+                self.poll_jobs(jobs)
                 self.tags = None
                 resource['tags'] = self.get_tags(resource)
         return resource
 
 
+    def iter_list(self, command, key, **args):
+        """Yield the records of a list API call, fetched lazily page by page."""
+        args['page'] = 1
+        args['pagesize'] = args.get('pagesize') or self.module.params.get('api_page_size') or CS_LIST_PAGE_SIZE
+        list_command = getattr(self.cs, command)
+        while True:
+            try:
+                res = list_command(**args)
+            except CloudStackException as e:
+                # The API limits the page size by its default.page.size, the
+                # response is in the error of newer cs libraries
+                limit = CS_PAGE_SIZE_LIMIT_RE.search(str(getattr(e, 'error', e)))
+                if not limit or int(limit.group(1)) >= args['pagesize'] or args['page'] != 1:
+                    raise
+                args['pagesize'] = int(limit.group(1))
+                continue
+            if not res or key not in res:
+                return
+            for item in res[key]:
+                yield item
+
+            # Last page reached
+            if len(res[key]) < args['pagesize'] or args['page'] * args['pagesize'] >= res.get('count', 0):
+                return
+            args['page'] += 1
+
+
+    def iter_list_cached(self, command, key, **args):
+        """Like iter_list, but served from the disk cache if api_cache is enabled."""
+        if not self._is_cache_enabled(command):
+            return self.iter_list(command, key, **args)
+        return iter(self.get_cached(command, lambda: list(self.iter_list(command, key, **args)), **args))
+
+
+    def get_cached(self, command, fetch, **args):
+        """Return the result of fetch(), cached on disk for the TTL of command."""
+        if not self._is_cache_enabled(command):
+            return fetch()
+
+        path = self._get_cache_path(command, args)
+        data = self._read_cache(path, CS_CACHE_TTL[command])
+        if data is not None:
+            return data
+
+        # Only one of the concurrent forks fetches, the others wait and read
+        lock_file = open(path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = self._read_cache(path, CS_CACHE_TTL[command])
+            if data is None:
+                data = fetch()
+                self._write_cache(path, data)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        return data
+
+
+    def invalidate_cache(self, command):
+        """Remove the cached results of command for this API endpoint of all accounts."""
+        if not self._is_cache_enabled(command):
+            return
+        for path in glob.glob(self._get_cache_path(command, None)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def _is_cache_enabled(self, command):
+        return command in CS_CACHE_TTL and self.module.params.get('api_cache')
+
+
+    def _get_cache_path(self, command, args):
+        cache_dir = os.path.expanduser(self.module.params.get('api_cache_dir'))
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir, 0o700)
+            except OSError as e:
+                # Created by a concurrent task meanwhile
+                if e.errno != errno.EEXIST:
+                    raise
+
+        endpoint_hash = hashlib.sha1(self.cs.endpoint.encode('utf-8')).hexdigest()
+        if args is None:
+            args_hash = '*.json'
+        else:
+            # Results depend on the account of the API key
+            key = json.dumps([self.cs.key, sorted(args.items())])
+            args_hash = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+        return os.path.join(cache_dir, '.'.join([endpoint_hash, command, args_hash]))
+
+
+    def _read_cache(self, path, ttl):
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def _write_cache(self, path, data):
+        # Write atomically, readers do not lock
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
+
+
+    def find_resource(self, command, key, value, match_keys, name_filter='name', fallback_scan=False, **args):
+        """Return the first record of a list API call having value in one of match_keys.
+
+        The API is asked to filter by id if value looks like a UUID, then by
+        name_filter. The full list is only scanned if there is no name_filter,
+        the API rejects it or fallback_scan is set.
+        """
+        if not value:
+            return None
+
+        filters = []
+        if CS_UUID_RE.match(value):
+            filters.append({'id': value})
+        if name_filter:
+            filters.append({name_filter: value})
+        if fallback_scan or not name_filter:
+            filters.append({})
+
+        # filters may grow by a scan while iterating
+        for f in filters:
+            filter_args = args.copy()
+            filter_args.update(f)
+            try:
+                for r in self.iter_list(command, key, **filter_args):
+                    if value in [ r.get(k) for k in match_keys ]:
+                        return r
+            except CloudStackException:
+                # API returns an error for ids of not existing resources
+                if not f:
+                    raise
+                if 'id' not in f and {} not in filters:
+                    filters.append({})
+        return None
+
+
     def get_capabilities(self, key=None):
         if self.capabilities:
             return self._get_by_key(key, self.capabilities)
-        capabilities = self.cs.listCapabilities()
+        capabilities = self.get_cached('listCapabilities', self.cs.listCapabilities)
         self.capabilities = capabilities['capability']
         return self._get_by_key(key, self.capabilities)
 
@@ -742,17 +1280,113 @@ class AnsibleCloudStack(object):
 
 
     def poll_job(self, job=None, key=None):
-        if 'jobid' in job:
-            while True:
-                res = self.cs.queryAsyncJobResult(jobid=job['jobid'])
+        return self.poll_jobs([job], key=key)[0]
+
+
+    def poll_jobs(self, jobs, key=None, fail_on_error=True):
+        """Wait for all async jobs and return their results in the order of jobs.
+
+        Unless fail_on_error, the result of a failed job is its job result
+        having the errortext.
+        """
+        results = list(jobs)
+        pending = {}
+        for i, job in enumerate(jobs):
+            if job and 'jobid' in job:
+                pending[job['jobid']] = i
+
+        poll_timeout = self.module.params.get('api_poll_timeout')
+        start = time.time()
+        interval = CS_POLL_INTERVAL_INITIAL
+        startdate = None
+        while pending:
+            self._poll_sleep(self._get_poll_jitter(interval))
+            cmds = []
+            jobs, startdate = self._query_async_jobs(sorted(pending, key=pending.get), startdate)
+            for jobid, res in jobs.iteritems():
                 if res['jobstatus'] != 0 and 'jobresult' in res:
+                    i = pending.pop(jobid)
                     if 'errortext' in res['jobresult']:
-                        self.module.fail_json(msg="Failed: '%s'" % res['jobresult']['errortext'])
-                    if key and key in res['jobresult']:
-                        job = res['jobresult'][key]
-                    break
-                time.sleep(2)
-        return job
+                        if fail_on_error:
+                            self.module.fail_json(msg="Failed: '%s'" % res['jobresult']['errortext'])
+                        results[i] = res['jobresult']
+                    elif key and key in res['jobresult']:
+                        results[i] = res['jobresult'][key]
+                else:
+                    cmds.append(res.get('cmd'))
+
+            if not pending:
+                break
+
+            elapsed = time.time() - start
+            if poll_timeout and elapsed >= poll_timeout:
+                self.module.fail_json(msg="Timeout after %ss while waiting for job '%s'" % (poll_timeout, "', '".join(pending.keys())))
+            interval = self._get_poll_interval(interval, elapsed, cmds)
+
+            # Never sleep beyond the deadline
+            if poll_timeout:
+                interval = min(interval, poll_timeout - elapsed)
+        return results
+
+
+    def _poll_sleep(self, seconds):
+        time.sleep(seconds)
+        if self.stats:
+            self.stats.add_poll_sleep(seconds)
+
+
+    def _query_async_jobs(self, jobids, startdate=None):
+        """Return the jobs by jobid and the startdate listing them.
+
+        jobids are in the order the jobs were submitted. Unless startdate is
+        known, the first job is queried to tell when the jobs were created.
+        """
+        jobs = {}
+        if len(jobids) == 1 or not startdate:
+            jobs[jobids[0]] = self.cs.queryAsyncJobResult(jobid=jobids[0])
+            startdate = startdate or self._get_async_jobs_startdate(jobs[jobids[0]])
+
+        # Resolve the other jobs by listing only the recent jobs, page by page
+        if len(jobids) > len(jobs) and startdate:
+            for job in self.iter_list('listAsyncJobs', 'asyncjobs', startdate=startdate):
+                if job['jobid'] in jobids:
+                    jobs[job['jobid']] = job
+                    if len(jobs) == len(jobids):
+                        break
+
+        # Jobs not listed, e.g. of another account, are queried one by one
+        for jobid in jobids:
+            if jobid not in jobs:
+                jobs[jobid] = self.cs.queryAsyncJobResult(jobid=jobid)
+        return jobs, startdate
+
+
+    def _get_async_jobs_startdate(self, job):
+        # created is like 2016-02-10T10:25:47+0100, in the time zone of the API
+        created = (job or {}).get('created') or ''
+        try:
+            timestamp = calendar.timegm(time.strptime(created[:19], '%Y-%m-%dT%H:%M:%S'))
+        except ValueError:
+            return None
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp - CS_ASYNC_JOBS_SLACK)) + created[19:]
+
+
+    def _get_poll_interval(self, interval, elapsed, cmds=None):
+        interval_max = self.module.params.get('api_poll_interval_max') or CS_POLL_INTERVAL_MAX
+        interval = interval * CS_POLL_INTERVAL_FACTOR
+
+        # Wait about half of the remaining expected duration for known slow jobs
+        hints = [CS_ASYNC_JOB_DURATION_HINTS.get(cmd.split('.')[-1]) for cmd in cmds or [] if cmd]
+        if hints and None not in hints:
+            hint = min(hints)
+            if elapsed < hint:
+                interval = max(interval, (hint - elapsed) / 2.0)
+        return min(interval, interval_max)
+
+
+    def _get_poll_jitter(self, interval):
+        # Spread the polls of concurrent tasks, keep at least half the interval
+        return interval / 2.0 + random.uniform(0, interval / 2.0)
 
 
     def get_result(self, resource):
@@ -776,6 +1410,9 @@ class AnsibleCloudStack(object):
                     result_tag['key']   = tag['key']
                     result_tag['value'] = tag['value']
                     self.result['tags'].append(result_tag)
+
+        if self.stats and self.module.params.get('api_stats'):
+            self.result['api_stats'] = self.stats.get_summary()
         return self.result
 
 
@@ -803,14 +1440,10 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
     def get_service_offering_id(self):
         service_offering = self.module.params.get('service_offering')
 
-        service_offerings = self.cs.listServiceOfferings()
-        if service_offerings:
-            if not service_offering:
-                return service_offerings['serviceoffering'][0]['id']
-
-            for s in service_offerings['serviceoffering']:
-                if service_offering in [ s['name'], s['id'] ]:
-                    return s['id']
+        for s in self.iter_list_cached('listServiceOfferings', 'serviceoffering'):
+            # use the first service offering if no service offering param given
+            if not service_offering or service_offering in [ s['name'], s['id'] ]:
+                return s['id']
         self.module.fail_json(msg="Service offering '%s' not found" % service_offering)
 
 
@@ -833,24 +1466,20 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
                 return self._get_by_key(key, self.template)
 
             args['templatefilter'] = 'executable'
-            templates = self.cs.listTemplates(**args)
-            if templates:
-                for t in templates['template']:
-                    if template in [ t['displaytext'], t['name'], t['id'] ]:
-                        self.template = t
-                        return self._get_by_key(key, self.template)
+            for t in self.iter_list('listTemplates', 'template', **args):
+                if template in [ t['displaytext'], t['name'], t['id'] ]:
+                    self.template = t
+                    return self._get_by_key(key, self.template)
             self.module.fail_json(msg="Template '%s' not found" % template)
 
         elif iso:
             if self.iso:
                 return self._get_by_key(key, self.iso)
             args['isofilter'] = 'executable'
-            isos = self.cs.listIsos(**args)
-            if isos:
-                for i in isos['iso']:
-                    if iso in [ i['displaytext'], i['name'], i['id'] ]:
-                        self.iso = i
-                        return self._get_by_key(key, self.iso)
+            for i in self.iter_list('listIsos', 'iso', **args):
+                if iso in [ i['displaytext'], i['name'], i['id'] ]:
+                    self.iso = i
+                    return self._get_by_key(key, self.iso)
             self.module.fail_json(msg="ISO '%s' not found" % iso)
 
 
@@ -860,11 +1489,9 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         if not disk_offering:
             return None
 
-        disk_offerings = self.cs.listDiskOfferings()
-        if disk_offerings:
-            for d in disk_offerings['diskoffering']:
-                if disk_offering in [ d['displaytext'], d['name'], d['id'] ]:
-                    return d['id']
+        for d in self.iter_list_cached('listDiskOfferings', 'diskoffering'):
+            if disk_offering in [ d['displaytext'], d['name'], d['id'] ]:
+                return d['id']
         self.module.fail_json(msg="Disk offering '%s' not found" % disk_offering)
 
 
@@ -878,12 +1505,7 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
             args['domainid']    = self.get_domain(key='id')
             args['projectid']   = self.get_project(key='id')
             # Do not pass zoneid, as the instance name must be unique across zones.
-            instances = self.cs.listVirtualMachines(**args)
-            if instances:
-                for v in instances['virtualmachine']:
-                    if instance_name in [ v['name'], v['displayname'], v['id'] ]:
-                        self.instance = v
-                        break
+            self.instance = self.find_resource('listVirtualMachines', 'virtualmachine', instance_name, ['name', 'displayname', 'id'], name_filter='keyword', **args)
         return self.instance
 
 
@@ -916,23 +1538,22 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         args['projectid']   = self.get_project(key='id')
         args['zoneid']      = self.get_zone(key='id')
 
-        networks = self.cs.listNetworks(**args)
-        if not networks:
-            self.module.fail_json(msg="No networks available")
-
-        network_ids = []
+        networks_found = {}
         network_displaytexts = []
-        for network_name in network_names:
-            for n in networks['network']:
-                if network_name in [ n['displaytext'], n['name'], n['id'] ]:
-                    network_ids.append(n['id'])
+        for n in self.iter_list('listNetworks', 'network', **args):
+            for network_name in network_names:
+                if network_name not in networks_found and network_name in [ n['displaytext'], n['name'], n['id'] ]:
+                    networks_found[network_name] = n['id']
                     network_displaytexts.append(n['name'])
-                    break
 
-        if len(network_ids) != len(network_names):
+            # Stop paging once all networks are found
+            if len(networks_found) == len(set(network_names)):
+                break
+
+        if len(networks_found) != len(set(network_names)):
             self.module.fail_json(msg="Could not find all networks, networks list found: %s" % network_displaytexts)
 
-        return network_ids
+        return [networks_found[network_name] for network_name in network_names]
 
 
     def present_instance(self):
@@ -972,6 +1593,34 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
 
     def deploy_instance(self, start_vm=True):
         self.result['changed'] = True
+
+        args                        = self.get_deploy_args(start_vm)
+        args['name']                = self.module.params.get('name')
+        args['displayname']         = self.get_or_fallback('display_name', 'name')
+
+        instance = None
+        if not self.module.check_mode:
+            instance = self.cs.deployVirtualMachine(**args)
+
+            if 'errortext' in instance:
+                self.module.fail_json(msg="Failed: '%s'" % instance['errortext'])
+
+            poll_async = self.module.params.get('poll_async')
+            if poll_async:
+                instance = self._poll_job(instance, 'virtualmachine')
+        return instance
+
+
+    def get_deploy_args(self, start_vm=True):
+        """Return the args of deployVirtualMachine all instances have in common."""
+        # Resolve independent references concurrently, then the ones depending on them
+        lookups = [self.get_project, self.get_zone, self.get_service_offering_id, self.get_disk_offering_id]
+        if self.module.params.get('iso'):
+            # Templates tell their hypervisor, ISOs do not
+            lookups.append(self.get_hypervisor)
+        self.prefetch(*lookups)
+        self.prefetch(self.get_template_or_iso, self.get_network_ids)
+
         networkids = self.get_network_ids()
         if networkids is not None:
             networkids = ','.join(networkids)
@@ -993,8 +1642,6 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         args['keyboard']            = self.module.params.get('keyboard')
         args['ipaddress']           = self.module.params.get('ip_address')
         args['ip6address']          = self.module.params.get('ip6_address')
-        args['name']                = self.module.params.get('name')
-        args['displayname']         = self.get_or_fallback('display_name', 'name')
         args['group']               = self.module.params.get('group')
         args['keypair']             = self.module.params.get('ssh_key')
         args['size']                = self.module.params.get('disk_size')
@@ -1007,21 +1654,217 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         template_iso = self.get_template_or_iso()
         if 'hypervisor' not in template_iso:
             args['hypervisor'] = self.get_hypervisor()
+        return args
 
-        instance = None
-        if not self.module.check_mode:
-            instance = self.cs.deployVirtualMachine(**args)
 
-            if 'errortext' in instance:
-                self.module.fail_json(msg="Failed: '%s'" % instance['errortext'])
+    def get_bulk_names(self):
+        """Return the host names of count or names, each with its number."""
+        count_start = self.module.params.get('count_start')
+        names = self.module.params.get('names')
+        if names is not None:
+            return [ (name, count_start + i) for i, name in enumerate(names) ]
 
-            poll_async = self.module.params.get('poll_async')
-            if poll_async:
-                instance = self._poll_job(instance, 'virtualmachine')
-        return instance
+        name = self.module.params.get('name')
+        if '%' not in name:
+            name += '-%d'
+        try:
+            return [ (name % number, number) for number in range(count_start, count_start + self.module.params.get('count')) ]
+        except (TypeError, ValueError):
+            self.module.fail_json(msg="Invalid pattern of host names '%s'" % name)
+
+
+    def get_bulk_display_name(self, name, number):
+        display_name = self.module.params.get('display_name')
+        if not display_name or '%' not in display_name:
+            return name
+        try:
+            return display_name % number
+        except (TypeError, ValueError):
+            self.module.fail_json(msg="Invalid pattern of display names '%s'" % display_name)
 
 
-    def update_instance(self, instance):
+    def get_instances(self, names):
+        """Return the existing instances of names by name, found by one list call."""
+        args                = {}
+        args['account']     = self.get_account(key='name')
+        args['domainid']    = self.get_domain(key='id')
+        args['projectid']   = self.get_project(key='id')
+        # Names of a pattern share a prefix, narrowing the list
+        args['keyword']     = os.path.commonprefix(names) or None
+
+        instances = {}
+        for vm in self.iter_list('listVirtualMachines', 'virtualmachine', **args):
+            for key in ['name', 'displayname', 'id']:
+                if vm.get(key) in names and vm[key] not in instances:
+                    instances[vm[key]] = vm
+        return instances
+
+
+    def deploy_instances(self, state='present'):
+        """Deploy the missing instances of count or names concurrently, awaiting
+        their jobs together, and bring the existing ones to state. Return a
+        result of each instance in the order of names.
+        """
+        if self.module.params.get('ip_address') or self.module.params.get('ip6_address') or self.module.params.get('ip_to_networks'):
+            self.module.fail_json(msg="ip_address, ip6_address and ip_to_networks can not be used with count or names.")
+        if self.module.params.get('count') is not None and self.module.params.get('count') < 1:
+            self.module.fail_json(msg="count must be at least 1.")
+        if self.module.params.get('deploy_concurrency') < 1:
+            self.module.fail_json(msg="deploy_concurrency must be at least 1.")
+
+        names = self.get_bulk_names()
+        existing = self.get_instances([ name for name, number in names ])
+        missing = [ (name, number) for name, number in names if name not in existing ]
+
+        results = self._ensure_all(existing, dict(names), state)
+
+        if missing:
+            self.result['changed'] = True
+            if self.module.check_mode:
+                for name, number in missing:
+                    results[name] = {'instance': None, 'changed': True}
+            else:
+                jobs = self._deploy_all(self.get_deploy_args(start_vm=state != 'stopped'), missing)
+                deployed = []
+                for name, number in missing:
+                    if 'errortext' in jobs[name]:
+                        results[name] = {'instance': None, 'changed': False, 'msg': "Failed: '%s'" % jobs[name]['errortext']}
+                    else:
+                        deployed.append(name)
+
+                instances = [ jobs[name] for name in deployed ]
+                tag_error = None
+                if self.module.params.get('poll_async'):
+                    instances = self.poll_jobs(instances, 'virtualmachine', fail_on_error=False)
+                    tag_error = self._tag_all([ instance for instance in instances if 'errortext' not in instance ])
+
+                for name, instance in zip(deployed, instances):
+                    if 'errortext' in instance:
+                        results[name] = {'instance': None, 'changed': True, 'msg': "Failed: '%s'" % instance['errortext']}
+                    elif instance.get('state', '').lower() == 'error':
+                        results[name] = {'instance': instance, 'changed': True, 'msg': "Instance named '%s' in error state." % name}
+                    elif tag_error:
+                        # Deployed, but untagged
+                        results[name] = {'instance': instance, 'changed': True, 'msg': "Failed to tag: '%s'" % tag_error}
+                    else:
+                        results[name] = {'instance': instance, 'changed': True}
+
+        for name, number in names:
+            results[name]['name'] = name
+        return [ results[name] for name, number in names ]
+
+
+    def _ensure_all(self, instances, numbers, state):
+        """Update existing instances like update_instance, start or stop them
+        as state requires, awaiting their jobs together, and ensure their tags.
+        Return a result of each by name."""
+        if state == 'started':
+            command, states = 'startVirtualMachine', ['stopped', 'stopping']
+        elif state == 'stopped':
+            command, states = 'stopVirtualMachine', ['starting', 'running']
+        else:
+            command, states = None, []
+
+        results = {}
+        names = []
+        jobs = []
+        for name, instance in instances.iteritems():
+            # Changes told by instance
+            changed = self.result['changed']
+            self.result['changed'] = False
+            self.instance = instance
+            instance = self.update_instance(instance, display_name=self.get_bulk_display_name(name, numbers[name]))
+            self.instance = None
+            results[name] = {'instance': instance, 'changed': self.result['changed']}
+            self.result['changed'] = changed or results[name]['changed']
+
+            # Unless polled, an updated instance is a job telling no state
+            if instance.get('state', '').lower() in states:
+                results[name]['changed'] = True
+                self.result['changed'] = True
+                if not self.module.check_mode:
+                    names.append(name)
+                    jobs.append(getattr(self.cs, command)(id=instance['id']))
+
+        poll_async = self.module.params.get('poll_async')
+        if poll_async:
+            jobs = self.poll_jobs(jobs, 'virtualmachine', fail_on_error=False)
+        for name, job in zip(names, jobs):
+            if 'errortext' in job:
+                results[name]['msg'] = "Failed: '%s'" % job['errortext']
+            elif poll_async:
+                results[name]['instance'] = job
+
+        for name, result in results.iteritems():
+            if 'msg' in result:
+                continue
+            # Tags of each instance listed afresh, changes told by instance
+            changed = self.result['changed']
+            self.result['changed'] = False
+            self.tags = None
+            result['instance'] = self.ensure_tags(resource=result['instance'], resource_type='UserVm')
+            result['changed'] = result['changed'] or self.result['changed']
+            self.result['changed'] = changed or result['changed']
+        return results
+
+
+    def _deploy_all(self, args, names):
+        """Return the deploy jobs of names, deploying deploy_concurrency at a time."""
+        queue = Queue()
+        for name, number in names:
+            queue.put((name, self.get_bulk_display_name(name, number)))
+        jobs = {}
+
+        def worker():
+            while True:
+                try:
+                    name, display_name = queue.get_nowait()
+                except Empty:
+                    break
+                try:
+                    jobs[name] = self.cs.deployVirtualMachine(name=name, displayname=display_name, **args)
+                except Exception as e:
+                    # Reported with the instance, the others are deployed anyway
+                    jobs[name] = {'errortext': str(e)}
+
+        threads = [ threading.Thread(target=worker) for i in range(min(self.module.params.get('deploy_concurrency'), len(names))) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return jobs
+
+
+    def _tag_all(self, instances):
+        """Tag new instances by one job. Return the error, None on success."""
+        tags = self.module.params.get('tags')
+        if not tags or not instances:
+            return None
+
+        args                    = {}
+        args['resourceids']     = ','.join([ instance['id'] for instance in instances ])
+        args['resourcetype']    = 'UserVm'
+        args['tags']            = tags
+        try:
+            res = self.cs.createTags(**args)
+        except CloudStackException as e:
+            # The response is in the error of newer cs libraries
+            error = getattr(e, 'error', None)
+            res = {'errortext': isinstance(error, dict) and error.get('errortext') or str(e)}
+        if 'errortext' not in res:
+            res = self.poll_jobs([res], fail_on_error=False)[0]
+        if res and 'errortext' in res:
+            # Reported with the instances, which exist untagged
+            return res['errortext']
+
+        keys = [ tag['key'] for tag in tags ]
+        for instance in instances:
+            instance['tags'] = [ tag for tag in instance.get('tags') or [] if tag['key'] not in keys ]
+            instance['tags'].extend([ {'key': tag['key'], 'value': tag['value']} for tag in tags ])
+        return None
+
+
+    def update_instance(self, instance, display_name=None):
         args_service_offering                       = {}
         args_service_offering['id']                 = instance['id']
         args_service_offering['serviceofferingid']  = self.get_service_offering_id()
@@ -1029,7 +1872,7 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         args_instance_update                        = {}
         args_instance_update['id']                  = instance['id']
         args_instance_update['group']               = self.module.params.get('group')
-        args_instance_update['displayname']         = self.get_or_fallback('display_name', 'name')
+        args_instance_update['displayname']         = display_name or self.get_or_fallback('display_name', 'name')
         args_instance_update['userdata']            = self.get_user_data()
         args_instance_update['ostypeid']            = self.get_os_type(key='id')
 
@@ -1219,6 +2062,22 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
         return instance
 
 
+    def get_bulk_result(self, results):
+        result = self.result
+        result['instances'] = []
+        for item in results:
+            self.result = {'changed': item['changed']}
+            instance_result = self.get_result(item['instance'])
+            instance_result.pop('api_stats', None)
+            instance_result.setdefault('name', item['name'])
+            if 'msg' in item:
+                instance_result['failed'] = True
+                instance_result['msg'] = item['msg']
+            result['instances'].append(instance_result)
+        self.result = result
+        return super(AnsibleCloudStackInstance, self).get_result(None)
+
+
     def get_result(self, instance):
         super(AnsibleCloudStackInstance, self).get_result(instance)
         if instance:
@@ -1242,7 +2101,11 @@ class AnsibleCloudStackInstance(AnsibleCloudStack):
 def main():
     argument_spec = cs_argument_spec()
     argument_spec.update(dict(
-        name = dict(required=True),
+        name = dict(default=None),
+        names = dict(type='list', default=None),
+        count = dict(type='int', default=None),
+        count_start = dict(type='int', default=1),
+        deploy_concurrency = dict(type='int', default=10),
         display_name = dict(default=None),
         group = dict(default=None),
         state = dict(choices=['present', 'deployed', 'started', 'stopped', 'restarted', 'restored', 'absent', 'destroyed', 'expunged'], default='present'),
@@ -1282,8 +2145,13 @@ def main():
     module = AnsibleModule(
         argument_spec=argument_spec,
         required_together=required_together,
+        required_one_of = (
+            ['name', 'names'],
+        ),
         mutually_exclusive = (
             ['template', 'iso'],
+            ['name', 'names'],
+            ['names', 'count'],
         ),
         supports_check_mode=True
     )
@@ -1296,6 +2164,19 @@ def main():
 
         state = module.params.get('state')
 
+        if module.params.get('count') is not None or module.params.get('names') is not None:
+            if state not in ['present', 'deployed', 'started', 'stopped']:
+                module.fail_json(msg="State '%s' can not be used with count or names." % state)
+
+            results = acs_instance.deploy_instances(state)
+            result = acs_instance.get_bulk_result(results)
+
+            failed = [ item for item in results if 'msg' in item ]
+            if failed:
+                result['msg'] = "Failed to deploy %d of %d instances." % (len(failed), len(results))
+                module.fail_json(**result)
+            module.exit_json(**result)
+
         if state in ['absent', 'destroyed']:
             instance = acs_instance.absent_instance()
 
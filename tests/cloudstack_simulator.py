@@ -0,0 +1,921 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+######################################################################
+
+"""
+Local CloudStack API simulator.
+===============================
+
+Fake management server speaking the CloudStack HTTP/JSON API for the commands
+used by the cs_* modules and the inventory scripts. Resources are kept in
+memory, signatures are not verified. Meant for reproducible benchmarks and
+offline tests without a real cloud or simulator zone:
+
+  tests/cloudstack_simulator.py --port 8888 --vms 10000 --latency 20
+
+  export CLOUDSTACK_ENDPOINT=http://127.0.0.1:8888/client/api
+  export CLOUDSTACK_KEY=simulator
+  export CLOUDSTACK_SECRET=simulator
+  ./cloudstack.py --list
+
+The dataset is seeded with the names used by the integration tests, e.g.
+zone 'Sandbox-simulator', service offerings 'Small Instance' and
+'Medium Instance' and template 'CentOS 5.3(64-bit) no GUI (Simulator)'.
+
+usage: cloudstack_simulator.py [--host HOST] [--port PORT] [--vms VMS]
+                               [--routers ROUTERS] [--projects PROJECTS]
+                               [--latency MS] [--command-latency CMD=MS]
+                               [--job-delay SECONDS] [--default-page-size N]
+                               [--seed SEED]
+"""
+
+from __future__ import print_function
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+# List commands and the key of their records in the response
+LIST_COMMANDS = {
+    'listZones':                    'zone',
+    'listDomains':                  'domain',
+    'listAccounts':                 'account',
+    'listUsers':                    'user',
+    'listProjects':                 'project',
+    'listOsTypes':                  'ostype',
+    'listServiceOfferings':         'serviceoffering',
+    'listDiskOfferings':            'diskoffering',
+    'listTemplates':                'template',
+    'listIsos':                     'iso',
+    'listNetworks':                 'network',
+    'listVirtualMachines':          'virtualmachine',
+    'listInstanceGroups':           'instancegroup',
+    'listAffinityGroups':           'affinitygroup',
+    'listAffinityGroupTypes':       'affinityGroupType',
+    'listSecurityGroups':           'securitygroup',
+    'listSSHKeyPairs':              'sshkeypair',
+    'listPublicIpAddresses':        'publicipaddress',
+    'listFirewallRules':            'firewallrule',
+    'listPortForwardingRules':      'portforwardingrule',
+    'listLoadBalancerRules':        'loadbalancerrule',
+    'listVolumes':                  'volume',
+    'listVMSnapshot':               'vmSnapshot',
+    'listRouters':                  'router',
+    'listTags':                     'tag',
+    'listEvents':                   'event',
+}
+
+# Create commands, the key of the created record and whether they are async
+CREATE_COMMANDS = {
+    'deployVirtualMachine':         ('virtualmachine', True),
+    'createDomain':                 ('domain', False),
+    'createAccount':                ('account', False),
+    'createUser':                   ('user', False),
+    'createProject':                ('project', True),
+    'createNetwork':                ('network', False),
+    'createInstanceGroup':          ('instancegroup', False),
+    'createAffinityGroup':          ('affinitygroup', True),
+    'createSecurityGroup':          ('securitygroup', False),
+    'createSSHKeyPair':             ('sshkeypair', False),
+    'registerSSHKeyPair':           ('sshkeypair', False),
+    'associateIpAddress':           ('publicipaddress', True),
+    'createFirewallRule':           ('firewallrule', True),
+    'createPortForwardingRule':     ('portforwardingrule', True),
+    'createLoadBalancerRule':       ('loadbalancerrule', True),
+    'createVolume':                 ('volume', True),
+    'createVMSnapshot':             ('vmSnapshot', True),
+    'registerTemplate':             ('template', False),
+    'registerIso':                  ('iso', False),
+}
+
+# Update and delete commands on a record given by id
+UPDATE_COMMANDS = {
+    'updateVirtualMachine':         ('virtualmachine', False, None),
+    'changeServiceForVirtualMachine': ('virtualmachine', False, None),
+    'startVirtualMachine':          ('virtualmachine', True, 'Running'),
+    'stopVirtualMachine':           ('virtualmachine', True, 'Stopped'),
+    'rebootVirtualMachine':         ('virtualmachine', True, 'Running'),
+    'destroyVirtualMachine':        ('virtualmachine', True, 'Destroyed'),
+    'recoverVirtualMachine':        ('virtualmachine', False, 'Stopped'),
+    'resetSSHKeyForVirtualMachine': ('virtualmachine', True, None),
+    'restoreVirtualMachine':        ('virtualmachine', True, None),
+    'updateDomain':                 ('domain', False, None),
+    'updateAccount':                ('account', False, None),
+    'updateUser':                   ('user', False, None),
+    'updateProject':                ('project', True, None),
+    'updateNetwork':                ('network', True, None),
+    'updateInstanceGroup':          ('instancegroup', False, None),
+    'updateLoadBalancerRule':       ('loadbalancerrule', True, None),
+    'updateTemplate':               ('template', False, None),
+    'updateIso':                    ('iso', False, None),
+}
+
+DELETE_COMMANDS = {
+    'expungeVirtualMachine':        ('virtualmachine', True),
+    'deleteDomain':                 ('domain', True),
+    'deleteAccount':                ('account', True),
+    'deleteUser':                   ('user', False),
+    'deleteProject':                ('project', True),
+    'deleteNetwork':                ('network', True),
+    'deleteInstanceGroup':          ('instancegroup', False),
+    'deleteAffinityGroup':          ('affinitygroup', True),
+    'deleteSecurityGroup':          ('securitygroup', False),
+    'deleteSSHKeyPair':             ('sshkeypair', False),
+    'disassociateIpAddress':        ('publicipaddress', True),
+    'deleteFirewallRule':           ('firewallrule', True),
+    'deletePortForwardingRule':     ('portforwardingrule', True),
+    'deleteLoadBalancerRule':       ('loadbalancerrule', True),
+    'deleteVolume':                 ('volume', False),
+    'deleteVMSnapshot':             ('vmSnapshot', True),
+    'deleteTemplate':               ('template', True),
+    'deleteIso':                    ('iso', True),
+}
+
+# Command classes of async jobs, returned in the cmd of the jobs as by the API
+ASYNC_JOB_CMDS = {
+    'deployVirtualMachine':         'user.vm.DeployVMCmd',
+    'startVirtualMachine':          'user.vm.StartVMCmd',
+    'stopVirtualMachine':           'user.vm.StopVMCmd',
+    'rebootVirtualMachine':         'user.vm.RebootVMCmd',
+    'destroyVirtualMachine':        'user.vm.DestroyVMCmd',
+    'restoreVirtualMachine':        'user.vm.RestoreVMCmd',
+    'resetSSHKeyForVirtualMachine': 'user.vm.ResetVMSSHKeyCmd',
+    'expungeVirtualMachine':        'admin.vm.ExpungeVMCmd',
+    'deleteDomain':                 'admin.domain.DeleteDomainCmd',
+    'deleteAccount':                'admin.account.DeleteAccountCmd',
+    'createProject':                'user.project.CreateProjectCmd',
+    'updateProject':                'user.project.UpdateProjectCmd',
+    'deleteProject':                'user.project.DeleteProjectCmd',
+    'updateNetwork':                'user.network.UpdateNetworkCmd',
+    'deleteNetwork':                'user.network.DeleteNetworkCmd',
+    'createAffinityGroup':          'user.affinitygroup.CreateAffinityGroupCmd',
+    'deleteAffinityGroup':          'user.affinitygroup.DeleteAffinityGroupCmd',
+    'associateIpAddress':           'user.address.AssociateIPAddrCmd',
+    'disassociateIpAddress':        'user.address.DisassociateIPAddrCmd',
+    'createFirewallRule':           'user.firewall.CreateFirewallRuleCmd',
+    'deleteFirewallRule':           'user.firewall.DeleteFirewallRuleCmd',
+    'createPortForwardingRule':     'user.firewall.CreatePortForwardingRuleCmd',
+    'deletePortForwardingRule':     'user.firewall.DeletePortForwardingRuleCmd',
+    'createLoadBalancerRule':       'user.loadbalancer.CreateLoadBalancerRuleCmd',
+    'updateLoadBalancerRule':       'user.loadbalancer.UpdateLoadBalancerRuleCmd',
+    'deleteLoadBalancerRule':       'user.loadbalancer.DeleteLoadBalancerRuleCmd',
+    'assignToLoadBalancerRule':     'user.loadbalancer.AssignToLoadBalancerRuleCmd',
+    'removeFromLoadBalancerRule':   'user.loadbalancer.RemoveFromLoadBalancerRuleCmd',
+    'disableStaticNat':             'user.nat.DisableStaticNatCmd',
+    'createVolume':                 'user.volume.CreateVolumeCmd',
+    'createVMSnapshot':             'user.vmsnapshot.CreateVMSnapshotCmd',
+    'deleteVMSnapshot':             'user.vmsnapshot.DeleteVMSnapshotCmd',
+    'deleteTemplate':               'user.template.DeleteTemplateCmd',
+    'deleteIso':                    'user.iso.DeleteIsoCmd',
+    'createTags':                   'user.tag.CreateTagsCmd',
+    'deleteTags':                   'user.tag.DeleteTagsCmd',
+}
+
+# Events recorded for commands on VMs
+VM_EVENTS = {
+    'deployVirtualMachine':         'VM.CREATE',
+    'updateVirtualMachine':         'VM.UPDATE',
+    'changeServiceForVirtualMachine': 'VM.UPGRADE',
+    'startVirtualMachine':          'VM.START',
+    'stopVirtualMachine':           'VM.STOP',
+    'rebootVirtualMachine':         'VM.REBOOT',
+    'destroyVirtualMachine':        'VM.DESTROY',
+    'recoverVirtualMachine':        'VM.RECOVER',
+    'resetSSHKeyForVirtualMachine': 'VM.RESETSSHKEY',
+    'restoreVirtualMachine':        'VM.RESTORE',
+    'expungeVirtualMachine':        'VM.EXPUNGE',
+}
+
+# Events recorded for the tags of VMs
+TAG_EVENTS = {
+    'createTags':                   'CREATE_TAGS',
+    'deleteTags':                   'DELETE_TAGS',
+}
+
+# Filters of list commands compared to a record field as is
+EXACT_FILTERS = {
+    'id':               'id',
+    'name':             'name',
+    'zoneid':           'zoneid',
+    'domainid':         'domainid',
+    'account':          'account',
+    'state':            'state',
+    'resourceid':       'resourceid',
+    'resourcetype':     'resourcetype',
+    'ipaddress':        'ipaddress',
+    'securitygroupname': 'name',
+    'virtualmachineid': 'virtualmachineid',
+    'type':             'type',
+}
+
+HYPERVISORS = ['KVM', 'VMware', 'XenServer', 'Simulator']
+TAG_KEYS = ['env', 'role', 'team', 'backup', 'tier']
+TAG_VALUES = ['prod', 'staging', 'dev', 'web', 'db', 'cache', 'yes', 'no', 'a', 'b']
+
+# Resources not owned by a project
+GLOBAL_RESOURCES = [
+    'zone', 'domain', 'account', 'user', 'project', 'ostype', 'serviceoffering', 'diskoffering',
+    'template', 'iso', 'affinityGroupType', 'tag',
+]
+
+DEFAULT_PAGE_SIZE = 500
+
+
+def new_id():
+    return str(uuid.uuid4())
+
+
+def created():
+    return time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime())
+
+
+class Dataset(object):
+    """In-memory resources of the simulated cloud."""
+
+    def __init__(self, vms=100, routers=10, projects=2, zones=1, groups=20, networks=5, seed=None):
+        self.random = random.Random(seed)
+        self.records = {}
+        self.lock = threading.Lock()
+        self.ip_counter = 0
+        self.vm_counter = vms
+
+        self.seed_reference_data(zones)
+        for i in range(projects):
+            self.add('project', {
+                'name':     'project-%d' % i,
+                'displaytext': 'Project %d' % i,
+                'state':    'Active',
+                'domain':   'ROOT',
+                'domainid': self.first('domain')['id'],
+                'account':  'admin',
+                'tags':     [],
+            })
+        for i in range(networks):
+            zone = self.random.choice(self.records['zone'])
+            self.add('network', {
+                'name':         'network-%d' % i,
+                'displaytext':  'Network %d' % i,
+                'zoneid':       zone['id'],
+                'zonename':     zone['name'],
+                'type':         self.random.choice(['Isolated', 'Shared']),
+                'state':        'Implemented',
+                'cidr':         '10.%d.0.0/16' % i,
+                'gateway':      '10.%d.0.1' % i,
+                'netmask':      '255.255.0.0',
+                'tags':         [],
+            })
+        for i in range(groups):
+            self.add('instancegroup', {'name': 'group-%d' % i})
+        for i in range(vms):
+            self.add('virtualmachine', self.generate_vm(i))
+        for i in range(routers):
+            self.add('router', self.generate_router(i))
+
+
+    def seed_reference_data(self, zones):
+        self.add('domain', {'name': 'ROOT', 'path': 'ROOT', 'level': 0, 'haschild': False})
+        self.add('account', {'name': 'admin', 'accounttype': 1, 'domain': 'ROOT', 'domainid': self.first('domain')['id'], 'state': 'enabled'})
+        self.add('zone', {'name': 'Sandbox-simulator', 'networktype': 'Advanced', 'allocationstate': 'Enabled'})
+        for i in range(1, zones):
+            self.add('zone', {'name': 'zone-%d' % i, 'networktype': 'Advanced', 'allocationstate': 'Enabled'})
+        for name, cpu, memory in [('Small Instance', 1, 512), ('Medium Instance', 1, 1024), ('Large Instance', 4, 8192)]:
+            self.add('serviceoffering', {'name': name, 'displaytext': name, 'cpunumber': cpu, 'cpuspeed': 1000, 'memory': memory})
+        for name, size in [('Small', 5), ('Medium', 20), ('Large', 100), ('Custom', 0)]:
+            self.add('diskoffering', {'name': name, 'displaytext': '%s Disk, %s GB' % (name, size), 'disksize': size})
+        for description in ['CentOS 5.3 (64-bit)', 'Debian GNU/Linux 7(64-bit)', 'Other Linux (64-bit)']:
+            self.add('ostype', {'description': description, 'oscategoryid': new_id()})
+        for zone in self.records['zone']:
+            self.add('template', {
+                'name':         'CentOS 5.3(64-bit) no GUI (Simulator)',
+                'displaytext':  'CentOS 5.3(64-bit) no GUI (Simulator)',
+                'zoneid':       zone['id'],
+                'zonename':     zone['name'],
+                'hypervisor':   'Simulator',
+                'isready':      True,
+                'ostypename':   'CentOS 5.3 (64-bit)',
+                'tags':         [],
+            })
+        self.add('affinityGroupType', {'type': 'host anti-affinity'})
+        self.add('affinityGroupType', {'type': 'host affinity'})
+        self.add('securitygroup', {'name': 'default', 'description': 'Default Security Group', 'ingressrule': [], 'egressrule': [], 'tags': []})
+
+
+    def next_ip(self, prefix='10.1'):
+        with self.lock:
+            self.ip_counter += 1
+            counter = self.ip_counter
+        return '%s.%d.%d' % (prefix, counter // 250 % 250, counter % 250 + 1)
+
+
+    def next_vm_index(self):
+        """Return the index of a deployed VM, unique as its instancename."""
+        with self.lock:
+            index = self.vm_counter
+            self.vm_counter += 1
+        return index
+
+
+    def generate_vm(self, i, name=None):
+        zone = self.random.choice(self.records['zone'])
+        offering = self.random.choice(self.records['serviceoffering'])
+        group = self.random.choice(self.records['instancegroup'] + [None])
+        project = self.random.choice(self.records.get('project', []) + [None])
+        name = name or 'vm-%05d' % i
+
+        nics = []
+        for n in range(self.random.choice([1, 1, 1, 2, 3])):
+            nics.append({
+                'id':           new_id(),
+                'ipaddress':    self.next_ip('10.%d' % (n + 1)),
+                'macaddress':   '02:00:%02x:%02x:%02x:%02x' % tuple(self.random.randint(0, 255) for _ in range(4)),
+                'netmask':      '255.255.255.0',
+                'gateway':      '10.%d.0.1' % (n + 1),
+                'type':         self.random.choice(['Isolated', 'Shared']),
+                'isdefault':    n == 0,
+            })
+
+        tags = []
+        for key in self.random.sample(TAG_KEYS, self.random.randint(0, 3)):
+            tags.append({'key': key, 'value': self.random.choice(TAG_VALUES), 'resourcetype': 'UserVm'})
+
+        vm = {
+            'name':                 name,
+            'displayname':          name,
+            'state':                self.random.choice(['Running'] * 8 + ['Stopped']),
+            'zoneid':               zone['id'],
+            'zonename':             zone['name'],
+            'serviceofferingid':    offering['id'],
+            'serviceofferingname':  offering['name'],
+            'cpunumber':            offering['cpunumber'],
+            'cpuspeed':             offering['cpuspeed'],
+            'memory':               offering['memory'],
+            'cpuused':              '%d%%' % self.random.randint(0, 100),
+            'hypervisor':           self.random.choice(HYPERVISORS),
+            'templatename':         'CentOS 5.3(64-bit) no GUI (Simulator)',
+            'account':              'admin',
+            'domain':               'ROOT',
+            'nic':                  nics,
+            'tags':                 tags,
+            'affinitygroup':        [{'name': 'ag-%d' % self.random.randint(0, 5), 'type': 'host anti-affinity'}] if self.random.random() < 0.2 else [],
+            'securitygroup':        [{'name': 'default'}] if self.random.random() < 0.5 else [],
+            'instancename':         'i-2-%d-VM' % i,
+        }
+        if group:
+            vm['group'] = group['name']
+            vm['groupid'] = group['id']
+        if project:
+            vm['project'] = project['name']
+            vm['projectid'] = project['id']
+        return vm
+
+
+    def generate_router(self, i):
+        zone = self.random.choice(self.records['zone'])
+        project = self.random.choice(self.records.get('project', []) + [None])
+        router = {
+            'name':                 'r-%d-VM' % i,
+            'state':                self.random.choice(['Running'] * 9 + ['Stopped']),
+            'zoneid':               zone['id'],
+            'zonename':             zone['name'],
+            'domain':               'ROOT',
+            'networkdomain':        'cs%d.cloud.internal' % i,
+            'linklocalip':          '169.254.%d.%d' % (i // 250 % 250, i % 250 + 1),
+            'redundantstate':       self.random.choice(['UNKNOWN', 'UNKNOWN', 'MASTER', 'BACKUP']),
+            'role':                 'VIRTUAL_ROUTER',
+            'serviceofferingname':  'System Offering For Software Router',
+            'nic': [
+                {'ipaddress': self.next_ip('10.100'), 'macaddress': '02:00:46:28:00:02', 'netmask': '255.255.255.0', 'isdefault': False},
+                {'ipaddress': self.next_ip('185.19'), 'macaddress': '06:0c:fc:00:35:a1', 'netmask': '255.255.255.128', 'isdefault': True},
+            ],
+        }
+        if project:
+            router['project'] = project['name']
+            router['projectid'] = project['id']
+        else:
+            router['account'] = 'admin'
+        return router
+
+
+    def add(self, key, record):
+        record.setdefault('id', new_id())
+        record.setdefault('created', created())
+        with self.lock:
+            self.records.setdefault(key, []).append(record)
+        return record
+
+
+    def first(self, key):
+        return self.records[key][0]
+
+
+    def get(self, key, record_id):
+        for record in self.records.get(key, []):
+            if record['id'] == record_id:
+                return record
+        return None
+
+
+    def remove(self, key, record_id):
+        with self.lock:
+            records = self.records.get(key, [])
+            self.records[key] = [r for r in records if r['id'] != record_id]
+            return len(records) != len(self.records[key])
+
+
+    def query(self, key, params):
+        records = self.records.get(key, [])
+
+        # Project resources are only listed with a projectid, -1 for all projects
+        project_id = params.get('projectid')
+        if key not in GLOBAL_RESOURCES:
+            if project_id == '-1':
+                records = [r for r in records if 'projectid' in r]
+            elif project_id:
+                records = [r for r in records if r.get('projectid') == project_id]
+            else:
+                records = [r for r in records if 'projectid' not in r]
+
+        for param, field in EXACT_FILTERS.items():
+            value = params.get(param)
+            if value is not None:
+                records = [r for r in records if str(r.get(field, '')).lower() == value.lower()]
+
+        keyword = params.get('keyword')
+        if keyword:
+            keyword = keyword.lower()
+            records = [r for r in records if any(keyword in str(r.get(f, '')).lower() for f in ['name', 'displayname', 'displaytext'])]
+
+        if 'ids' in params:
+            ids = params['ids'].split(',')
+            records = [r for r in records if r['id'] in ids]
+
+        if key == 'event' and params.get('startdate'):
+            # startdate is given as yyyy-MM-dd HH:mm:ss
+            records = [r for r in records if r['created'][:19].replace('T', ' ') >= params['startdate']]
+        return records
+
+
+class AsyncJobs(object):
+    """Async jobs finishing after a delay, see finish_due."""
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.jobs = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+
+    def submit(self, command, result_key=None, result=None, action=None):
+        job = {
+            'jobid':        new_id(),
+            'cmd':          'org.apache.cloudstack.api.command.%s' % ASYNC_JOB_CMDS[command],
+            'created':      created(),
+            'jobstatus':    0,
+            'jobprocstatus': 0,
+            'jobresultcode': 0,
+            'done_at':      time.time() + self.delay,
+            'result_key':   result_key,
+            'result':       result,
+            'action':       action,
+        }
+        with self.lock:
+            self.jobs[job['jobid']] = job
+            self.pending[job['jobid']] = job
+        return job['jobid']
+
+
+    def finish_due(self):
+        """Finish the jobs past their delay, whether polled or not."""
+        now = time.time()
+        with self.lock:
+            for jobid, job in list(self.pending.items()):
+                if now < job['done_at']:
+                    continue
+                if job['action']:
+                    job['action']()
+                job['jobstatus'] = 1
+                if job['result_key']:
+                    job['jobresult'] = {job['result_key']: job['result']}
+                else:
+                    job['jobresult'] = {'success': True}
+                del self.pending[jobid]
+
+
+    def get(self, jobid):
+        job = self.jobs.get(jobid)
+        if not job:
+            return None
+        return dict((k, v) for k, v in job.items() if k not in ['done_at', 'result_key', 'result', 'action'])
+
+
+    def list(self):
+        return [self.get(jobid) for jobid in list(self.jobs.keys())]
+
+
+class CloudStackSimulator(object):
+    """Dispatches API commands on a dataset."""
+
+    def __init__(self, dataset, jobs, latency=0, command_latency=None, default_page_size=DEFAULT_PAGE_SIZE):
+        self.dataset = dataset
+        self.jobs = jobs
+        self.default_page_size = default_page_size
+        self.latency = latency
+        self.command_latency = command_latency or {}
+        self.requests = 0
+
+
+    def handle(self, command, params):
+        """Return HTTP status and response of command."""
+        self.requests += 1
+        latency = self.command_latency.get(command, self.latency)
+        if latency:
+            time.sleep(latency / 1000.0)
+
+        # Jobs finish on their own, e.g. VMs deployed without polling show up
+        self.jobs.finish_due()
+        try:
+            handler = getattr(self, 'cmd_%s' % command, None)
+            if handler:
+                response = handler(params)
+            elif command in LIST_COMMANDS:
+                response = self.list(LIST_COMMANDS[command], params)
+            elif command in CREATE_COMMANDS:
+                response = self.create(command, params)
+            elif command in UPDATE_COMMANDS:
+                response = self.update(command, params)
+            elif command in DELETE_COMMANDS:
+                response = self.delete(command, params)
+            else:
+                return 432, self.error(command, 432, "The given command '%s' either does not exist or is not available for user" % command)
+        except SimulatorError as e:
+            return e.code, self.error(command, e.code, str(e))
+        return 200, {'%sresponse' % command.lower(): response}
+
+
+    def error(self, command, code, text):
+        return {'%sresponse' % command.lower(): {'errorcode': code, 'errortext': text}}
+
+
+    def list(self, key, params):
+        records = self.dataset.query(key, params)
+        if 'id' in params and not records:
+            raise SimulatorError(431, "Unable to execute API command due to invalid value. Invalid parameter id value=%s due to incorrect long value format, or entity does not exist" % params['id'])
+        return self.paginate(key, records, params)
+
+
+    def paginate(self, key, records, params):
+        count = len(records)
+        if 'page' in params:
+            page = int(params['page'])
+            pagesize = int(params.get('pagesize', self.default_page_size))
+            if self.default_page_size and pagesize > self.default_page_size:
+                raise SimulatorError(431, "Page size can't exceed max allowed page size value: %d" % self.default_page_size)
+            records = records[(page - 1) * pagesize:page * pagesize]
+        elif self.default_page_size:
+            # Like the default.page.size setting of the management server
+            records = records[:self.default_page_size]
+        if not records:
+            return {}
+        return {'count': count, key: records}
+
+
+    def async_result(self, command, key, record, action=None):
+        jobid = self.jobs.submit(command, key, record, action)
+        return {'jobid': jobid, 'id': record['id']}
+
+
+    def create(self, command, params):
+        key, is_async = CREATE_COMMANDS[command]
+        if key == 'virtualmachine':
+            record = self.dataset.generate_vm(self.dataset.next_vm_index(), name=params.get('name') or params.get('displayname'))
+            record['state'] = 'Running' if params.get('startvm', 'true').lower() == 'true' else 'Stopped'
+            record['tags'] = []
+            for field in ['group', 'groupid', 'project', 'projectid', 'zoneid', 'zonename', 'serviceofferingid',
+                          'serviceofferingname', 'cpunumber', 'cpuspeed', 'memory', 'templatename']:
+                record.pop(field, None)
+            # The other fields are those of the request
+            record['hypervisor'] = params.get('hypervisor', 'Simulator')
+            zone = self.dataset.get('zone', params.get('zoneid'))
+            if zone:
+                record['zonename'] = zone['name']
+            offering = self.dataset.get('serviceoffering', params.get('serviceofferingid'))
+            if offering:
+                record['serviceofferingname'] = offering['name']
+                for field in ['cpunumber', 'cpuspeed', 'memory']:
+                    record[field] = offering[field]
+            template = self.dataset.get('template', params.get('templateid'))
+            if template:
+                record['templatename'] = template['name']
+            project = self.dataset.get('project', params.get('projectid'))
+            if project:
+                record['project'] = project['name']
+        else:
+            record = {}
+        for param, value in params.items():
+            if param not in ['command', 'response', 'apiKey', 'signature', 'page', 'pagesize']:
+                record[param] = value
+        record.setdefault('tags', [])
+        record.setdefault('name', params.get('displayname', key))
+
+        if not is_async:
+            return {key: self.dataset.add(key, dict(record, id=new_id()))}
+
+        def action():
+            self.dataset.add(key, record)
+            self.add_event(command, record)
+
+        record['id'] = new_id()
+        return self.async_result(command, key, record, action=action)
+
+
+    def update(self, command, params):
+        key, is_async, state = UPDATE_COMMANDS[command]
+        record = self.dataset.get(key, params.get('id'))
+        if not record:
+            raise SimulatorError(431, "Unable to find %s with id %s" % (key, params.get('id')))
+
+        def action():
+            for param, value in params.items():
+                if param not in ['command', 'response', 'apiKey', 'signature', 'id']:
+                    record[param] = value
+            if state:
+                record['state'] = state
+            if command == 'changeServiceForVirtualMachine':
+                offering = self.dataset.get('serviceoffering', params.get('serviceofferingid'))
+                if offering:
+                    record['serviceofferingname'] = offering['name']
+            self.add_event(command, record)
+
+        if not is_async:
+            action()
+            return {key: record}
+        return self.async_result(command, key, record, action=action)
+
+
+    def delete(self, command, params):
+        key, is_async = DELETE_COMMANDS[command]
+        record_id = params.get('id')
+        record = self.dataset.get(key, record_id)
+        if not record:
+            raise SimulatorError(431, "Unable to find %s with id %s" % (key, record_id))
+
+        def action():
+            self.dataset.remove(key, record_id)
+            self.add_event(command, record)
+
+        if not is_async:
+            action()
+            return {'success': 'true'}
+        jobid = self.jobs.submit(command, action=action)
+        return {'jobid': jobid}
+
+
+    def add_event(self, command, record, resourcetype='VirtualMachine'):
+        event_type = VM_EVENTS.get(command) or TAG_EVENTS.get(command)
+        if not event_type:
+            return
+        event = {
+            'type':         event_type,
+            'level':        'INFO',
+            'state':        'Completed',
+            'description':  '%s %s' % (event_type, record['id']),
+            'resourceid':   record['id'],
+            'resourcetype': resourcetype,
+            'account':      'admin',
+            'domain':       'ROOT',
+        }
+        if 'projectid' in record:
+            event['project'] = record.get('project')
+            event['projectid'] = record['projectid']
+        self.dataset.add('event', event)
+
+
+    def cmd_createTags(self, params):
+        resource_ids = params.get('resourceids', '').split(',')
+        tags = self.parse_map(params, 'tags')
+
+        def action():
+            tagged = []
+            for resource_id in resource_ids:
+                for tag in tags:
+                    tag = dict(tag, resourceid=resource_id, resourcetype=params.get('resourcetype'))
+                    self.dataset.add('tag', tag)
+                    for records in self.dataset.records.values():
+                        for r in records:
+                            if r['id'] == resource_id and 'tags' in r:
+                                r['tags'].append(tag)
+                                if r not in tagged:
+                                    tagged.append(r)
+            for r in tagged:
+                self.add_event('createTags', r, params.get('resourcetype'))
+        return {'jobid': self.jobs.submit('createTags', action=action)}
+
+
+    def cmd_deleteTags(self, params):
+        resource_ids = params.get('resourceids', '').split(',')
+        tags = self.parse_map(params, 'tags')
+
+        def matches(tag):
+            if tag.get('resourceid') not in resource_ids:
+                return False
+            return not tags or any(tag['key'] == t['key'] and t.get('value') in [None, tag['value']] for t in tags)
+
+        def action():
+            with self.dataset.lock:
+                self.dataset.records['tag'] = [t for t in self.dataset.records.get('tag', []) if not matches(t)]
+            untagged = []
+            for records in self.dataset.records.values():
+                for r in records:
+                    if r['id'] in resource_ids and 'tags' in r:
+                        r['tags'] = [t for t in r['tags'] if not matches(dict(t, resourceid=r['id']))]
+                        untagged.append(r)
+            for r in untagged:
+                self.add_event('deleteTags', r, params.get('resourcetype'))
+        return {'jobid': self.jobs.submit('deleteTags', action=action)}
+
+
+    def cmd_queryAsyncJobResult(self, params):
+        job = self.jobs.get(params.get('jobid'))
+        if not job:
+            raise SimulatorError(530, "Unable to find job by id %s" % params.get('jobid'))
+        return job
+
+
+    def cmd_listAsyncJobs(self, params):
+        jobs = self.jobs.list()
+        if params.get('startdate'):
+            # startdate is given as yyyy-MM-ddTHH:mm:ss+0000
+            jobs = [job for job in jobs if job['created'][:19] >= params['startdate'][:19].replace(' ', 'T')]
+        return self.paginate('asyncjobs', jobs, params)
+
+
+    def cmd_listHypervisors(self, params):
+        return {'count': len(HYPERVISORS), 'hypervisor': [{'name': h} for h in HYPERVISORS]}
+
+
+    def cmd_listCapabilities(self, params):
+        return {'capability': {
+            'cloudstackversion':        '4.5.2',
+            'securitygroupsenabled':    True,
+            'userpublictemplateenabled': True,
+            'projectinviterequired':    False,
+            'allowusercreateprojects':  True,
+        }}
+
+
+    def cmd_enableStaticNat(self, params):
+        return {'success': 'true'}
+
+
+    def cmd_disableStaticNat(self, params):
+        return {'jobid': self.jobs.submit('disableStaticNat')}
+
+
+    def cmd_assignToLoadBalancerRule(self, params):
+        return {'jobid': self.jobs.submit('assignToLoadBalancerRule')}
+
+
+    def cmd_removeFromLoadBalancerRule(self, params):
+        return {'jobid': self.jobs.submit('removeFromLoadBalancerRule')}
+
+
+    def parse_map(self, params, name):
+        # tags[0].key=foo&tags[0].value=bar
+        items = {}
+        for param, value in params.items():
+            if param.startswith(name + '['):
+                index, field = param[len(name) + 1:].split('].', 1)
+                items.setdefault(int(index), {})[field] = value
+        return [items[i] for i in sorted(items)]
+
+
+class SimulatorError(Exception):
+
+    def __init__(self, code, msg):
+        super(SimulatorError, self).__init__(msg)
+        self.code = code
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond(parse_qs(urlparse(self.path).query))
+
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        self.respond(parse_qs(body))
+
+
+    def respond(self, query):
+        params = dict((k, v[-1]) for k, v in query.items())
+        status, response = self.server.simulator.handle(params.get('command', ''), params)
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class SimulatorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, simulator, verbose=False):
+        HTTPServer.__init__(self, address, SimulatorRequestHandler)
+        self.simulator = simulator
+        self.verbose = verbose
+
+
+def parse_command_latency(values):
+    command_latency = {}
+    for value in values or []:
+        command, latency = value.split('=', 1)
+        command_latency[command] = float(latency)
+    return command_latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--vms', type=int, default=100)
+    parser.add_argument('--routers', type=int, default=10)
+    parser.add_argument('--projects', type=int, default=2)
+    parser.add_argument('--zones', type=int, default=1)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--networks', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0, help='latency of every request in ms')
+    parser.add_argument('--command-latency', action='append', metavar='CMD=MS', help='latency of a command in ms')
+    parser.add_argument('--job-delay', type=float, default=1.0, help='seconds until async jobs are done')
+    parser.add_argument('--default-page-size', type=int, default=DEFAULT_PAGE_SIZE, help='records returned without page, 0 for all')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    options = parser.parse_args()
+
+    dataset = Dataset(
+        vms=options.vms,
+        routers=options.routers,
+        projects=options.projects,
+        zones=options.zones,
+        groups=options.groups,
+        networks=options.networks,
+        seed=options.seed,
+    )
+    simulator = CloudStackSimulator(
+        dataset,
+        AsyncJobs(delay=options.job_delay),
+        latency=options.latency,
+        command_latency=parse_command_latency(options.command_latency),
+        default_page_size=options.default_page_size,
+    )
+    server = SimulatorServer((options.host, options.port), simulator, verbose=options.verbose)
+    print("CloudStack API simulator listening on http://%s:%s/client/api" % server.server_address, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test cases running the modules, e.g. against the local API simulator.
+
+The modules are loaded from their source without the module snippets of
+Ansible, AnsibleModule is replaced by FakeModule. Tests against the simulator
+require the cs library, they are skipped without it:
+
+  cd tests && python -m unittest discover -p 'test_*.py'
+"""
+
+import os
+import threading
+import unittest
+
+try:
+    import cs
+    has_lib_cs = True
+except ImportError:
+    has_lib_cs = False
+
+from cloudstack_simulator import AsyncJobs, CloudStackSimulator, Dataset, SimulatorServer
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ModuleFailed(Exception):
+    pass
+
+
+class ModuleExited(Exception):
+    pass
+
+
+class FakeModule(object):
+    """Stand-in for AnsibleModule taking the defaults of argument_spec."""
+
+    params_override = {}
+
+    def __init__(self, argument_spec, check_mode=False, **kwargs):
+        self.params = dict((name, spec.get('default')) for name, spec in argument_spec.items())
+        self.params.update(self.params_override)
+        self.check_mode = self.params.pop('_check_mode', check_mode)
+
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleFailed(kwargs)
+
+
+    def exit_json(self, **kwargs):
+        raise ModuleExited(kwargs)
+
+
+def load_module(name):
+    """Return the namespace of a module, its main() not called."""
+    path = os.path.join(BASE_DIR, name)
+    with open(path) as f:
+        source = f.read()
+    for snippet in ['from ansible.module_utils.basic import *', 'from ansible.module_utils.facts import *']:
+        source = source.replace(snippet, '')
+    namespace = {
+        '__name__':     os.path.splitext(name)[0],
+        'BOOLEANS':     ['yes', 'no', 'true', 'false', True, False],
+        'AnsibleModule': FakeModule,
+    }
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace
+
+
+class ModuleTestCase(unittest.TestCase):
+
+    def run_module(self, namespace, **params):
+        """Return the result of main() of a module called with params."""
+        FakeModule.params_override = params
+        try:
+            namespace['main']()
+        except (ModuleExited, ModuleFailed) as e:
+            return e.args[0]
+        finally:
+            FakeModule.params_override = {}
+        self.fail("Module did not exit")
+
+
+@unittest.skipUnless(has_lib_cs, "python library cs required")
+class SimulatorTestCase(ModuleTestCase):
+    """Runs the API simulator for each test, the modules find it by the
+    CLOUDSTACK_* environment variables."""
+
+    vms = 20
+    job_delay = 0.2
+    default_page_size = 500
+
+    def setUp(self):
+        self.dataset = Dataset(vms=self.vms, routers=1, projects=0, seed=1)
+        self.simulator = CloudStackSimulator(self.dataset, AsyncJobs(delay=self.job_delay), default_page_size=self.default_page_size)
+        self.server = SimulatorServer(('127.0.0.1', 0), self.simulator)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.environ = os.environ.copy()
+        os.environ.update(
+            CLOUDSTACK_ENDPOINT='http://127.0.0.1:%d/client/api' % self.server.server_address[1],
+            CLOUDSTACK_KEY='test',
+            CLOUDSTACK_SECRET='test',
+        )
+        for name in ['CLOUDSTACK_CONFIG', 'CLOUDSTACK_REGION', 'CLOUDSTACK_METHOD', 'CLOUDSTACK_TIMEOUT']:
+            os.environ.pop(name, None)
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+
+    def get_client(self, module_namespace, **params):
+        """Return an AnsibleCloudStack of a module connected to the simulator."""
+        argument_spec = module_namespace['cs_argument_spec']()
+        FakeModule.params_override = params
+        try:
+            module = FakeModule(argument_spec)
+        finally:
+            FakeModule.params_override = {}
+        return module_namespace['AnsibleCloudStack'](module)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+######################################################################
+
+"""
+Inventory script benchmark.
+===========================
+
+Runs cloudstack.py and cloudstack-routers.py against synthetic fleets served
+by the local API simulator, by default of 1000, 10000 and 100000 VMs and
+routers, with NICs, tags and instance groups as generated by the simulator.
+For each fleet size, script and command (--list and --host) the wall time,
+the peak memory (max RSS) of the script, the output size and the number of
+API requests are measured and written as JSON:
+
+  tests/inventory_benchmark.py --sizes 1000,10000 --output results.json
+
+Results of an earlier run can be passed by --baseline, runs slower or using
+more memory than the tolerance allows are reported and make the benchmark
+exit with 1:
+
+  tests/inventory_benchmark.py --baseline results.json --tolerance 0.2
+
+The scripts run in a temporary directory with a cloudstack.ini disabling the
+cache, started by a small launcher process so that their max RSS does not
+include the fleet held by the simulator. The API latency can be simulated by
+--latency. Options after -- are
+passed on to the scripts, e.g. -- --output stream.
+
+usage: inventory_benchmark.py [--sizes SIZES] [--scripts SCRIPTS]
+                              [--repeat N] [--latency MS] [--page-size N]
+                              [--page-workers N] [--output FILE]
+                              [--baseline FILE] [--tolerance RATIO]
+                              [--seed SEED] [-- SCRIPT_ARGS...]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from cloudstack_simulator import AsyncJobs, CloudStackSimulator, Dataset, SimulatorServer
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Record kinds of the fleet each script lists
+SCRIPTS = {
+    'cloudstack.py':            'virtualmachine',
+    'cloudstack-routers.py':    'router',
+}
+
+
+class Launcher(object):
+    """Small process running the scripts, started before the fleets are
+    generated. The max RSS of a child includes the memory it shares with its
+    parent until the exec, which would count the simulator dataset."""
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--launcher'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+    def run_script(self, script, args, env, cwd):
+        """Return wall time in seconds, max RSS in KB and output of a script run."""
+        output_file = os.path.join(cwd, 'output')
+        request = {
+            'args':         [sys.executable, os.path.join(BASE_DIR, script)] + args,
+            'env':          env,
+            'cwd':          cwd,
+            'output_file':  output_file,
+        }
+        self.process.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+        self.process.stdin.flush()
+        result = json.loads(self.process.stdout.readline().decode('utf-8'))
+        if result['status'] != 0:
+            raise RuntimeError("%s %s failed with status %s" % (script, ' '.join(args), result['status']))
+        with open(output_file, 'rb') as f:
+            output = f.read()
+        return result['seconds'], result['max_rss_kb'], output
+
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def serve_launcher():
+    """Run the scripts requested on stdin, a JSON line each, and answer the
+    wall time, max RSS and exit status of each on stdout."""
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        with open(request['output_file'], 'wb') as output, open(os.devnull) as devnull:
+            started = time.time()
+            process = subprocess.Popen(request['args'], stdin=devnull, stdout=output,
+                                       env=request['env'], cwd=request['cwd'])
+            # wait4 returns the resource usage of this child only
+            pid, status, rusage = os.wait4(process.pid, 0)
+            elapsed = time.time() - started
+        max_rss = rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            # In bytes on OS X
+            max_rss //= 1024
+        sys.stdout.write(json.dumps({'seconds': elapsed, 'max_rss_kb': max_rss, 'status': status}) + '\n')
+        sys.stdout.flush()
+
+
+def benchmark(launcher, simulator, script, command, args, env, cwd, repeat):
+    """Return the result of the best of repeat runs."""
+    best = None
+    for i in range(repeat):
+        requests = simulator.requests
+        elapsed, max_rss, output = launcher.run_script(script, command + args, env, cwd)
+        result = {
+            'seconds':      round(elapsed, 3),
+            'max_rss_kb':   max_rss,
+            'output_bytes': len(output),
+            'api_requests': simulator.requests - requests,
+        }
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of the results worse than in baseline."""
+    previous = dict((result_key(r), r) for r in baseline.get('results', []))
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if not before:
+            continue
+        for metric in ['seconds', 'max_rss_kb', 'output_bytes']:
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append("%s %s %s: %s %s, was %s" % (
+                    result['script'], result['size'], result['command'], metric, result[metric], before[metric]))
+    return regressions
+
+
+def result_key(result):
+    return (result['script'], result['size'], result['command'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated fleet sizes')
+    parser.add_argument('--scripts', default=','.join(sorted(SCRIPTS)), help='comma separated scripts')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest counts')
+    parser.add_argument('--latency', type=float, default=0, help='latency of every API request in ms')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--page-workers', type=int, default=1)
+    parser.add_argument('--output', default='inventory_benchmark.json', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed ratio of regressions')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--launcher', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('script_args', nargs='*', help='options passed on to the scripts')
+    options = parser.parse_args()
+
+    if options.launcher:
+        serve_launcher()
+        return
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    scripts = [script.strip() for script in options.scripts.split(',')]
+    work_dir = tempfile.mkdtemp(prefix='inventory-benchmark-')
+    with open(os.path.join(work_dir, 'cloudstack.ini'), 'w') as f:
+        f.write("[inventory]\ncache_max_age = 0\ncache_path = %s\npage_size = %d\npage_workers = %d\n" % (
+            work_dir, options.page_size, options.page_workers))
+
+    results = []
+    launcher = Launcher()
+    try:
+        for size in sizes:
+            started = time.time()
+            dataset = Dataset(vms=size, routers=size, projects=0, groups=max(20, size // 50), seed=options.seed)
+            print("Generated fleet of %d in %.1fs" % (size, time.time() - started), file=sys.stderr)
+
+            simulator = CloudStackSimulator(dataset, AsyncJobs(), latency=options.latency)
+            server = SimulatorServer(('127.0.0.1', 0), simulator)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+            env = dict(os.environ,
+                       CLOUDSTACK_ENDPOINT='http://127.0.0.1:%d/client/api' % server.server_address[1],
+                       CLOUDSTACK_KEY='benchmark',
+                       CLOUDSTACK_SECRET='benchmark')
+            env.pop('CLOUDSTACK_CONFIG', None)
+            env.pop('CLOUDSTACK_REGION', None)
+
+            for script in scripts:
+                records = dataset.records.get(SCRIPTS[script], [])
+                name = records[len(records) // 2]['displayname' if SCRIPTS[script] == 'virtualmachine' else 'name']
+                for command in [['--list'], ['--host', name]]:
+                    result = benchmark(launcher, simulator, script, command, options.script_args, env, work_dir, options.repeat)
+                    result.update({
+                        'script':   script,
+                        'size':     size,
+                        'command':  command[0].lstrip('-'),
+                    })
+                    results.append(result)
+                    print("%-22s %7d %-5s %8.3fs %9d KB %11d bytes %5d requests" % (
+                        script, size, result['command'], result['seconds'], result['max_rss_kb'],
+                        result['output_bytes'], result['api_requests']), file=sys.stderr)
+
+            server.shutdown()
+            server.server_close()
+    finally:
+        launcher.close()
+        shutil.rmtree(work_dir)
+
+    report = {
+        'created':      time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python':       platform.python_version(),
+        'platform':     platform.platform(),
+        'options': {
+            'latency':      options.latency,
+            'page_size':    options.page_size,
+            'page_workers': options.page_workers,
+            'repeat':       options.repeat,
+            'script_args':  options.script_args,
+        },
+        'results':      results,
+    }
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
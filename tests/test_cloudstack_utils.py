@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudstack_testcase import ModuleFailed, SimulatorTestCase, load_module
+
+
+class TestIterList(SimulatorTestCase):
+
+    vms = 20
+
+    def setUp(self):
+        super(TestIterList, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+
+
+    def test_pages(self):
+        acs = self.get_client(self.cs_instance, api_page_size=7)
+        requests = self.simulator.requests
+        vms = list(acs.iter_list('listVirtualMachines', 'virtualmachine'))
+        self.assertEqual(len(vms), 20)
+        self.assertEqual(len(set(vm['id'] for vm in vms)), 20)
+        self.assertEqual(self.simulator.requests - requests, 3)
+
+
+    def test_page_size_limit_of_api(self):
+        self.simulator.default_page_size = 6
+        acs = self.get_client(self.cs_instance)
+        vms = list(acs.iter_list('listVirtualMachines', 'virtualmachine'))
+        self.assertEqual(len(vms), 20)
+
+
+class TestMemo(SimulatorTestCase):
+
+    vms = 2
+
+    def setUp(self):
+        super(TestMemo, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+
+
+    def test_list_memoized_until_write(self):
+        acs = self.get_client(self.cs_instance)
+        vm = acs.cs.listVirtualMachines()['virtualmachine'][0]
+        requests = self.simulator.requests
+        self.assertEqual(acs.cs.listVirtualMachines()['virtualmachine'][0], vm)
+        self.assertEqual(self.simulator.requests - requests, 0)
+
+        res = acs.cs.createTags(resourceids=vm['id'], resourcetype='UserVm', tags=[{'key': 'env', 'value': 'memo'}])
+        acs.cs.queryAsyncJobResult(jobid=res['jobid'])
+        requests = self.simulator.requests
+        acs.cs.listVirtualMachines()
+        self.assertEqual(self.simulator.requests - requests, 1)
+
+
+    def test_job_queries_keep_memo(self):
+        acs = self.get_client(self.cs_instance)
+        res = acs.cs.createTags(resourceids='none', resourcetype='UserVm', tags=[{'key': 'env', 'value': 'memo'}])
+        acs.cs.listZones()
+        requests = self.simulator.requests
+        acs.cs.queryAsyncJobResult(jobid=res['jobid'])
+        acs.cs.listAsyncJobs()
+        acs.cs.listZones()
+        self.assertEqual(self.simulator.requests - requests, 2)
+
+
+class TestPrefetch(SimulatorTestCase):
+
+    def setUp(self):
+        super(TestPrefetch, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+
+
+    def test_failure_raised_by_lookup(self):
+        acs = self.get_client(self.cs_instance, zone='missing')
+        failures = []
+        fail_json = acs.module.module.fail_json
+
+        def recording_fail_json(**kwargs):
+            failures.append(kwargs['msg'])
+            fail_json(**kwargs)
+        acs.module.module.fail_json = recording_fail_json
+
+        acs.prefetch(acs.get_zone, acs.get_project)
+        self.assertEqual(failures, [])
+        self.assertRaises(ModuleFailed, acs.get_zone)
+        self.assertEqual(failures, ["zone 'missing' not found"])
+
+
+class TestPollJobs(SimulatorTestCase):
+
+    job_delay = 0.05
+
+    def setUp(self):
+        super(TestPollJobs, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+
+
+    def test_recent_jobs_listed(self):
+        # Jobs of the account submitted a day ago
+        for i in range(20):
+            jobid = self.simulator.jobs.submit('stopVirtualMachine')
+            self.simulator.jobs.jobs[jobid]['created'] = '2000-01-01T00:00:00+0000'
+
+        listed = []
+        list_async_jobs = self.simulator.cmd_listAsyncJobs
+
+        def recording_list_async_jobs(params):
+            res = list_async_jobs(params)
+            listed.append((params, res.get('count', 0)))
+            return res
+        self.simulator.cmd_listAsyncJobs = recording_list_async_jobs
+
+        acs = self.get_client(self.cs_instance, api_page_size=7)
+        vms = self.dataset.records['virtualmachine'][:3]
+        jobs = [acs.cs.stopVirtualMachine(id=vm['id']) for vm in vms]
+        results = acs.poll_jobs(jobs, 'virtualmachine')
+        self.assertEqual([vm['id'] for vm in results], [vm['id'] for vm in vms])
+        self.assertTrue(listed)
+        for params, count in listed:
+            self.assertEqual(params['pagesize'], '7')
+            self.assertTrue(params['startdate'] > '2000-01-01')
+            self.assertTrue(count <= 3)
+
+
+    def test_duration_hint_of_job(self):
+        acs = self.get_client(self.cs_instance)
+        vm = self.dataset.first('virtualmachine')
+        job = acs.cs.queryAsyncJobResult(jobid=acs.cs.stopVirtualMachine(id=vm['id'])['jobid'])
+        self.assertEqual(job['cmd'], 'org.apache.cloudstack.api.command.user.vm.StopVMCmd')
+        # Half of the expected 10s, not the doubled interval
+        self.assertEqual(acs._get_poll_interval(0.1, 0, [job['cmd']]), 5)
+
+
+class TestCache(SimulatorTestCase):
+
+    def setUp(self):
+        super(TestCache, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+        self.cache_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super(TestCache, self).tearDown()
+
+
+    def test_cache_dir_created_concurrently(self):
+        acs = self.get_client(self.cs_instance, api_cache=True, api_cache_dir=os.path.join(self.cache_dir, 'cache'))
+        isdir = os.path.isdir
+
+        def created_meanwhile(path):
+            # Another task creates the directory after the check
+            result = isdir(path)
+            os.mkdir(path)
+            return result
+
+        os.path.isdir = created_meanwhile
+        try:
+            path = acs._get_cache_path('listZones', {})
+        finally:
+            os.path.isdir = isdir
+        self.assertEqual(os.path.dirname(path), os.path.join(self.cache_dir, 'cache'))
+        self.assertTrue(list(acs.iter_list_cached('listZones', 'zone')))
+
+
+class TestStats(SimulatorTestCase):
+
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+        self.trace_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.trace_dir)
+        super(TestStats, self).tearDown()
+
+
+    def test_requests_counted(self):
+        trace_file = os.path.join(self.trace_dir, 'trace.json')
+        acs = self.get_client(self.cs_instance, api_trace_file=trace_file, api_page_size=7)
+        self.assertEqual(len(list(acs.iter_list('listVirtualMachines', 'virtualmachine'))), 20)
+
+        summary = acs.stats.get_summary()
+        self.assertEqual(summary['calls'], 3)
+        self.assertTrue(summary['bytes'] > 0)
+        self.assertEqual(summary['retries'], 0)
+        with open(trace_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['requests'] for record in records], [1, 1, 1])
+        self.assertTrue(all(record['bytes'] > 0 for record in records))
+
+
+class TestSession(SimulatorTestCase):
+
+    def setUp(self):
+        super(TestSession, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+
+
+    def test_client_uses_own_session(self):
+        sent = {}
+
+        def counting_session(name):
+            session = self.cs_instance['cs_session']()
+            send = session.send
+
+            def counting_send(*args, **kwargs):
+                sent[name] = sent.get(name, 0) + 1
+                return send(*args, **kwargs)
+            session.send = counting_send
+            return session
+
+        config = self.cs_instance['read_config']()
+        first = self.cs_instance['cs_client'](counting_session('first'), **config)
+        second = self.cs_instance['cs_client'](counting_session('second'), **config)
+        first.listZones()
+        second.listZones()
+        first.listZones()
+        self.assertEqual(sent, {'first': 2, 'second': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+try:
+    import yaml
+    has_lib_yaml = True
+except ImportError:
+    has_lib_yaml = False
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from cloudstack_testcase import FakeModule, ModuleTestCase, load_module
+
+
+# Closes the connection without a response, like a crashed server
+DROP = object()
+
+
+class MetaDataRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.server.paths.get(self.path)
+        if body is DROP:
+            self.close_connection = True
+            return
+        status = 200
+        if body is None:
+            status, body = 404, b'Not Found'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetaDataServer(ThreadingMixIn, HTTPServer):
+    """Fake metadata API of the virtual router, serving paths of a dict."""
+    daemon_threads = True
+
+    def __init__(self, address, paths):
+        HTTPServer.__init__(self, address, MetaDataRequestHandler)
+        self.paths = paths
+        self.requests = []
+
+
+    def handle_error(self, request, client_address):
+        # Clients close connections of responses over the size limit unread
+        pass
+
+
+def gzipped(data):
+    f = io.BytesIO()
+    gz = gzip.GzipFile(fileobj=f, mode='wb')
+    gz.write(data)
+    gz.close()
+    return f.getvalue()
+
+
+@unittest.skipUnless(has_lib_yaml, "python library yaml required")
+@unittest.skipIf(sys.version_info[0] > 2, "cs_facts handles the data of the metadata API as python 2 strings")
+class MetaDataTestCase(ModuleTestCase):
+
+    def setUp(self):
+        self.cs_facts = load_module('cs_facts.py')
+        self.paths = {
+            '/latest/meta-data/service-offering':  b'Small Instance',
+            '/latest/meta-data/availability-zone': b'Sandbox-simulator',
+            '/latest/meta-data/public-hostname':   b'web-01',
+            '/latest/meta-data/public-ipv4':       b'185.19.28.35',
+            '/latest/meta-data/local-hostname':    b'VM-ab4e80b0',
+            '/latest/meta-data/local-ipv4':        b'10.1.1.10',
+            '/latest/meta-data/instance-id':       b'ab4e80b0-3e7e-4936-bdc5-e334ba5b0139',
+            '/latest/user-data':                   b'bla: foo\n',
+        }
+        self.server = MetaDataServer(('127.0.0.1', 0), self.paths)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        # The remembered IP of the metadata API skips looking up the lease file
+        self.cache_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.cache_dir, 'api-ip'), 'w') as f:
+            f.write('127.0.0.1:%d' % self.server.server_address[1])
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+
+    def gather(self, **params):
+        params.setdefault('cache_dir', self.cache_dir)
+        del self.server.requests[:]
+        return self.run_module(self.cs_facts, **params)
+
+
+class TestMetaDataCache(MetaDataTestCase):
+
+    def test_facts(self):
+        result = self.gather()
+        facts = result['ansible_facts']
+        self.assertEqual(facts['cloudstack_availability_zone'], 'Sandbox-simulator')
+        self.assertEqual(facts['cloudstack_instance_id'], 'ab4e80b0-3e7e-4936-bdc5-e334ba5b0139')
+        self.assertEqual(facts['cloudstack_user_data'], {'bla': 'foo'})
+        self.assertEqual(len(self.server.requests), 8)
+
+
+    def test_cache_hit(self):
+        first = self.gather(cache_ttl=60, user_data_cache_ttl=60)['ansible_facts']
+        self.assertEqual(len(self.server.requests), 8)
+
+        second = self.gather(cache_ttl=60, user_data_cache_ttl=60)['ansible_facts']
+        self.assertEqual(second, first)
+        self.assertEqual(self.server.requests, ['/latest/meta-data/instance-id'])
+
+
+    def test_cache_miss_on_instance_id_change(self):
+        self.gather(cache_ttl=60, user_data_cache_ttl=60)
+        self.paths['/latest/meta-data/instance-id'] = b'c0ffee00-3e7e-4936-bdc5-e334ba5b0139'
+        self.paths['/latest/meta-data/public-hostname'] = b'web-02'
+
+        facts = self.gather(cache_ttl=60, user_data_cache_ttl=60)['ansible_facts']
+        self.assertEqual(facts['cloudstack_instance_id'], 'c0ffee00-3e7e-4936-bdc5-e334ba5b0139')
+        self.assertEqual(facts['cloudstack_public_hostname'], 'web-02')
+        self.assertEqual(len(self.server.requests), 8)
+
+
+    def test_absent_paths_cached(self):
+        del self.paths['/latest/meta-data/public-hostname']
+        del self.paths['/latest/user-data']
+        facts = self.gather(cache_ttl=60, user_data_cache_ttl=60)['ansible_facts']
+        self.assertEqual(facts['cloudstack_public_hostname'], None)
+        self.assertEqual(facts['cloudstack_user_data'], None)
+
+        self.assertEqual(self.gather(cache_ttl=60, user_data_cache_ttl=60)['ansible_facts'], facts)
+        self.assertEqual(self.server.requests, ['/latest/meta-data/instance-id'])
+
+
+    def test_failed_paths_not_cached(self):
+        self.paths['/latest/meta-data/public-hostname'] = DROP
+        facts = self.gather(cache_ttl=60)['ansible_facts']
+        self.assertEqual(facts['cloudstack_public_hostname'], None)
+
+        self.paths['/latest/meta-data/public-hostname'] = b'web-01'
+        facts = self.gather(cache_ttl=60)['ansible_facts']
+        self.assertEqual(facts['cloudstack_public_hostname'], 'web-01')
+        self.assertTrue('/latest/meta-data/public-hostname' in self.server.requests)
+
+
+    def test_filter_cached(self):
+        self.gather(cache_ttl=60)
+        result = self.gather(cache_ttl=60, filter='cloudstack_local_ipv4')
+        self.assertEqual(result['ansible_facts'], {'cloudstack_local_ipv4': '10.1.1.10'})
+        self.assertEqual(self.server.requests, ['/latest/meta-data/instance-id'])
+
+
+class TestUserData(MetaDataTestCase):
+
+    def gather_user_data(self, user_data, **params):
+        self.paths['/latest/user-data'] = user_data
+        result = self.gather(filter='cloudstack_user_data', **params)
+        if result.get('failed'):
+            return result
+        return result['ansible_facts']['cloudstack_user_data']
+
+
+    def test_yaml(self):
+        self.assertEqual(self.gather_user_data(b'ansible:\n  vars:\n    bla: foo\n'), {'ansible': {'vars': {'bla': 'foo'}}})
+
+
+    def test_json(self):
+        self.assertEqual(self.gather_user_data(json.dumps({'bla': [1, 2]}).encode('utf-8')), {'bla': [1, 2]})
+
+
+    def test_gzip(self):
+        self.assertEqual(self.gather_user_data(gzipped(b'bla: foo\n')), {'bla': 'foo'})
+
+
+    def test_multipart(self):
+        message = MIMEMultipart()
+        message.attach(MIMEText('#!/bin/sh\necho bla\n', 'x-shellscript'))
+        message.attach(MIMEText('bla: foo\n', 'cloud-config'))
+        self.assertEqual(self.gather_user_data(message.as_string().encode('utf-8')), {'bla': 'foo'})
+
+
+    def test_unsafe_yaml_not_loaded(self):
+        self.assertEqual(self.gather_user_data(b"!!python/object/apply:os.getcwd []\n"), None)
+
+
+    def test_user_data_key(self):
+        user_data = b'ansible:\n  vars:\n    bla: foo\n'
+        self.assertEqual(self.gather_user_data(user_data, user_data_key='ansible.vars'), {'bla': 'foo'})
+        self.assertEqual(self.gather_user_data(user_data, user_data_key='ansible.missing'), None)
+
+
+    def test_size_limit(self):
+        result = self.gather_user_data(b'bla: ' + b'x' * 200 + b'\n', user_data_max_size=100)
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], "User data is larger than user_data_max_size of 100 bytes.")
+
+
+    def test_size_limit_decompressed(self):
+        user_data = gzipped(b'bla: ' + b'x' * 10000 + b'\n')
+        self.assertTrue(len(user_data) < 1000)
+        result = self.gather_user_data(user_data, user_data_max_size=1000)
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], "User data is larger than user_data_max_size of 1000 bytes.")
+
+
+class TestDefaultInterface(unittest.TestCase):
+
+    def setUp(self):
+        self.cs_facts = load_module('cs_facts.py')
+        self.cs_facts['module'] = FakeModule(dict(interface=dict(), gather_host_facts=dict(default=False)))
+
+
+    def get_default_interface(self, routes):
+        self.cs_facts['open'] = lambda path: io.StringIO(routes)
+        try:
+            return self.cs_facts['CloudStackFacts']()._get_default_interface()
+        finally:
+            del self.cs_facts['open']
+
+
+    def test_default_route(self):
+        routes = (
+            u'Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\n'
+            u'eth1\t0001A8C0\t00000000\t0001\t0\t0\t0\t00FFFFFF\n'
+            u'eth0\t00000000\t0101A8C0\t0003\t0\t0\t0\t00000000\n'
+        )
+        self.assertEqual(self.get_default_interface(routes), 'eth0')
+
+
+    def test_default_route_down(self):
+        routes = (
+            u'Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\n'
+            u'eth0\t00000000\t0101A8C0\t0002\t0\t0\t0\t00000000\n'
+        )
+        self.assertEqual(self.get_default_interface(routes), None)
+
+
+    def test_interface_given(self):
+        self.cs_facts['module'].params['interface'] = 'eth2'
+        self.assertEqual(self.cs_facts['CloudStackFacts']()._get_default_interface(), 'eth2')
+
+
+if __name__ == '__main__':
+    unittest.main()
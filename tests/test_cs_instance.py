@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+
+from cloudstack_simulator import SimulatorError
+from cloudstack_testcase import SimulatorTestCase, load_module
+
+
+class TestDeployInstances(SimulatorTestCase):
+
+    vms = 5
+    job_delay = 0.05
+
+    def setUp(self):
+        super(TestDeployInstances, self).setUp()
+        self.cs_instance = load_module('cs_instance.py')
+        self.template = self.dataset.first('template')['name']
+
+
+    def deploy(self, **params):
+        params.setdefault('template', self.template)
+        return self.run_module(self.cs_instance, **params)
+
+
+    def test_deploy(self):
+        result = self.deploy(name='web-%02d', count=3)
+        self.assertTrue(result['changed'])
+        self.assertFalse(result.get('failed'))
+        self.assertEqual([instance['name'] for instance in result['instances']], ['web-01', 'web-02', 'web-03'])
+        self.assertEqual(set(instance['state'] for instance in result['instances']), set(['Running']))
+
+        result = self.deploy(name='web-%02d', count=3)
+        self.assertFalse(result['changed'])
+
+
+    def test_deploy_without_polling(self):
+        result = self.deploy(name='web-01', poll_async=False)
+        self.assertTrue(result['changed'])
+
+        # Finished after the delay of the job, though not polled
+        time.sleep(self.job_delay * 2)
+        status, response = self.simulator.handle('listVirtualMachines', {'name': 'web-01'})
+        vms = response['listvirtualmachinesresponse']['virtualmachine']
+        self.assertEqual([vm['name'] for vm in vms], ['web-01'])
+        status, response = self.simulator.handle('listEvents', {'resourceid': vms[0]['id']})
+        self.assertEqual([event['type'] for event in response['listeventsresponse']['event']], ['VM.CREATE'])
+
+
+    def test_hypervisor_of_template(self):
+        listed = []
+        list_hypervisors = self.simulator.cmd_listHypervisors
+
+        def recording_list_hypervisors(params):
+            listed.append(params)
+            return list_hypervisors(params)
+        self.simulator.cmd_listHypervisors = recording_list_hypervisors
+
+        result = self.deploy(name='web-01')
+        self.assertTrue(result['changed'])
+        self.assertEqual(listed, [])
+
+
+    def test_existing_instances_stopped_and_tagged(self):
+        self.deploy(name='web-%02d', count=2)
+        tags = [{'key': 'role', 'value': 'web'}]
+
+        result = self.deploy(name='web-%02d', count=3, state='stopped', tags=tags)
+        self.assertTrue(result['changed'])
+        self.assertFalse(result.get('failed'))
+        for instance in result['instances']:
+            self.assertTrue(instance['changed'])
+            self.assertEqual(instance['state'], 'Stopped')
+            self.assertEqual(instance['tags'], tags)
+
+        result = self.deploy(name='web-%02d', count=3, state='stopped', tags=tags)
+        self.assertFalse(result['changed'])
+
+
+    def test_existing_instances_updated(self):
+        self.deploy(name='web-%02d', count=2, state='stopped')
+
+        result = self.deploy(name='web-%02d', count=2, state='stopped', group='web', display_name='Web %d')
+        self.assertTrue(result['changed'])
+        self.assertFalse(result.get('failed'))
+        for number, instance in enumerate(result['instances'], 1):
+            self.assertTrue(instance['changed'])
+            self.assertEqual(instance['group'], 'web')
+            self.assertEqual(instance['display_name'], 'Web %d' % number)
+
+        result = self.deploy(name='web-%02d', count=2, state='stopped', group='web', display_name='Web %d')
+        self.assertFalse(result['changed'])
+
+
+    def test_tag_failure_reported_with_instances(self):
+        self.deploy(name='web-%02d', count=1, tags=[{'key': 'role', 'value': 'web'}])
+
+        def failing_create_tags(params):
+            raise SimulatorError(530, "Tags limit exceeded")
+        self.simulator.cmd_createTags = failing_create_tags
+
+        result = self.deploy(name='web-%02d', count=3, tags=[{'key': 'role', 'value': 'web'}])
+        self.assertTrue(result['changed'])
+        self.assertEqual([instance['name'] for instance in result['instances']], ['web-01', 'web-02', 'web-03'])
+        self.assertFalse(result['instances'][0].get('failed'))
+        for instance in result['instances'][1:]:
+            self.assertTrue(instance['failed'])
+            self.assertTrue(instance['id'])
+            self.assertTrue('Tags limit exceeded' in instance['msg'], instance['msg'])
+
+
+    def test_existing_instances_started(self):
+        self.deploy(name='web-%02d', count=2, state='stopped')
+
+        result = self.deploy(name='web-%02d', count=2, state='started')
+        self.assertTrue(result['changed'])
+        self.assertEqual([instance['state'] for instance in result['instances']], ['Running', 'Running'])
+
+        result = self.deploy(name='web-%02d', count=2, state='present')
+        self.assertFalse(result['changed'])
+
+
+    def test_count_less_than_one(self):
+        requests = self.simulator.requests
+        result = self.deploy(name='web-%02d', count=0)
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], "count must be at least 1.")
+        self.assertEqual(self.simulator.requests, requests)
+
+
+    def test_deploy_concurrency_less_than_one(self):
+        result = self.deploy(name='web-%02d', count=2, deploy_concurrency=0)
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], "deploy_concurrency must be at least 1.")
+
+
+if __name__ == '__main__':
+    unittest.main()